@@ -0,0 +1,147 @@
+# The adaptive concurrency limit of shared/adaptive_limit.py against an API whose
+# capacity changes: users keep running the orchestrator-workers fan-outs of both
+# frameworks against the local stand-in server, which rejects requests beyond its
+# capacity with a 429, and the capacity drops and recovers while they do. Without
+# the limit every fan-out sends all of its workers at once and leans on the OpenAI
+# client's retries; with it the requests in flight follow the capacity. The limit's
+# trajectory is printed next to the capacity it tracks.
+
+import asyncio
+import bisect
+import contextlib
+import io
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.clients import limiter, singleflight  # noqa: E402
+from shared.fake_server import FakeOpenAIServer  # noqa: E402
+from shared.recipes import load_recipe  # noqa: E402
+
+USERS = 12
+TASKS = 6
+LATENCY = 0.05
+# (seconds from the start, requests the server takes at once)
+CAPACITY = [(0.0, 40), (3.0, 10), (6.0, 24)]
+DURATION = 9.0
+TICK = 0.5
+TASK = "Write a product description for an insulated, plastic-free water bottle."
+RECIPES = ["langchain/orchestrator_workers.py", "langgraph/orchestrator_workers.py"]
+
+
+def responder(messages, schema):
+    if schema == "TaskList":
+        return {
+            "analysis": "One description per angle.",
+            "tasks": [
+                {"reasoning": "", "type": "Formal", "description": f"Angle {i}."}
+                for i in range(TASKS)
+            ],
+        }
+    return "A short product description."
+
+
+def capacity_at(seconds: float) -> int:
+    return CAPACITY[bisect.bisect_right([at for at, _ in CAPACITY], seconds) - 1][1]
+
+
+async def run_recipe(path: str, recipe):
+    if path == "langchain/orchestrator_workers.py":
+        await recipe.orchestrator_workers(TASK)
+    else:
+        await recipe.agent.ainvoke({"input": TASK})
+
+
+async def run_load(server: FakeOpenAIServer, recipes: dict) -> tuple[list, int]:
+    """Latencies of the runs that succeeded, and the number that failed."""
+    start = time.perf_counter()
+    latencies: list[float] = []
+    failures = 0
+
+    async def change_capacity():
+        for at, capacity in CAPACITY:
+            await asyncio.sleep(max(0.0, start + at - time.perf_counter()))
+            server.capacity = capacity
+
+    async def user(i: int):
+        nonlocal failures
+        path = RECIPES[i % len(RECIPES)]
+        while time.perf_counter() - start < DURATION:
+            began = time.perf_counter()
+            try:
+                await run_recipe(path, recipes[path])
+            except Exception:
+                failures += 1
+            else:
+                latencies.append(time.perf_counter() - began)
+
+    await asyncio.gather(change_capacity(), *[user(i) for i in range(USERS)])
+    return latencies, failures
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def main():
+    os.environ["RECIPES_RESPONSE_CACHE"] = "off"
+    os.environ["RECIPES_METRICS"] = "off"
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    # The users send identical requests, which would otherwise share one API call
+    singleflight.enabled = False
+    with FakeOpenAIServer(responder, latency=LATENCY).running() as server:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        recipes = {path: load_recipe(path) for path in RECIPES}
+        # Its own fixed limit would hide the adaptive one
+        recipes["langgraph/orchestrator_workers.py"].worker_guard.max_in_flight = 1000
+
+        print(
+            f"{USERS} users for {DURATION:.0f}s, {TASKS} workers per run, "
+            f"{LATENCY * 1000:.0f}ms per request, capacity "
+            + ", ".join(f"{c} from {at:.0f}s" for at, c in CAPACITY)
+        )
+        print(
+            f"{'limit':<10}{'runs':>6}{'failed':>8}{'requests':>10}{'429s':>7}"
+            f"{'peak':>6}{'p50 ms':>8}{'p95 ms':>8}"
+        )
+        trajectory = []
+        for enabled in (False, True):
+            limiter.enabled = enabled
+            limiter.reset()
+            server.capacity = CAPACITY[0][1]
+            requests, rejected = server.requests, server.rejected
+            server.peak_active = 0
+            with contextlib.redirect_stdout(io.StringIO()):
+                latencies, failures = asyncio.run(run_load(server, recipes))
+            print(
+                f"{'adaptive' if enabled else 'none':<10}{len(latencies):>6}"
+                f"{failures:>8}{server.requests - requests:>10}"
+                f"{server.rejected - rejected:>7}{server.peak_active:>6}"
+                f"{percentile(latencies, 50) * 1000:>8.0f}"
+                f"{percentile(latencies, 95) * 1000:>8.0f}"
+            )
+            if enabled:
+                trajectory = list(limiter.trajectory)
+
+        print(f"\n{'seconds':>8}{'capacity':>10}{'limit':>8}")
+        times = [change.at for change in trajectory]
+        tick = 0.0
+        while tick <= DURATION:
+            change = trajectory[max(0, bisect.bisect_right(times, tick) - 1)]
+            print(f"{tick:>8.1f}{capacity_at(tick):>10}{change.limit:>8.1f}")
+            tick += TICK
+        reasons: dict[str, int] = {}
+        for change in trajectory:
+            reasons[change.reason] = reasons.get(change.reason, 0) + 1
+        print(f"\nlimit changes: {reasons}")
+        print(limiter)
+
+
+if __name__ == "__main__":
+    main()
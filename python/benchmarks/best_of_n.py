@@ -0,0 +1,76 @@
+# Compares time-to-PASS of the sequential evaluator-optimizer loop (`optimize_code`)
+# with best-of-N candidate generation (`optimize_code_best_of_n`), using a scripted
+# fake model: every evaluation passes with a fixed probability, and calls take a
+# random amount of time so that candidates finish out of order.
+
+import asyncio
+import contextlib
+import io
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.fake_models import ScriptedChatModel  # noqa: E402
+from shared.recipes import load_recipe  # noqa: E402
+
+TRIALS = 20
+PASS_PROBABILITY = 0.3
+LATENCY = (0.05, 0.3)
+TASK = "Implement a Stack with push(x), pop() and getMin(), all in O(1)."
+
+
+async def run_trial(recipe, optimize, seed: int) -> dict:
+    rng = random.Random(seed)
+    stats = {"calls": 0, "passed": False}
+
+    def responder(messages, schema):
+        stats["calls"] += 1
+        if schema == "GeneratorResponse":
+            return {"thoughts": "", "code": f"candidate = {stats['calls']}"}
+        passed = rng.random() < PASS_PROBABILITY
+        stats["passed"] = stats["passed"] or passed
+        return {
+            "feedback": "" if passed else "getMin() is O(n), keep a second stack.",
+            "evaluation": "PASS" if passed else "NEEDS_IMPROVEMENT",
+        }
+
+    recipe.model = ScriptedChatModel(
+        responder=responder, latency=lambda: rng.uniform(*LATENCY)
+    )
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        await optimize(TASK)
+    stats["elapsed"] = time.perf_counter() - start
+    return stats
+
+
+async def main():
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    recipe = load_recipe("langchain/evaluator_optimizer.py")
+
+    print(
+        f"{'mode':<16}{'pass rate':>10}{'time-to-PASS s':>16}"
+        f"{'mean wall s':>13}{'LLM calls':>11}"
+    )
+    for name, optimize in [
+        ("sequential", recipe.optimize_code),
+        (f"best-of-{recipe.CANDIDATES}", recipe.optimize_code_best_of_n),
+    ]:
+        trials = [await run_trial(recipe, optimize, seed) for seed in range(TRIALS)]
+        passed = [t["elapsed"] for t in trials if t["passed"]]
+        print(
+            f"{name:<16}"
+            f"{len(passed) / TRIALS:>10.0%}"
+            f"{statistics.mean(passed) if passed else float('nan'):>16.3f}"
+            f"{statistics.mean(t['elapsed'] for t in trials):>13.3f}"
+            f"{statistics.mean(t['calls'] for t in trials):>11.1f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
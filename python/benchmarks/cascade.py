@@ -0,0 +1,180 @@
+# Latency and cost of the model cascades of shared/cascade.py against always calling
+# the large model, in the routing and evaluator-optimizer recipes. The small and the
+# large model are two local stand-in servers, the small one faster and, priced as
+# gpt-4o-mini, much cheaper. The small model routes unambiguous queries right but
+# picks a route at random for ambiguous ones, writes code that does not compile for
+# some tasks, and judges code as the large one does. The cascade has to catch the
+# first two with its checks: route agreement between samples, and compiling the code.
+# A PASS from the small evaluator is always confirmed by the large one.
+
+import asyncio
+import contextlib
+import hashlib
+import io
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.clients import chat_openai, singleflight  # noqa: E402
+from shared.fake_server import FakeOpenAIServer  # noqa: E402
+from shared.recipes import load_recipe  # noqa: E402
+
+SMALL = ("gpt-4o-mini", 0.1)
+LARGE = ("gpt-4o", 0.5)
+ROUTES = {
+    "Write a Python function to parse ISO dates.": "code_generation",
+    "Fix the off-by-one error in my binary search.": "code_generation",
+    "Plan a weekend in Kyoto on a budget.": "trip_planner",
+    "Which Italian towns should I visit by train?": "trip_planner",
+    "Tell a bedtime story about a lighthouse keeper.": "story_teller",
+    "Write a fable about a patient tortoise.": "story_teller",
+    # Ambiguous: the small model is unsure
+    "Write a story that teaches recursion in Python.": "code_generation",
+    "Plan a road trip and write a poem about it.": "trip_planner",
+}
+AMBIGUOUS = set(list(ROUTES)[-2:])
+TASKS = [
+    f"Implement a {name} class in Python."
+    for name in ("Stack", "Queue", "LRUCache", "Trie", "MinHeap", "Graph")
+]
+# Share of tasks for which the small model writes code that does not compile
+BROKEN_RATE = 0.35
+REPEATS = 4
+# Runs at once; more would measure the client's CPU time rather than the models
+CONCURRENCY = 4
+SEED = 3
+
+
+def broken(task: str) -> bool:
+    digest = hashlib.sha256(task.encode()).digest()
+    return digest[0] / 256 < BROKEN_RATE
+
+
+def responder(small: bool, rng: random.Random):
+    def respond(messages, schema):
+        text = "\n".join(str(m.content) for m in messages)
+        if schema == "RouterSchema":
+            query = next(q for q in ROUTES if q in text)
+            route = ROUTES[query]
+            if small and query in AMBIGUOUS:
+                route = rng.choice(sorted(set(ROUTES.values())))
+            return {"reason": "It fits.", "route": route}
+        if schema == "GeneratorResponse":
+            task = next(t for t in TASKS if t in text)
+            revised = "Feedback:" in text
+            if small and broken(task) and not revised:
+                code = "class Broken(:\n    pass"
+            else:
+                code = f"class Solution:\n    revision = {int(revised)}\n"
+            return {"thoughts": "Straightforward.", "code": code}
+        if schema == "EvaluatorResponse":
+            # Both judge alike: the first revision needs work, the second passes
+            passed = "revision = 1" in text
+            return {
+                "feedback": "Looks good." if passed else "Add error handling.",
+                "evaluation": "PASS" if passed else "NEEDS_IMPROVEMENT",
+            }
+        return "An answer."
+
+    return respond
+
+
+async def run_routing(recipe) -> tuple[float, float]:
+    """Seconds per route, and the share of routes that were right."""
+    router = recipe.RouterWorkflow(recipe.ASSISTANTS)
+    queries = list(ROUTES) * REPEATS
+
+    slots = asyncio.Semaphore(CONCURRENCY)
+
+    async def route(query: str) -> tuple[float, bool]:
+        async with slots:
+            start = time.perf_counter()
+            response = await router.route(query)
+        return time.perf_counter() - start, response["route"] == ROUTES[query]
+
+    results = await asyncio.gather(*[route(query) for query in queries])
+    seconds = sum(s for s, _ in results) / len(queries)
+    return seconds, sum(right for _, right in results) / len(queries)
+
+
+async def run_optimizer(recipe) -> tuple[float, float]:
+    """Seconds per optimization, and the share that ended with compiling code."""
+    tasks = TASKS * REPEATS
+
+    slots = asyncio.Semaphore(CONCURRENCY)
+
+    async def optimize(task: str) -> tuple[float, str]:
+        async with slots:
+            start = time.perf_counter()
+            code = await recipe.optimize_code(task, detect_convergence=False)
+        return time.perf_counter() - start, code
+
+    results = await asyncio.gather(*[optimize(task) for task in tasks])
+    seconds = sum(s for s, _ in results) / len(tasks)
+    return seconds, sum("Solution" in code for _, code in results) / len(tasks)
+
+
+def main():
+    os.environ["RECIPES_RESPONSE_CACHE"] = "off"
+    os.environ["RECIPES_METRICS"] = "off"
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    # Repeated queries would otherwise share one API call
+    singleflight.enabled = False
+    rng = random.Random(SEED)
+    small_server = FakeOpenAIServer(responder(True, rng), latency=SMALL[1])
+    large_server = FakeOpenAIServer(responder(False, rng), latency=LARGE[1])
+    with small_server.running(), large_server.running():
+        small = chat_openai(
+            model=SMALL[0], temperature=0, base_url=small_server.base_url
+        )
+        large = chat_openai(
+            model=LARGE[0], temperature=0, base_url=large_server.base_url
+        )
+        os.environ["OPENAI_BASE_URL"] = large_server.base_url
+        routing = load_recipe("langchain/routing.py")
+        optimizer = load_recipe("langchain/evaluator_optimizer.py")
+        routing.model = optimizer.model = large
+        workloads = {
+            "routing": (run_routing, routing, [routing.router_cascade]),
+            "optimizer": (
+                run_optimizer,
+                optimizer,
+                [optimizer.generator_cascade, optimizer.evaluator_cascade],
+            ),
+        }
+
+        print(
+            f"small model {SMALL[0]} at {SMALL[1] * 1000:.0f}ms, large model "
+            f"{LARGE[0]} at {LARGE[1] * 1000:.0f}ms per call"
+        )
+        print(
+            f"{'workload':<11}{'models':<14}{'s per run':>10}{'right':>7}"
+            f"{'cost $':>9}{'escalated':>11}"
+        )
+        reports = []
+        for name, (run, recipe, cascades) in workloads.items():
+            for models in ([], [small]):
+                for cascade in cascades:
+                    cascade.models = models
+                    cascade.stats.reset()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    seconds, right = asyncio.run(run(recipe))
+                cost = sum(c.stats.cost for c in cascades)
+                runs = sum(c.stats.runs for c in cascades)
+                escalated = sum(c.stats.escalated for c in cascades)
+                print(
+                    f"{name:<11}{'cascade' if models else 'large only':<14}"
+                    f"{seconds:>10.2f}{right:>7.0%}{cost:>9.4f}"
+                    f"{f'{escalated}/{runs}' if models else '-':>11}"
+                )
+                if models:
+                    reports += [f"\n{c.name}\n{c.stats.report()}" for c in cascades]
+        print("\n".join(reports))
+
+
+if __name__ == "__main__":
+    main()
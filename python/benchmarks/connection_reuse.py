@@ -0,0 +1,144 @@
+# Connections opened by the recipes' OpenAI clients: three recipes loaded in one
+# process, run concurrently against the local stand-in server of
+# shared/fake_server.py. First, each model gets its own connection pool, as a plain
+# ChatOpenAI does with the langchain-openai version of uv.lock (later versions share
+# a default client between models with the same settings, but without HTTP/2 or
+# prewarming); then the recipes share the pool of shared/clients.py, without and with
+# prewarming it. Connections and reuse are counted by the server. The local
+# server needs no TLS, so the time saved here is less than against the API, where
+# every new connection costs a handshake. The runs are CPU bound, so the modes take
+# turns over REPEATS repeats and the medians of their wall and CPU times are shown.
+
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import httpx
+from langchain_openai import ChatOpenAI
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.clients import connection_stats, prewarm, singleflight  # noqa: E402
+from shared.fake_server import FakeOpenAIServer  # noqa: E402
+from shared.recipes import load_recipe  # noqa: E402
+
+CONCURRENCY = 8
+ROUNDS = 5
+REPEATS = 5
+LATENCY = 0.02
+TASK = "Write a product description for an insulated, plastic-free water bottle."
+RECIPES = [
+    "langchain/orchestrator_workers.py",
+    "langgraph/orchestrator_workers.py",
+    "langchain/routing.py",
+]
+
+
+def responder(messages, schema):
+    if schema == "TaskList":
+        return {
+            "analysis": "Three angles.",
+            "tasks": [
+                {"reasoning": "", "type": kind, "description": f"A {kind} take."}
+                for kind in ("Formal", "Conversational", "Hybrid")
+            ],
+        }
+    if schema == "RouterSchema":
+        return {"reason": "It fits the description.", "route": "code_generation"}
+    return "A short product description."
+
+
+async def run_recipe(path: str, recipe):
+    if path == "langchain/routing.py":
+        await recipe.RouterWorkflow(recipe.ASSISTANTS).run(TASK)
+    elif path == "langchain/orchestrator_workers.py":
+        await recipe.orchestrator_workers(TASK)
+    else:
+        await recipe.agent.ainvoke({"input": TASK})
+
+
+async def run_all(recipes: dict, warm: bool) -> tuple[float, float]:
+    """Wall and CPU seconds of the rounds, after prewarming if `warm`."""
+    if warm:
+        await prewarm(connections=CONCURRENCY * len(recipes))
+    start, cpu = time.perf_counter(), time.process_time()
+    for _ in range(ROUNDS):
+        await asyncio.gather(
+            *[
+                run_recipe(path, recipe)
+                for path, recipe in recipes.items()
+                for _ in range(CONCURRENCY)
+            ]
+        )
+    return time.perf_counter() - start, time.process_time() - cpu
+
+
+def main():
+    os.environ["RECIPES_RESPONSE_CACHE"] = "off"
+    os.environ["RECIPES_METRICS"] = "off"
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    # The runs send identical requests, which would otherwise share one API call;
+    # that saving is measured by benchmarks/singleflight.py
+    singleflight.enabled = False
+    with FakeOpenAIServer(responder, latency=LATENCY).running() as server:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        recipes = {path: load_recipe(path) for path in RECIPES}
+        shared_models = {path: recipe.model for path, recipe in recipes.items()}
+
+        print(
+            f"{len(RECIPES)} recipes, {ROUNDS} rounds of {CONCURRENCY} concurrent "
+            f"runs each, {LATENCY * 1000:.0f}ms per request"
+        )
+        print(
+            f"{'clients':<22}{'seconds':>9}{'cpu s':>7}{'requests':>10}"
+            f"{'connections':>13}{'reused':>8}"
+        )
+        modes = {
+            "pool per model": False,
+            "shared pool": False,
+            "shared pool, prewarm": True,
+        }
+        results: dict[str, list[tuple[float, float, int, int]]] = {
+            name: [] for name in modes
+        }
+        for _ in range(REPEATS):
+            for name, warm in modes.items():
+                for path, recipe in recipes.items():
+                    recipe.model = (
+                        ChatOpenAI(
+                            model="gpt-4o-mini",
+                            temperature=0,
+                            http_async_client=httpx.AsyncClient(),
+                        )
+                        if name == "pool per model"
+                        else shared_models[path]
+                    )
+                connections, requests = server.connections, server.requests
+                with contextlib.redirect_stdout(io.StringIO()):
+                    seconds, cpu = asyncio.run(run_all(recipes, warm))
+                results[name].append(
+                    (
+                        seconds,
+                        cpu,
+                        server.requests - requests,
+                        server.connections - connections,
+                    )
+                )
+        for name, runs in results.items():
+            seconds, cpu, requests, connections = [
+                statistics.median(column) for column in zip(*runs)
+            ]
+            print(
+                f"{name:<22}{seconds:>9.3f}{cpu:>7.2f}{requests:>10.0f}"
+                f"{connections:>13.0f}{requests - connections:>8.0f}"
+            )
+    print(f"\nshared clients: {connection_stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# Replays recorded evaluator-optimizer runs (benchmarks/recordings/evaluator_optimizer.json)
+# through both evaluator-optimizer recipes, with and without convergence detection,
+# and reports how many LLM calls evaluation memoization and early termination save.
+# Each recording lists the code the generator returned on every iteration and the
+# evaluation that code received.
+
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.fake_models import ScriptedChatModel  # noqa: E402
+from shared.recipes import load_recipe  # noqa: E402
+
+RECORDINGS = Path(__file__).parent / "recordings" / "evaluator_optimizer.json"
+# Both recipes are allowed the same number of iterations as the longest recording
+MAX_ITERATIONS = 5
+
+
+def replay_model(run: dict) -> tuple[ScriptedChatModel, dict]:
+    stats = {"calls": 0, "generated": -1}
+
+    def responder(messages, schema):
+        stats["calls"] += 1
+        if schema in ("GeneratorResponse", "GenerateCodeOutput"):
+            generations = run["generations"]
+            stats["generated"] = min(stats["generated"] + 1, len(generations) - 1)
+            return {"thoughts": "", "code": generations[stats["generated"]]}
+        # Both recipes evaluate the code right after generating it
+        recorded = run["evaluations"][stats["generated"]]
+        if schema == "EvaluatorResponse":
+            return {
+                "feedback": recorded["feedback"],
+                "evaluation": recorded["evaluation"],
+            }
+        return {"feedback": recorded["feedback"], "score": recorded["score"]}
+
+    return ScriptedChatModel(responder=responder), stats
+
+
+async def replay(recipe, optimize, task: str, run: dict, detect_convergence: bool):
+    recipe.model, stats = replay_model(run)
+    with contextlib.redirect_stdout(io.StringIO()):
+        code = await optimize(task, detect_convergence=detect_convergence)
+    return stats["calls"], code
+
+
+async def main():
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    recordings = json.loads(RECORDINGS.read_text())
+    recipes = {
+        "langchain": (
+            load_recipe("langchain/evaluator_optimizer.py"),
+            "optimize_code",
+        ),
+        "langgraph": (
+            load_recipe("langgraph/evaluator_optimzer.py"),
+            "create_evaluator_optimizer_workflow",
+        ),
+    }
+
+    print(
+        f"{'recording':<28}{'recipe':<12}{'baseline':>10}{'converge':>10}{'saved':>8}"
+    )
+    totals = {"baseline": 0, "converge": 0}
+    for run in recordings["runs"]:
+        for recipe_name, (recipe, function_name) in recipes.items():
+            recipe.MAX_ITERATIONS = MAX_ITERATIONS
+            optimize = getattr(recipe, function_name)
+            baseline, _ = await replay(recipe, optimize, recordings["task"], run, False)
+            converge, _ = await replay(recipe, optimize, recordings["task"], run, True)
+            totals["baseline"] += baseline
+            totals["converge"] += converge
+            print(
+                f"{run['name']:<28}{recipe_name:<12}{baseline:>10}{converge:>10}"
+                f"{baseline - converge:>8}"
+            )
+
+    saved = totals["baseline"] - totals["converge"]
+    print(
+        f"\nLLM calls: {totals['baseline']} -> {totals['converge']} "
+        f"({saved} saved, {saved / totals['baseline']:.0%})"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,127 @@
+# Reports prompt and completion tokens per iteration of the langgraph evaluator-optimizer
+# for three configurations: every feedback re-sent in full (the original behaviour),
+# a bounded feedback window with older feedback folded into a summary, and the window
+# plus patch mode, where the generator returns a diff against the current code, with
+# only the newest feedback, instead of the whole file.
+# Uses a scripted fake model whose code grows by one method per iteration;
+# token counts are the fake model's approximation (about four characters per token).
+# Patch prompts carry the current code, so patch mode trades prompt tokens for fewer
+# completion tokens; the "sum" row compares the totals, and the LLM calls are the same.
+
+import asyncio
+import contextlib
+import difflib
+import io
+import os
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.fake_models import ScriptedChatModel  # noqa: E402
+from shared.recipes import load_recipe  # noqa: E402
+
+ITERATIONS = 8
+TASK = "Implement an LRU cache class with get, put, delete and statistics helpers."
+FEEDBACK = (
+    "Iteration {i}: the implementation is mostly correct, but method_{i} does not "
+    "validate its arguments, the docstrings do not describe the raised exceptions, "
+    "and the eviction path walks the whole list, which makes put() O(n). Use an "
+    "OrderedDict or a dict plus a doubly linked list so every operation is O(1), add "
+    "type hints to the public methods and cover the empty-cache edge cases."
+)
+
+
+def code_version(i: int) -> str:
+    methods = "".join(f'''
+    def method_{n}(self, key, value=None):
+        """Helper number {n}: look up `key` and optionally update it."""
+        if key not in self.data:
+            raise KeyError(key)
+        if value is not None:
+            self.data[key] = value
+        return self.data[key]
+''' for n in range(i + 1))
+    return f'''class LRUCache:
+    """A least-recently-used cache."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.data = {{}}
+{methods}'''
+
+
+def scripted_model() -> ScriptedChatModel:
+    generated = {"count": 0}
+
+    def responder(messages, schema):
+        if schema == "GenerateCodeOutput":
+            generated["count"] += 1
+            return {
+                "thoughts": "Addressing the feedback.",
+                "code": code_version(generated["count"]),
+            }
+        if schema == "GeneratePatchOutput":
+            generated["count"] += 1
+            before = code_version(generated["count"] - 1).splitlines(keepends=True)
+            after = code_version(generated["count"]).splitlines(keepends=True)
+            patch = "".join(
+                difflib.unified_diff(before, after, "a/code.py", "b/code.py")
+            )
+            return {"thoughts": "Addressing the feedback.", "patch": patch}
+        if schema == "EvaluateCodeOutput":
+            return {"feedback": FEEDBACK.format(i=generated["count"]), "score": 50}
+
+    return ScriptedChatModel(responder=responder)
+
+
+async def main():
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    recipe = load_recipe("langgraph/evaluator_optimzer.py")
+
+    configurations = {
+        "unbounded": {"feedback_window": None, "patch_mode": False},
+        f"window={recipe.FEEDBACK_WINDOW}": {"patch_mode": False},
+        f"window={recipe.FEEDBACK_WINDOW}+patch": {"patch_mode": True},
+    }
+    results = {}
+    for name, options in configurations.items():
+        recipe.model = scripted_model()
+        with contextlib.redirect_stdout(io.StringIO()):
+            state = await recipe.run_evaluator_optimizer(
+                TASK, detect_convergence=False, max_iterations=ITERATIONS, **options
+            )
+        per_iteration = defaultdict(lambda: [0, 0])
+        for record in state["token_usage"]:
+            if record["node"] == "generate":
+                per_iteration[record["iteration"]][0] += record["input_tokens"]
+                per_iteration[record["iteration"]][1] += record["output_tokens"]
+        total = [
+            sum(r["input_tokens"] for r in state["token_usage"]),
+            sum(r["output_tokens"] for r in state["token_usage"]),
+        ]
+        calls = sum(r["calls"] for r in state["token_usage"])
+        results[name] = (per_iteration, total, calls)
+
+    print("Generator tokens per iteration (prompt / completion):")
+    print(f"{'iteration':>9}" + "".join(f"{name:>24}" for name in results))
+    for iteration in range(1, ITERATIONS + 1):
+        row = "".join(
+            f"{per_iteration[iteration][0]:>15} / {per_iteration[iteration][1]:>6}"
+            for per_iteration, _, _ in results.values()
+        )
+        print(f"{iteration:>9}{row}")
+    totals = "".join(
+        f"{total[0]:>15} / {total[1]:>6}" for _, total, _ in results.values()
+    )
+    print(f"{'all nodes':>9}{totals}")
+    print(
+        f"{'sum':>9}" + "".join(f"{sum(total):>24}" for _, total, _ in results.values())
+    )
+    calls = "".join(f"{count:>24}" for _, _, count in results.values())
+    print(f"{'LLM calls':>9}{calls}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,98 @@
+# What shared/diagnostics.py finds, and what it costs: the langchain
+# orchestrator-workers recipe against a fake model whose workers block the event loop
+# with a synchronous sleep, as a sync call on an async path would. The report should
+# name the blocking frame and show the workers' runs serialized behind it. The
+# recipe is then run many times without blocking, with and without diagnostics.
+
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.diagnostics import LoopDiagnostics  # noqa: E402
+from shared.fake_models import ScriptedChatModel  # noqa: E402
+from shared.recipes import load_recipe  # noqa: E402
+
+BLOCK = 0.15
+RUNS = 200
+TRIALS = 3
+TASK = "Write a product description for an insulated, plastic-free water bottle."
+
+
+def task_list() -> dict:
+    return {
+        "analysis": "Three angles.",
+        "tasks": [
+            {"reasoning": "", "type": kind, "description": f"A {kind} take."}
+            for kind in ("Formal", "Conversational", "Hybrid")
+        ],
+    }
+
+
+def blocking_responder(messages, schema):
+    if schema == "TaskList":
+        return task_list()
+    time.sleep(BLOCK)
+    return "A short product description."
+
+
+def responder(messages, schema):
+    return task_list() if schema == "TaskList" else "A short product description."
+
+
+def run(coro, diagnostics: Optional[LoopDiagnostics] = None):
+    def loop_factory() -> asyncio.AbstractEventLoop:
+        loop = asyncio.new_event_loop()
+        if diagnostics is not None:
+            diagnostics.attach(loop)
+        return loop
+
+    with asyncio.Runner(loop_factory=loop_factory) as runner:
+        return runner.run(coro)
+
+
+async def time_runs(recipe, runs: int) -> float:
+    start = time.perf_counter()
+    for _ in range(runs):
+        await recipe.orchestrator_workers(TASK)
+    return time.perf_counter() - start
+
+
+def main():
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    os.environ["RECIPES_RESPONSE_CACHE"] = "off"
+    recipe = load_recipe("langchain/orchestrator_workers.py")
+
+    recipe.model = ScriptedChatModel(responder=blocking_responder)
+    diagnostics = LoopDiagnostics()
+    with contextlib.redirect_stdout(io.StringIO()):
+        seconds = run(time_runs(recipe, 3), diagnostics)
+    print(f"3 runs with workers blocking for {BLOCK * 1000:.0f}ms: {seconds:.2f}s\n")
+    print(diagnostics.report())
+    folded = Path(tempfile.mkdtemp()) / "orchestrator_workers.folded"
+    diagnostics.write_folded(folded)
+    print(f"\n{sum(diagnostics.samples.values())} stack samples written to {folded}")
+
+    recipe.model = ScriptedChatModel(responder=responder)
+    timings: dict[str, list[float]] = {"off": [], "on": []}
+    with contextlib.redirect_stdout(io.StringIO()):
+        run(time_runs(recipe, RUNS))  # warm up
+        for _ in range(TRIALS):
+            timings["off"].append(run(time_runs(recipe, RUNS)))
+            timings["on"].append(run(time_runs(recipe, RUNS), LoopDiagnostics()))
+    best = {name: min(seconds) for name, seconds in timings.items()}
+    print(f"\n{RUNS} runs without blocking, best of {TRIALS}")
+    print(f"{'diagnostics':<13}{'seconds':>9}{'ms per run':>12}")
+    for name, seconds in best.items():
+        print(f"{name:<13}{seconds:>9.3f}{seconds / RUNS * 1000:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
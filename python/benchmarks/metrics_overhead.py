@@ -0,0 +1,81 @@
+# Cost of the node metrics of shared/metrics.py: the langgraph orchestrator-workers
+# graph run many times against a zero-latency fake model, with and without the
+# metrics callback, so that the difference is the time spent recording. A callback
+# that records nothing shows how much of that LangChain spends dispatching events.
+
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+from pathlib import Path
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.fake_models import ScriptedChatModel  # noqa: E402
+from shared.metrics import MetricsCallback  # noqa: E402
+from shared.recipes import load_recipe  # noqa: E402
+
+RUNS = 200
+TRIALS = 5
+TASK = "Write a product description for an insulated, plastic-free water bottle."
+
+
+def responder(messages, schema):
+    if schema == "TaskList":
+        return {
+            "analysis": "Three angles.",
+            "tasks": [
+                {"reasoning": "", "type": kind, "description": f"A {kind} take."}
+                for kind in ("Formal", "Conversational", "Hybrid")
+            ],
+        }
+    return "A short product description."
+
+
+class NoOpCallback(BaseCallbackHandler):
+    run_inline = True
+
+
+async def time_runs(recipe, callbacks: list) -> float:
+    """Seconds for `RUNS` runs of the graph."""
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        await recipe.agent.ainvoke({"input": TASK}, {"callbacks": callbacks})
+    return time.perf_counter() - start
+
+
+async def main():
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    # The callback is passed explicitly below, so that it can be left out
+    os.environ["RECIPES_METRICS"] = "off"
+    os.environ["RECIPES_RESPONSE_CACHE"] = "off"
+    recipe = load_recipe("langgraph/orchestrator_workers.py")
+    recipe.model = ScriptedChatModel(responder=responder)
+    metrics = MetricsCallback()
+
+    callbacks = {"off": [], "no-op": [NoOpCallback()], "on": [metrics]}
+    timings: dict[str, list[float]] = {name: [] for name in callbacks}
+    with contextlib.redirect_stdout(io.StringIO()):
+        await time_runs(recipe, [])  # warm up
+        for _ in range(TRIALS):
+            for name, handlers in callbacks.items():
+                timings[name].append(await time_runs(recipe, handlers))
+
+    # The graph root, analyze and three process nodes
+    nodes = sum(m.runs for m in metrics.nodes.values()) // TRIALS
+    best = {name: min(seconds) for name, seconds in timings.items()}
+    print(f"{RUNS} graph runs, {nodes // RUNS} node runs each, best of {TRIALS}")
+    print(f"{'metrics':<10}{'seconds':>9}{'ms per run':>12}{'µs per node':>13}")
+    for name, seconds in best.items():
+        extra = (seconds - best["off"]) / nodes * 1e6
+        print(f"{name:<10}{seconds:>9.3f}{seconds / RUNS * 1000:>12.3f}{extra:>13.1f}")
+    print()
+    print(metrics.summary())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,88 @@
+# Compares one worker call per task with micro-batched worker calls in the langgraph
+# orchestrator-workers recipe, for a large fan-out of short tasks. Calls and prompt
+# tokens are counted from the fake model's usage metadata. The first batch call returns
+# malformed JSON, to exercise the fallback to one call per task.
+
+import asyncio
+import contextlib
+import io
+import os
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.fake_models import ScriptedChatModel  # noqa: E402
+from shared.recipes import load_recipe  # noqa: E402
+from shared.usage import collect_token_usage  # noqa: E402
+
+TASKS = 24
+LATENCY = 0.3
+TOKENS_PER_SECOND = 200.0
+TASK = "Write taglines for a new eco-friendly water bottle, one per audience."
+AUDIENCES = ["hikers", "commuters", "students", "parents", "cyclists", "office workers"]
+STYLES = ["Formal", "Conversational", "Hybrid"]
+
+TASK_LIST = {
+    "analysis": "Short taglines, each for one audience and tone.",
+    "tasks": [
+        {
+            "reasoning": "",
+            "type": STYLES[i % len(STYLES)],
+            "description": f"A one-line tagline for {AUDIENCES[i % len(AUDIENCES)]}.",
+        }
+        for i in range(TASKS)
+    ],
+}
+TAGLINE = "Cold for 24 hours, plastic-free for life."
+
+
+def fake_model() -> ScriptedChatModel:
+    batch_calls = 0
+
+    def responder(messages, schema):
+        nonlocal batch_calls
+        if schema == "TaskList":
+            return TASK_LIST
+        if schema == "BatchWorkerOutput":
+            batch_calls += 1
+            if batch_calls == 1:
+                return '{"responses": [{"index": 0, "response": "Cold for'
+            indices = re.findall(r"^(\d+)\. Style:", str(messages[-1].content), re.M)
+            return {
+                "responses": [{"index": int(i), "response": TAGLINE} for i in indices]
+            }
+        return TAGLINE
+
+    return ScriptedChatModel(
+        responder=responder, latency=LATENCY, tokens_per_second=TOKENS_PER_SECOND
+    )
+
+
+async def main():
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    recipe = load_recipe("langgraph/orchestrator_workers.py")
+
+    print(f"{'mode':<12}{'LLM calls':>11}{'prompt tokens':>15}{'wall s':>9}")
+    for name, batch_tasks in [("per task", False), ("batched", True)]:
+        recipe.model = fake_model()
+        start = time.perf_counter()
+        with collect_token_usage() as usage:
+            with contextlib.redirect_stdout(io.StringIO()) as output:
+                responses = await recipe.orchestrator_workers(TASK, batch_tasks)
+        assert len(responses) == TASKS
+        print(
+            f"{name:<12}{usage.calls:>11}{usage.input_tokens:>15}"
+            f"{time.perf_counter() - start:>9.3f}"
+        )
+        if batch_tasks:
+            report = [
+                line for line in output.getvalue().splitlines() if "Batched" in line
+            ]
+            print(f"\n{report[-1]}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
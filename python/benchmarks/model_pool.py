@@ -0,0 +1,148 @@
+# The routing recipe with its model spread over three backends by shared/model_pool.py,
+# each a local stand-in server: a fast one that takes few requests at once, a slow
+# one, and a fast one that goes down halfway through. The pool is built from
+# RECIPES_MODEL_POOL, as the recipes build it. Calls follow the backends' latency
+# and limits, and those sent to the backend that went down fail over to the others
+# without failing the run. The same queries are then sent to each backend alone.
+
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.clients import chat_openai, singleflight  # noqa: E402
+from shared.fake_server import FakeOpenAIServer  # noqa: E402
+from shared.recipes import load_recipe  # noqa: E402
+
+QUERIES = 240
+CONCURRENCY = 16
+# (name, latency in seconds, requests it takes at once, calls in flight allowed)
+BACKENDS = [("fast", 0.05, 8, 8), ("slow", 0.2, None, 16), ("failing", 0.05, None, 16)]
+QUERY = "Write a Python function to merge two sorted lists."
+
+
+def responder(messages, schema):
+    if schema == "RouterSchema":
+        return {"reason": "It is about code.", "route": "code_generation"}
+    return "def merge(a, b): return sorted(a + b)"
+
+
+async def run_queries(router, on_half=None) -> tuple[list[float], int]:
+    """Latencies of the queries that were answered, and the number that failed."""
+    queue: asyncio.Queue[int] = asyncio.Queue()
+    for i in range(QUERIES):
+        queue.put_nowait(i)
+    latencies: list[float] = []
+    failures = 0
+
+    async def worker():
+        nonlocal failures
+        while not queue.empty():
+            i = queue.get_nowait()
+            if i == QUERIES // 2 and on_half is not None:
+                await on_half()
+            began = time.perf_counter()
+            try:
+                await router.run(QUERY)
+            except Exception:
+                failures += 1
+            else:
+                latencies.append(time.perf_counter() - began)
+
+    await asyncio.gather(*[worker() for _ in range(CONCURRENCY)])
+    return latencies, failures
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def row(name: str, seconds: float, latencies: list[float], failures: int) -> str:
+    return (
+        f"{name:<22}{seconds:>9.2f}{len(latencies):>10}{failures:>8}"
+        f"{percentile(latencies, 50) * 1000:>8.0f}"
+        f"{percentile(latencies, 95) * 1000:>8.0f}"
+    )
+
+
+def main():
+    os.environ["RECIPES_RESPONSE_CACHE"] = "off"
+    os.environ["RECIPES_METRICS"] = "off"
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    # Every query is the same, and would otherwise share one API call
+    singleflight.enabled = False
+    with contextlib.ExitStack() as stack:
+        servers = {}
+        for name, latency, capacity, _ in BACKENDS[:2]:
+            server = FakeOpenAIServer(responder, latency=latency, capacity=capacity)
+            servers[name] = stack.enter_context(server.running())
+        # Closed on its own to take the backend down
+        failing = stack.enter_context(contextlib.ExitStack())
+        servers["failing"] = failing.enter_context(
+            FakeOpenAIServer(responder, latency=BACKENDS[2][1]).running()
+        )
+        os.environ["RECIPES_MODEL_POOL"] = ",".join(
+            f"{servers[name].base_url}*{max_in_flight}"
+            for name, _, _, max_in_flight in BACKENDS
+        )
+        routing = load_recipe("langchain/routing.py")
+        pool = routing.model
+        router = routing.RouterWorkflow(routing.ASSISTANTS)
+        names = {
+            backend.name: name for backend, (name, *_) in zip(pool.backends, BACKENDS)
+        }
+
+        print(
+            f"{QUERIES} routing runs, {CONCURRENCY} at once, 2 model calls each; "
+            "the failing backend goes down after half of them"
+        )
+        print(
+            f"{'model':<22}{'seconds':>9}{'answered':>10}{'failed':>8}"
+            f"{'p50 ms':>8}{'p95 ms':>8}"
+        )
+
+        async def take_down():
+            await asyncio.to_thread(failing.close)
+
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            latencies, failures = asyncio.run(run_queries(router, take_down))
+        print(row("pool", time.perf_counter() - start, latencies, failures))
+
+        for name, _, _, _ in BACKENDS[:2]:
+            # With the client's own retries, as the recipe has without a pool
+            routing.model = chat_openai(
+                model="gpt-4o-mini", temperature=0, base_url=servers[name].base_url
+            )
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                latencies, failures = asyncio.run(run_queries(router))
+            print(
+                row(
+                    f"{name} backend alone",
+                    time.perf_counter() - start,
+                    latencies,
+                    failures,
+                )
+            )
+        routing.model = pool
+
+        print(f"\n{'backend':<10}{'calls':>7}{'failures':>10}{'latency ms':>12}")
+        for backend in pool.backends:
+            print(
+                f"{names[backend.name]:<10}{backend.calls:>7}{backend.failures:>10}"
+                f"{(backend.latency or 0) * 1000:>12.0f}"
+            )
+        print(f"failovers: {pool.balancer.failovers}")
+
+
+if __name__ == "__main__":
+    main()
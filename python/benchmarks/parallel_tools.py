@@ -0,0 +1,126 @@
+# Compares running each turn's tool calls one at a time with `run_agent` from
+# langchain/tool_calling.py, which runs them concurrently (sync tools in threads).
+# The tools are slow local functions and the fake model asks for 4 tool calls, then
+# 2 more, then answers.
+
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.messages.tool import tool_call
+from langchain_core.tools import tool
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.fake_models import ScriptedChatModel  # noqa: E402
+from shared.recipes import load_recipe  # noqa: E402
+
+TRIALS = 5
+MODEL_LATENCY = 0.2
+QUERY = "Plan a weekend in Paris or Rome from London: weather, prices and flights."
+
+
+@tool
+def get_weather(city: str) -> str:
+    """The weekend forecast for a city."""
+    time.sleep(0.4)
+    return f"Sunny in {city}"
+
+
+@tool
+def get_exchange_rate(currency: str) -> float:
+    """The exchange rate from GBP to a currency."""
+    time.sleep(0.3)
+    return 1.17
+
+
+@tool
+async def search_flights(origin: str, destination: str) -> str:
+    """The cheapest flight between two cities."""
+    await asyncio.sleep(0.6)
+    return f"{origin}-{destination}: £89"
+
+
+@tool
+def geocode(place: str) -> str:
+    """The coordinates of a place (very slow)."""
+    time.sleep(1.0)
+    return "48.86, 2.35"
+
+
+TOOLS = [get_weather, get_exchange_rate, search_flights, geocode]
+ROUNDS = [
+    [
+        ("get_weather", {"city": "Paris"}),
+        ("get_weather", {"city": "Rome"}),
+        ("get_exchange_rate", {"currency": "EUR"}),
+        ("search_flights", {"origin": "London", "destination": "Paris"}),
+    ],
+    [
+        ("search_flights", {"origin": "London", "destination": "Rome"}),
+        ("get_weather", {"city": "London"}),
+    ],
+]
+
+
+def responder(messages, schema):
+    turn = sum(isinstance(m, AIMessage) for m in messages)
+    if turn < len(ROUNDS):
+        calls = [
+            {"name": name, "args": args, "id": f"call_{turn}_{i}"}
+            for i, (name, args) in enumerate(ROUNDS[turn])
+        ]
+        return AIMessage(content="", tool_calls=calls)
+    return "Paris: sunny, £89 flights, 1.17 EUR per GBP."
+
+
+async def sequential_agent(recipe, query: str) -> str:
+    """The same loop with the tool calls of a turn run one after another."""
+    messages = [HumanMessage(query)]
+    tools_by_name = {t.name: t for t in recipe.tools}
+    while True:
+        ai_msg = await recipe.llm_with_tools.ainvoke(messages)
+        messages.append(ai_msg)
+        if not ai_msg.tool_calls:
+            return ai_msg.content
+        for call in ai_msg.tool_calls:
+            messages.append(await tools_by_name[call["name"]].ainvoke(call))
+
+
+async def main():
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    recipe = load_recipe("langchain/tool_calling.py")
+    model = ScriptedChatModel(responder=responder, latency=MODEL_LATENCY)
+    recipe.tools = TOOLS
+    recipe.llm_with_tools = model.bind_tools(TOOLS)
+    recipe.llm_without_tool_use = model.bind_tools(TOOLS, tool_choice="none")
+
+    print(f"{'mode':<12}{'mean wall s':>13}")
+    for name, run in [
+        ("sequential", lambda: sequential_agent(recipe, QUERY)),
+        ("parallel", lambda: recipe.run_agent(QUERY)),
+    ]:
+        times = []
+        for _ in range(TRIALS):
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                await run()
+            times.append(time.perf_counter() - start)
+        print(f"{name:<12}{statistics.mean(times):>13.3f}")
+
+    # A tool over its timeout is reported to the model instead of holding up the turn
+    recipe.TOOL_TIMEOUTS["geocode"] = 0.2
+    call = tool_call(name="geocode", args={"place": "Paris"}, id="call_geocode")
+    start = time.perf_counter()
+    message: ToolMessage = await recipe.run_tool_call(call, {"geocode": geocode})
+    print(f"\n{message.content!r} after {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,113 @@
+# Compares `orchestrator_workers`, which waits for the whole task list before starting
+# any worker, with `orchestrator_workers_pipelined`, which streams the task list and
+# starts each worker as soon as its task is complete. The fake model has a fixed time
+# to first token and generates tokens at a steady rate, like a hosted model does.
+#
+# The last task is only complete at the very end of the stream, so the pipelined run
+# saves time on the workers started earlier: here the first (Formal) task has the
+# longest output and finishes last, so all results arrive sooner, while the first result
+# (from the short Hybrid task, started last in both modes) does not.
+
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.fake_models import ScriptedChatModel  # noqa: E402
+from shared.recipes import load_recipe  # noqa: E402
+
+TRIALS = 5
+TIME_TO_FIRST_TOKEN = 0.4
+TOKENS_PER_SECOND = 150.0
+# Length of the worker output for each style
+WORKER_OUTPUT_CHARS = {"Formal": 2000, "Conversational": 1200, "Hybrid": 800}
+
+TASK_LIST = {
+    "analysis": (
+        "The description has to sell a plastic-free, insulated bottle with a lifetime "
+        "warranty to environmentally conscious millennials. Different tones reach "
+        "different readers: some want specifications, others a story they relate to."
+    ),
+    "tasks": [
+        {
+            "reasoning": "Readers comparing products want precise specifications.",
+            "type": "Formal",
+            "description": "Describe materials, insulation performance and warranty terms.",
+        },
+        {
+            "reasoning": "A friendly tone builds a connection with the audience.",
+            "type": "Conversational",
+            "description": "Talk to the reader about their day and where the bottle fits in.",
+        },
+        {
+            "reasoning": "A story carries the technical details without feeling dry.",
+            "type": "Hybrid",
+            "description": "Tell the story of a hike, weaving in the product features.",
+        },
+    ],
+}
+
+
+def responder(messages, schema):
+    if schema == "TaskList":
+        return TASK_LIST
+    prompt = str(messages[-1].content)
+    style = next(style for style in WORKER_OUTPUT_CHARS if f"Style: {style}" in prompt)
+    return ("Stay hydrated, skip the plastic. " * 100)[: WORKER_OUTPUT_CHARS[style]]
+
+
+async def run_trial(recipe, run) -> tuple[float, float]:
+    """Seconds until the first worker result and until all of them."""
+    run_task = recipe.run_task
+    finished: list[float] = []
+
+    async def timed_run_task(task):
+        result = await run_task(task)
+        finished.append(time.perf_counter())
+        return result
+
+    recipe.run_task = timed_run_task
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            await run(
+                "Write a product description for a new eco-friendly water bottle."
+            )
+    finally:
+        recipe.run_task = run_task
+    return finished[0] - start, time.perf_counter() - start
+
+
+async def main():
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    recipe = load_recipe("langchain/orchestrator_workers.py")
+    recipe.model = ScriptedChatModel(
+        responder=responder,
+        latency=TIME_TO_FIRST_TOKEN,
+        tokens_per_second=TOKENS_PER_SECOND,
+    )
+
+    print(
+        f"time to first token {TIME_TO_FIRST_TOKEN}s, {TOKENS_PER_SECOND:.0f} tokens/s\n"
+    )
+    print(f"{'mode':<12}{'first result s':>16}{'all results s':>15}")
+    for name, run in [
+        ("sequential", recipe.orchestrator_workers),
+        ("pipelined", recipe.orchestrator_workers_pipelined),
+    ]:
+        trials = [await run_trial(recipe, run) for _ in range(TRIALS)]
+        print(
+            f"{name:<12}"
+            f"{statistics.mean(first for first, _ in trials):>16.3f}"
+            f"{statistics.mean(total for _, total in trials):>15.3f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,130 @@
+# Prompt tokens and latency per step of a 20-step prompt chain, keeping the whole
+# history, dropping old steps, and summarizing them (both recipes, same fake model).
+# The fake model reads prompts at a fixed rate, so longer prompts are slower, and the
+# benchmark estimates what a provider's prefix cache would serve: the prompt's
+# common prefix with the previous call, counted like OpenAI does (in 128-token
+# increments, from 1024 tokens).
+
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.fake_models import CHARS_PER_TOKEN, ScriptedChatModel  # noqa: E402
+from shared.recipes import load_recipe  # noqa: E402
+
+STEPS = 20
+TOKEN_BUDGET = 3000
+LATENCY = 0.05
+PROMPT_TOKENS_PER_SECOND = 20000.0
+TOKENS_PER_SECOND = 400.0
+TASK = "A shop sells 3 kinds of bottles at $12, $18 and $25. Track its revenue."
+PROMPTS = [
+    f"Step {i + 1}: {i + 3} more bottles of each kind were sold. Update the totals."
+    for i in range(STEPS)
+]
+SUMMARY_MARKER = "Summarize the earlier steps"
+RESPONSE = "Running totals per kind and overall, with the arithmetic shown. " * 18
+
+
+def cached_tokens(previous: str, current: str) -> int:
+    common = len(os.path.commonprefix([previous, current])) // CHARS_PER_TOKEN
+    return common // 128 * 128 if common >= 1024 else 0
+
+
+class CallRecorder(BaseCallbackHandler):
+    """Records the prompt tokens, cached tokens and latency of each model call."""
+
+    def __init__(self):
+        self.calls: list[dict] = []
+        self._pending: dict[Any, dict] = {}
+        self._previous_prompt = ""
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        prompt = "\n".join(f"{m.type}: {m.content}" for m in messages[0])
+        record = {"summary": SUMMARY_MARKER in prompt, "cached": 0}
+        if not record["summary"]:
+            record["cached"] = cached_tokens(self._previous_prompt, prompt)
+            self._previous_prompt = prompt
+        record["start"] = time.perf_counter()
+        self._pending[run_id] = record
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        record = self._pending.pop(run_id)
+        record["seconds"] = time.perf_counter() - record.pop("start")
+        usage = response.generations[0][0].message.usage_metadata
+        record["input_tokens"] = usage["input_tokens"]
+        self.calls.append(record)
+
+    def steps(self) -> list[dict]:
+        """The calls per step, with compaction counted towards the step it delayed."""
+        steps, carry = [], {"input_tokens": 0, "cached": 0, "seconds": 0.0}
+        for call in self.calls:
+            carry = {key: carry[key] + call[key] for key in carry}
+            if not call["summary"]:
+                steps.append(carry)
+                carry = {key: 0 for key in carry}
+        return steps
+
+
+def responder(messages, schema):
+    if SUMMARY_MARKER in str(messages[-1].content):
+        return "Totals so far: " + RESPONSE[:160]
+    return RESPONSE
+
+
+async def run_chain(recipe, token_budget, summarize) -> list[dict]:
+    recorder = CallRecorder()
+    recipe.model = ScriptedChatModel(
+        responder=responder,
+        latency=LATENCY,
+        prompt_tokens_per_second=PROMPT_TOKENS_PER_SECOND,
+        tokens_per_second=TOKENS_PER_SECOND,
+        callbacks=[recorder],
+    )
+    with contextlib.redirect_stdout(io.StringIO()):
+        await recipe.prompt_chaining(TASK, PROMPTS, token_budget, summarize)
+    return recorder.steps()
+
+
+def format_step(step: dict) -> str:
+    return (
+        f"{step['input_tokens']:>9} ({step['cached']:>5})"
+        f"{step['seconds'] * 1000:>6.0f}"
+    )
+
+
+async def main():
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    modes = [
+        ("full", None, True),
+        ("drop", TOKEN_BUDGET, False),
+        ("summarize", TOKEN_BUDGET, True),
+    ]
+    for name in ["langchain", "langgraph"]:
+        recipe = load_recipe(f"{name}/prompt_chaining.py")
+        results = {mode: await run_chain(recipe, *args) for mode, *args in modes}
+
+        print(f"\n{name}: prompt tokens (cached) / latency ms per step")
+        print(f"{'step':>4}" + "".join(f"{mode:>23}" for mode, *_ in modes))
+        for i in range(STEPS):
+            print(
+                f"{i + 1:>4}" + "".join(format_step(results[m][i]) for m, *_ in modes)
+            )
+        totals = [
+            {key: sum(step[key] for step in results[mode]) for key in results[mode][0]}
+            for mode, *_ in modes
+        ]
+        print(f"{'all':>4}" + "".join(format_step(total) for total in totals))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,127 @@
+# Micro-benchmark of the per-call Python overhead of building chains on every call
+# versus reusing them from the shared runnable registry.
+# The model never goes over the network: structured-output chains are only built,
+# and string chains are invoked against a zero-latency fake model.
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+from typing import Annotated, Callable, List, Literal, TypedDict
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import PromptTemplate
+from langchain_openai import ChatOpenAI
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.registry import RunnableRegistry  # noqa: E402
+
+ITERATIONS = 2000
+CONCURRENCY = 100
+
+WORKER_PROMPT = """
+Generate content based on:
+Task: {original_task}
+Style: {task_type}
+Guidelines: {task_description}
+
+Return only your response:
+[Your content here, maintaining the specified style and fully addressing requirements.]
+"""
+
+
+class Task(TypedDict):
+    reasoning: Annotated[str, ..., "The reason for the task"]
+    type: Annotated[
+        Literal["Formal", "Conversational", "Hybrid"], ..., "The type of the task"
+    ]
+    description: Annotated[str, ..., "The description of the task"]
+
+
+class TaskList(TypedDict):
+    analysis: Annotated[str, ..., "The analysis of the task"]
+    tasks: Annotated[List[Task], ..., "The approaches to tackle the task"]
+
+
+def time_per_call(fn: Callable[[], object], iterations: int = ITERATIONS) -> float:
+    """Return the mean wall-clock time of `fn` in microseconds."""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+async def calls_per_second(get_chain: Callable[[], object]) -> float:
+    """Invoke the chain returned by `get_chain` ITERATIONS times, CONCURRENCY at a time."""
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    inputs = {"original_task": "task", "task_type": "Formal", "task_description": "d"}
+
+    async def call():
+        async with semaphore:
+            await get_chain().ainvoke(inputs)  # type: ignore
+
+    start = time.perf_counter()
+    await asyncio.gather(*[call() for _ in range(ITERATIONS)])
+    return ITERATIONS / (time.perf_counter() - start)
+
+
+def main():
+    openai_model = ChatOpenAI(
+        model="gpt-4o-mini", temperature=0, api_key="sk-benchmark"
+    )
+    fake_model = FakeListChatModel(responses=["ok"])
+    parser = StrOutputParser()
+    registry = RunnableRegistry()
+
+    rows = [
+        (
+            "build prompt | model | parser",
+            time_per_call(
+                lambda: PromptTemplate.from_template(WORKER_PROMPT)
+                | openai_model
+                | parser
+            ),
+            time_per_call(
+                lambda: registry.prompt_chain(WORKER_PROMPT, openai_model, parser)
+            ),
+        ),
+        (
+            "build with_structured_output(TaskList)",
+            time_per_call(
+                lambda: openai_model.with_structured_output(
+                    TaskList, method="json_schema", strict=True
+                )
+            ),
+            time_per_call(
+                lambda: registry.structured(
+                    openai_model, TaskList, method="json_schema", strict=True
+                )
+            ),
+        ),
+    ]
+
+    print(
+        f"{'per-call overhead (us)':<42}{'rebuild':>12}{'registry':>12}{'speedup':>10}"
+    )
+    for name, rebuild, cached in rows:
+        print(f"{name:<42}{rebuild:>12.1f}{cached:>12.1f}{rebuild / cached:>9.1f}x")
+
+    rebuild_qps = asyncio.run(
+        calls_per_second(
+            lambda: PromptTemplate.from_template(WORKER_PROMPT) | fake_model | parser
+        )
+    )
+    cached_qps = asyncio.run(
+        calls_per_second(
+            lambda: registry.prompt_chain(WORKER_PROMPT, fake_model, parser)
+        )
+    )
+    print(
+        f"\nainvoke throughput with a zero-latency model ({CONCURRENCY} in flight): "
+        f"rebuild {rebuild_qps:,.0f} calls/s, registry {cached_qps:,.0f} calls/s"
+    )
+
+
+if __name__ == "__main__":
+    main()
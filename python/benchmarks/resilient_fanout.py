@@ -0,0 +1,89 @@
+# Runs the langgraph orchestrator-workers fan-out against a fake model that fails some
+# worker calls with 429s and lets others hang, with and without the retries of the
+# recipe's `worker_guard`. Without them a single failed branch fails the whole run.
+
+import asyncio
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.fake_models import FakeAPIError, ScriptedChatModel  # noqa: E402
+from shared.recipes import load_recipe  # noqa: E402
+
+RUNS = 10
+TASKS = 24
+LATENCY = (0.1, 0.3)
+RATE_LIMIT_RATE = 0.15
+HANG_RATE = 0.05
+HANG_SECONDS = 30.0
+TIMEOUT = 1.0
+TASK = "Write taglines for a new eco-friendly water bottle."
+
+TASK_LIST = {
+    "analysis": "One tagline per tone.",
+    "tasks": [
+        {"reasoning": "", "type": "Formal", "description": f"Tagline {i}."}
+        for i in range(TASKS)
+    ],
+}
+
+
+def fake_model(rng: random.Random) -> ScriptedChatModel:
+    def responder(messages, schema):
+        return TASK_LIST if schema == "TaskList" else "Cold for 24 hours."
+
+    def failure(messages, schema):
+        # Only the worker calls fail; the orchestrator call is not part of the fan-out
+        if schema != "TaskList" and rng.random() < RATE_LIMIT_RATE:
+            return FakeAPIError(429)
+        return None
+
+    def latency():
+        return HANG_SECONDS if rng.random() < HANG_RATE else rng.uniform(*LATENCY)
+
+    return ScriptedChatModel(responder=responder, failure=failure, latency=latency)
+
+
+async def main():
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    recipe = load_recipe("langgraph/orchestrator_workers.py")
+    guard = recipe.worker_guard
+    guard.timeout, guard.base_delay = TIMEOUT, 0.1
+
+    print(
+        f"{TASKS} tasks per run, {RATE_LIMIT_RATE:.0%} of calls rate limited, "
+        f"{HANG_RATE:.0%} hang (timeout {TIMEOUT}s), max {guard.max_in_flight} in flight\n"
+    )
+    print(
+        f"{'max attempts':<14}{'runs ok':>8}{'retries':>9}{'timeouts':>10}"
+        f"{'peak in flight':>16}{'mean wall s':>13}"
+    )
+    for max_attempts in [1, 4]:
+        guard.max_attempts = max_attempts
+        guard.stats = type(guard.stats)()
+        succeeded, elapsed = 0, 0.0
+        for seed in range(RUNS):
+            recipe.model = fake_model(random.Random(seed))
+            start = time.perf_counter()
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    responses = await recipe.orchestrator_workers(TASK)
+                succeeded += len(responses) == TASKS
+            except (FakeAPIError, TimeoutError):
+                pass
+            elapsed += time.perf_counter() - start
+        stats = guard.stats
+        print(
+            f"{max_attempts:<14}{f'{succeeded}/{RUNS}':>8}{stats.retries:>9}"
+            f"{stats.timeouts:>10}{stats.peak_in_flight:>16}{elapsed / RUNS:>13.3f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
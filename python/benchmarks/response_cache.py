@@ -0,0 +1,132 @@
+# The same JSONL datasets run three times through the batch runner with the response
+# cache installed: on an empty cache, again in the same process (served from the
+# in-memory tier), and with a fresh cache on the same database, as a rerun of the
+# script would be (served from SQLite). The fake models report usage like the real
+# ones and are named after them, so the dollars saved use the real prices.
+
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from langchain_core.globals import set_llm_cache
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.batch_runner import TARGETS, run_batch  # noqa: E402
+from shared.fake_models import ScriptedChatModel  # noqa: E402
+from shared.recipes import load_recipe  # noqa: E402
+from shared.response_cache import ResponseCache, format_stats  # noqa: E402
+
+LATENCY = 0.3
+TOKENS_PER_SECOND = 200.0
+CONCURRENCY = 4
+
+QUERIES = [
+    "Write a Python function to check if a number is prime.",
+    "Plan a 2-week trip to Europe.",
+    "Write a story about a brave knight and a dragon.",
+    "Write a JavaScript debounce helper.",
+    "Plan a weekend in Kyoto.",
+    "Tell a bedtime story about a sleepy owl.",
+]
+# Users ask the same questions more than once
+ROUTING = [{"input": query} for query in QUERIES * 3]
+CHAINS = [
+    {
+        "input": f"Quarterly revenue of region {region}: 120, 135, 150, 170.",
+        "prompts": [
+            "Extract the numbers.",
+            "Compute the growth between quarters.",
+            "Summarize the trend in one sentence.",
+        ],
+    }
+    for region in "ABCABC"
+]
+DATASETS = {"langchain.routing": ROUTING, "langchain.prompt_chaining": CHAINS}
+
+
+def responder(messages, schema):
+    if schema == "RouterSchema":
+        query = str(messages[-1].content).lower()
+        route = (
+            "code_generation"
+            if "write a" in query and "story" not in query
+            else "trip_planner" if "plan" in query else "story_teller"
+        )
+        return {"reason": "It matches the route's description.", "route": route}
+    return "A considered answer to the request, about a paragraph long. " * 4
+
+
+def write_jsonl(path: Path, records: list[dict]):
+    path.write_text(
+        "".join(json.dumps(record) + "\n" for record in records), encoding="utf-8"
+    )
+
+
+async def run_pass(directory: Path, name: str) -> dict[str, tuple[float, int]]:
+    """Wall time and model calls of each dataset."""
+    results = {}
+    for target_name, records in DATASETS.items():
+        target = TARGETS[target_name]
+        recipe = load_recipe(target.path)
+        input_path = directory / f"{target_name}.jsonl"
+        write_jsonl(input_path, records)
+        model = recipe.model
+        calls = model.calls
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            await run_batch(
+                target,
+                input_path,
+                directory / f"{target_name}.{name}.out.jsonl",
+                CONCURRENCY,
+                recipe,
+            )
+        results[target_name] = (time.perf_counter() - start, model.calls - calls)
+    return results
+
+
+async def main():
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        path = directory / "responses.sqlite"
+        for target in DATASETS:
+            recipe = load_recipe(TARGETS[target].path)
+            recipe.model = ScriptedChatModel(
+                responder=responder,
+                latency=LATENCY,
+                tokens_per_second=TOKENS_PER_SECOND,
+                model_name="gpt-4o-mini",
+            )
+
+        print(
+            f"{'pass':<10}{'dataset':<28}{'records':>8}{'seconds':>9}"
+            f"{'model calls':>13}"
+        )
+        cache = None
+        for name in ("cold", "memory", "sqlite"):
+            if name != "memory":
+                if cache is not None:
+                    cache.flush_stats()
+                cache = ResponseCache(path)
+                set_llm_cache(cache)
+            for target, (seconds, calls) in (await run_pass(directory, name)).items():
+                print(
+                    f"{name:<10}{target:<28}{len(DATASETS[target]):>8}"
+                    f"{seconds:>9.2f}{calls:>13}"
+                )
+        cache.flush_stats()
+        print(f"\n{cache}")
+        print(format_stats(cache.stored_stats()))
+        set_llm_cache(None)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
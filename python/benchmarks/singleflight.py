@@ -0,0 +1,125 @@
+# Calls saved by coalescing identical in-flight requests (shared/singleflight.py):
+# bursts of routing requests and embeddings queries, many of them for the same few
+# popular queries, sent through the recipes' real OpenAI clients to the local
+# stand-in server. The same arrival schedule is replayed with coalescing off and on;
+# the server counts the requests that reach it. The response cache is off, since it
+# only answers repeats of calls that have already finished.
+
+import asyncio
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.clients import openai_embeddings, singleflight  # noqa: E402
+from shared.fake_server import FakeOpenAIServer  # noqa: E402
+from shared.recipes import load_recipe  # noqa: E402
+
+BURSTS = 40
+# Requests per burst, all arriving within `BURST_SPREAD` seconds
+BURST_SIZE = (1, 16)
+BURST_SPREAD = 0.01
+# Mean seconds between bursts
+BURST_GAP = 0.05
+LATENCY = 0.1
+QUERIES = [
+    "Write a Python function to merge two sorted lists.",
+    "How do I center a div with CSS?",
+    "Summarize the plot of Hamlet in two sentences.",
+    "What is the capital of Australia?",
+    "Explain what a race condition is.",
+    "Translate 'good morning' into French.",
+    "Write a haiku about autumn rain.",
+    "What does HTTP status 429 mean?",
+]
+SEED = 7
+
+
+def responder(messages, schema):
+    if schema == "RouterSchema":
+        query = str(messages[-1].content)
+        route = "code_generation" if "Python" in query else "story_teller"
+        return {"reason": "It fits the description.", "route": route}
+    return "An answer."
+
+
+def schedule(seed: int = SEED) -> list[tuple[float, str]]:
+    """(arrival time, query) pairs: bursts of requests, most for a few popular
+    queries, as when a link or a question goes around."""
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(len(QUERIES))]
+    arrivals = []
+    start = 0.0
+    for _ in range(BURSTS):
+        start += rng.expovariate(1 / BURST_GAP)
+        for _ in range(rng.randint(*BURST_SIZE)):
+            query = rng.choices(QUERIES, weights)[0]
+            arrivals.append((start + rng.uniform(0, BURST_SPREAD), query))
+    return sorted(arrivals)
+
+
+async def replay(arrivals, call) -> list[float]:
+    """Latencies of `call(query)` for each arrival, started at its time."""
+    start = time.perf_counter()
+
+    async def at(offset: float, query: str) -> float:
+        await asyncio.sleep(max(0.0, start + offset - time.perf_counter()))
+        began = time.perf_counter()
+        await call(query)
+        return time.perf_counter() - began
+
+    return await asyncio.gather(*[at(offset, query) for offset, query in arrivals])
+
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def main():
+    os.environ["RECIPES_RESPONSE_CACHE"] = "off"
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    arrivals = schedule()
+    with FakeOpenAIServer(responder, latency=LATENCY).running() as server:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        routing = load_recipe("langchain/routing.py")
+        router = routing.RouterWorkflow(routing.ASSISTANTS)
+        # Without the context length check, which downloads a tokenizer
+        embeddings = openai_embeddings(
+            model="text-embedding-3-small", check_embedding_ctx_length=False
+        )
+        workloads = {
+            "routing": router.run,
+            "embeddings": embeddings.aembed_query,
+        }
+
+        print(
+            f"{len(arrivals)} requests in {BURSTS} bursts over "
+            f"{len(QUERIES)} queries, {LATENCY * 1000:.0f}ms per API call"
+        )
+        print(
+            f"{'workload':<12}{'singleflight':<14}{'API calls':>10}{'coalesced':>11}"
+            f"{'p50 ms':>8}{'p95 ms':>8}"
+        )
+        for name, call in workloads.items():
+            for enabled in (False, True):
+                singleflight.enabled = enabled
+                singleflight.reset()
+                requests = server.requests
+                with contextlib.redirect_stdout(io.StringIO()):
+                    latencies = asyncio.run(replay(arrivals, call))
+                print(
+                    f"{name:<12}{'on' if enabled else 'off':<14}"
+                    f"{server.requests - requests:>10}{singleflight.coalesced:>11}"
+                    f"{percentile(latencies, 50) * 1000:>8.0f}"
+                    f"{percentile(latencies, 95) * 1000:>8.0f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# Time until the first field, the first ingredient and the whole recipe are available,
+# blocking on `with_structured_output` versus `stream_recipe`, which parses the JSON
+# as it streams, in langchain/basics.py and langchain/structured_output.py. The fake
+# model has a fixed time to first token and a steady token rate.
+
+import contextlib
+import io
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.fake_models import ScriptedChatModel  # noqa: E402
+from shared.recipes import load_recipe  # noqa: E402
+
+TRIALS = 3
+TIME_TO_FIRST_TOKEN = 0.5
+TOKENS_PER_SECOND = 100.0
+
+RECIPE = {
+    "reasoning": "Children like mild, sweet flavours and food they can eat by hand, "
+    "so a small omurice with ketchup rice is a safe choice.",
+    "name": "Omurice",
+    "ingredients": [
+        {"name": name, "quantity": quantity, "amount": quantity}
+        for name, quantity in [
+            ("Eggs", "3"),
+            ("Cooked rice", "300g"),
+            ("Chicken thigh", "100g"),
+            ("Onion", "1/2"),
+            ("Ketchup", "4 tbsp"),
+            ("Butter", "20g"),
+        ]
+    ],
+    "instructions": [
+        "Dice the chicken and onion.",
+        "Fry them in half of the butter until the chicken is cooked through.",
+        "Add the rice and ketchup and stir-fry until evenly coloured.",
+        "Beat the eggs and cook them in the rest of the butter until just set.",
+        "Wrap the rice in the omelette and top it with more ketchup.",
+    ],
+}
+
+
+def responder(messages, schema):
+    return RECIPE
+
+
+def timings(recipe, query: str) -> dict[str, float]:
+    """Seconds until the first field, the first ingredient and the whole recipe."""
+    result = {}
+    start = time.perf_counter()
+    for partial in recipe.stream_recipe(query):
+        elapsed = time.perf_counter() - start
+        result.setdefault("first field", elapsed)
+        if partial.get("ingredients"):
+            result.setdefault("first ingredient", elapsed)
+    result["complete"] = time.perf_counter() - start
+    return result
+
+
+def blocking_timings(recipe, query: str, input_key: str) -> dict[str, float]:
+    chain = recipe.messages | recipe.model.with_structured_output(recipe.Recipe)
+    start = time.perf_counter()
+    chain.invoke({input_key: query})
+    elapsed = time.perf_counter() - start
+    return {"first field": elapsed, "first ingredient": elapsed, "complete": elapsed}
+
+
+def main():
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    print(
+        f"time to first token {TIME_TO_FIRST_TOKEN}s, {TOKENS_PER_SECOND:.0f} tokens/s"
+    )
+    print(
+        f"\n{'recipe':<20}{'mode':<10}{'first field s':>15}"
+        f"{'first ingredient s':>20}{'complete s':>12}"
+    )
+    for path, input_key in [
+        ("langchain/basics.py", "input"),
+        ("langchain/structured_output.py", "query"),
+    ]:
+        recipe = load_recipe(path)
+        recipe.model = ScriptedChatModel(
+            responder=responder,
+            latency=TIME_TO_FIRST_TOKEN,
+            tokens_per_second=TOKENS_PER_SECOND,
+        )
+        for mode, measure in [
+            ("blocking", lambda q: blocking_timings(recipe, q, input_key)),
+            ("stream", lambda q: timings(recipe, q)),
+        ]:
+            with contextlib.redirect_stdout(io.StringIO()):
+                trials = [measure("A recipe children like.") for _ in range(TRIALS)]
+            means = {key: statistics.mean(t[key] for t in trials) for key in trials[0]}
+            print(
+                f"{Path(path).stem:<20}{mode:<10}{means['first field']:>15.3f}"
+                f"{means['first ingredient']:>20.3f}{means['complete']:>12.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
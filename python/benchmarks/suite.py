@@ -0,0 +1,473 @@
+# End-to-end benchmark of every langchain and langgraph recipe, offline.
+#
+#     cd python
+#     python benchmarks/suite.py -o before.json
+#     python benchmarks/suite.py -o after.json --compare before.json
+#
+# Each recipe's model (and embeddings) is replaced with a scripted fake that answers
+# every prompt and output schema the recipes use, with long-tailed latencies and a
+# fixed token rate. Each recipe is run for `--requests` requests at each
+# `--concurrency` level, and the wall time, latency percentiles, model calls, tokens
+# and peak concurrent model calls are reported and written as JSON, with the commit
+# they were measured at. Recipes whose dependencies are not installed are skipped.
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, NamedTuple, Optional
+
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.messages.tool import tool_call
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.vectorstores import InMemoryVectorStore
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.fake_models import (  # noqa: E402
+    ScriptedChatModel,
+    ScriptedEmbeddings,
+    lognormal_latency,
+    random_failures,
+)
+from shared.recipes import load_recipe  # noqa: E402
+from shared.tool_cache import ToolResultCache  # noqa: E402
+from shared.usage import collect_token_usage  # noqa: E402
+
+REQUESTS = 8
+CONCURRENCY_LEVELS = [1, 4, 8]
+LATENCY_MEDIAN = 0.05
+LATENCY_P95 = 0.2
+TOKENS_PER_SECOND = 1000.0
+
+QUERIES = [
+    "Write a Python function to check if a number is prime.",
+    "Plan a 2-week trip to Europe.",
+    "Write a story about a brave knight and a dragon.",
+    "Write a JavaScript debounce helper.",
+    "Plan a weekend in Kyoto.",
+    "Tell a bedtime story about a sleepy owl.",
+]
+CODE_TASK = "Implement a Stack with push(x), pop() and getMin(), all in O(1)."
+ORCHESTRATOR_TASK = (
+    "Write a product description for a new eco-friendly water bottle for "
+    "environmentally conscious millennials: plastic-free, insulated, lifetime warranty."
+)
+CHAIN_PROMPTS = [
+    "Extract the numbers.",
+    "Compute the growth between quarters.",
+    "Summarize the trend in one sentence.",
+]
+FEEDBACK = "Handle pop() and getMin() on an empty stack."
+ARTICLE = " ".join(
+    f"Section {i}: agents combine a model with tools and memory, and workflows such "
+    f"as routing, parallelization and evaluator-optimizer loops trade latency for "
+    f"quality in different ways."
+    for i in range(120)
+)
+PARAGRAPH = "A considered answer to the request, about a paragraph long. " * 4
+
+
+def route_for(query: str) -> str:
+    query = query.lower()
+    if "story" in query:
+        return "story_teller"
+    return "trip_planner" if "plan" in query else "code_generation"
+
+
+def code(revised: bool) -> str:
+    body = "        self.items, self.mins = [], []\n"
+    if revised:
+        body += "        # revised: empty stacks raise IndexError\n"
+    return f"class Stack:\n    def __init__(self):\n{body}"
+
+
+def responder(messages, schema):
+    """Answers for every prompt and output schema the recipes use."""
+    prompt = "\n".join(str(m.content) for m in messages)
+    revised = FEEDBACK in prompt
+    if schema == "TaskList":
+        return {
+            "analysis": "Three angles on the same product.",
+            "tasks": [
+                {"reasoning": "Specs", "type": kind, "description": f"A {kind} take."}
+                for kind in ("Formal", "Conversational", "Hybrid")
+            ],
+        }
+    if schema == "BatchWorkerOutput":
+        count = len(re.findall(r"^\d+\. Style:", prompt, re.MULTILINE))
+        return {
+            "responses": [{"index": i, "response": PARAGRAPH} for i in range(count)]
+        }
+    if schema == "RouterSchema":
+        query = prompt.split("user prompt/query:")[-1].split(", select")[0]
+        return {"reason": "It fits the description.", "route": route_for(query)}
+    if schema == "BatchRouterSchema":
+        queries = re.findall(r"^(\d+)\. (.*)$", prompt.split("Queries:")[-1], re.M)
+        return {
+            "routes": [
+                {"index": int(i), "reason": "It fits.", "route": route_for(query)}
+                for i, query in queries
+            ]
+        }
+    if schema == "Recipe":
+        return {
+            "reasoning": "Children like mild, sweet food.",
+            "name": "Omurice",
+            "ingredients": [
+                {"name": name, "quantity": amount, "amount": amount}
+                for name, amount in [("Eggs", "3"), ("Rice", "300g"), ("Ketchup", "4")]
+            ],
+            "instructions": ["Fry the rice.", "Cook the eggs.", "Wrap the rice."],
+        }
+    if schema in ("GeneratorResponse", "GenerateCodeOutput"):
+        return {"thoughts": "Addressing the feedback.", "code": code(revised)}
+    if schema == "EvaluatorResponse":
+        passed = "# revised" in prompt
+        return {
+            "feedback": "Looks good." if passed else FEEDBACK,
+            "evaluation": "PASS" if passed else "NEEDS_IMPROVEMENT",
+        }
+    if schema == "EvaluateCodeOutput":
+        passed = "# revised" in prompt
+        return {
+            "feedback": "Looks good." if passed else FEEDBACK,
+            "score": 90 if passed else 60,
+        }
+    return PARAGRAPH
+
+
+def tool_responder(messages, schema):
+    """Asks for two tool calls, then answers with their results."""
+    if any(isinstance(m, ToolMessage) for m in messages):
+        return "2 + 3 is 5, and 4 times 5 is 20."
+    return AIMessage(
+        content="",
+        tool_calls=[
+            tool_call(name="add", args={"a": 2, "b": 3}, id="call_add"),
+            tool_call(name="multiply", args={"a": 4, "b": 5}, id="call_multiply"),
+        ],
+    )
+
+
+class FakeWebLoader:
+    """Stands in for `WebBaseLoader`: every URL is the same long article."""
+
+    def __init__(self, url: str):
+        self.url = url
+
+    def load(self) -> list[Document]:
+        return [Document(page_content=ARTICLE, metadata={"source": self.url})]
+
+
+Install = Callable[[Any, ScriptedChatModel, ScriptedEmbeddings], None]
+Run = Callable[[Any, int], Awaitable[Any]]
+
+
+def install_model(recipe, model: ScriptedChatModel, embeddings: ScriptedEmbeddings):
+    recipe.model = model
+
+
+def install_tool_model(recipe, model, embeddings):
+    recipe.llm = model
+    recipe.llm_with_tools = model.bind_tools(recipe.tools)
+    recipe.llm_without_tool_use = model.bind_tools(recipe.tools, tool_choice="none")
+    # Start every level with an empty cache of tool results
+    recipe.tool_cache = ToolResultCache()
+
+
+def install_web_model(recipe, model, embeddings):
+    recipe.model = model
+    recipe.WebBaseLoader = FakeWebLoader
+
+
+def install_rag_model(recipe, model, embeddings):
+    store = InMemoryVectorStore.from_texts(
+        [f"{query} {PARAGRAPH}" for query in QUERIES], embeddings
+    )
+    recipe.retriever = store.as_retriever(search_type="mmr", search_kwargs={"k": 5})
+    recipe.rag_chain = recipe.prompt | model | StrOutputParser()
+
+
+class Scenario(NamedTuple):
+    path: str
+    run: Run
+    install: Install = install_model
+    responder: Callable = responder
+
+
+async def _in_thread(function: Callable[[], Any]) -> Any:
+    # The synchronous recipes run in the default executor, as a server would run them
+    return await asyncio.to_thread(function)
+
+
+SCENARIOS: list[Scenario] = [
+    Scenario(
+        "langchain/basics.py",
+        lambda recipe, i: _in_thread(
+            lambda: list(recipe.stream_recipe(QUERIES[i % 6]))
+        ),
+    ),
+    Scenario(
+        "langchain/structured_output.py",
+        lambda recipe, i: _in_thread(
+            lambda: list(recipe.stream_recipe(QUERIES[i % 6]))
+        ),
+    ),
+    Scenario(
+        "langchain/tool_calling.py",
+        lambda recipe, i: recipe.run_agent(f"What is 2 + 3 and 4 * 5? ({i})"),
+        install_tool_model,
+        tool_responder,
+    ),
+    Scenario(
+        "langchain/prompt_chaining.py",
+        lambda recipe, i: recipe.prompt_chaining(
+            f"Revenue {i}: 1, 2, 3", CHAIN_PROMPTS
+        ),
+    ),
+    Scenario(
+        "langgraph/prompt_chaining.py",
+        lambda recipe, i: recipe.prompt_chaining(
+            f"Revenue {i}: 1, 2, 3", CHAIN_PROMPTS
+        ),
+    ),
+    Scenario(
+        "langchain/routing.py",
+        lambda recipe, i: recipe.RouterWorkflow(recipe.ASSISTANTS).run(QUERIES[i % 6]),
+    ),
+    Scenario(
+        "langgraph/routing.py",
+        lambda recipe, i: recipe.execute_task(QUERIES[i % 6]),
+    ),
+    Scenario(
+        "langchain/orchestrator_workers.py",
+        lambda recipe, i: recipe.orchestrator_workers(ORCHESTRATOR_TASK),
+    ),
+    Scenario(
+        "langgraph/orchestrator_workers.py",
+        lambda recipe, i: recipe.orchestrator_workers(ORCHESTRATOR_TASK),
+    ),
+    Scenario(
+        "langchain/evaluator_optimizer.py",
+        lambda recipe, i: recipe.optimize_code(CODE_TASK),
+    ),
+    Scenario(
+        "langgraph/evaluator_optimzer.py",
+        lambda recipe, i: recipe.run_evaluator_optimizer(CODE_TASK),
+    ),
+    Scenario(
+        "langchain/parallelization.py",
+        lambda recipe, i: recipe.parallelization(f"https://example.com/{i}"),
+        install_web_model,
+    ),
+    Scenario(
+        "langgraph/parallelization.py",
+        lambda recipe, i: recipe.parallelization(f"https://example.com/{i}"),
+        install_web_model,
+    ),
+    Scenario(
+        "langchain/rag/app.py",
+        lambda recipe, i: _in_thread(lambda: recipe.ask_question(QUERIES[i % 6])),
+        install_rag_model,
+    ),
+]
+
+
+def percentile(values: list[float], p: float) -> float:
+    """The `p`-th percentile (nearest rank)."""
+    if not values:
+        return math.nan
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+async def run_level(
+    scenario: Scenario, recipe, concurrency: int, settings: dict, seed: int
+) -> dict:
+    """Run `settings["requests"]` requests, `concurrency` at a time, on fresh fakes."""
+    model = ScriptedChatModel(
+        responder=scenario.responder,
+        latency=lognormal_latency(
+            settings["latency_median"], settings["latency_p95"], seed
+        ),
+        tokens_per_second=settings["tokens_per_second"],
+        failure=(
+            random_failures(settings["failure_rate"], seed=seed)
+            if settings["failure_rate"]
+            else None
+        ),
+    )
+    embeddings = ScriptedEmbeddings(
+        latency=lognormal_latency(
+            settings["latency_median"] / 2, settings["latency_p95"] / 2, seed
+        )
+    )
+    scenario.install(recipe, model, embeddings)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    errors: dict[str, int] = {}
+
+    async def request(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await scenario.run(recipe, i)
+                latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+
+    start = time.perf_counter()
+    with collect_token_usage() as usage, contextlib.redirect_stdout(io.StringIO()):
+        await asyncio.gather(*[request(i) for i in range(settings["requests"])])
+    wall = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "requests": settings["requests"],
+        "wall_seconds": round(wall, 4),
+        "throughput": round(len(latencies) / wall, 3),
+        "p50_seconds": round(percentile(latencies, 50), 4),
+        "p95_seconds": round(percentile(latencies, 95), 4),
+        "model_calls": model.calls,
+        "model_failures": model.failures,
+        "embedding_calls": embeddings.calls,
+        "input_tokens": usage.input_tokens,
+        "output_tokens": usage.output_tokens,
+        "peak_in_flight": model.peak_in_flight,
+        "errors": errors,
+    }
+
+
+def current_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_level(name: str, level: dict):
+    errors = sum(level["errors"].values())
+    print(
+        f"{name:<34}{level['concurrency']:>5}{level['wall_seconds']:>8.2f}"
+        f"{level['throughput']:>8.2f}{level['p50_seconds']:>8.2f}"
+        f"{level['p95_seconds']:>8.2f}{level['model_calls']:>7}"
+        f"{level['input_tokens']:>9}{level['output_tokens']:>9}"
+        f"{level['peak_in_flight']:>6}{errors:>7}"
+    )
+
+
+def print_comparison(baseline: dict, results: dict):
+    print(f"\nCompared with {baseline.get('commit') or 'the baseline'}:")
+    if baseline.get("settings") != results["settings"]:
+        print(f"(measured with different settings: {baseline.get('settings')})")
+    print(f"{'recipe':<34}{'conc':>5}{'wall':>9}{'calls':>9}{'tokens':>9}")
+    for name, result in results["scenarios"].items():
+        before = {
+            level["concurrency"]: level
+            for level in baseline.get("scenarios", {}).get(name, {}).get("levels", [])
+        }
+        for level in result.get("levels", []):
+            old = before.get(level["concurrency"])
+            if old is None:
+                continue
+
+            def change(key: str) -> str:
+                if not old[key]:
+                    return "n/a"
+                return f"{(level[key] - old[key]) / old[key]:+.0%}"
+
+            tokens = {
+                k: v["input_tokens"] + v["output_tokens"]
+                for k, v in (("new", level), ("old", old))
+            }
+            token_change = (
+                f"{(tokens['new'] - tokens['old']) / tokens['old']:+.0%}"
+                if tokens["old"]
+                else "n/a"
+            )
+            print(
+                f"{name:<34}{level['concurrency']:>5}{change('wall_seconds'):>9}"
+                f"{change('model_calls'):>9}{token_change:>9}"
+            )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark every recipe offline.")
+    parser.add_argument("-o", "--output", type=Path, help="write the results as JSON")
+    parser.add_argument("--compare", type=Path, help="results of an earlier run")
+    parser.add_argument("--only", nargs="+", help="recipes whose path contains these")
+    parser.add_argument("-n", "--requests", type=int, default=REQUESTS)
+    parser.add_argument(
+        "-c", "--concurrency", type=int, nargs="+", default=CONCURRENCY_LEVELS
+    )
+    parser.add_argument("--latency-median", type=float, default=LATENCY_MEDIAN)
+    parser.add_argument("--latency-p95", type=float, default=LATENCY_P95)
+    parser.add_argument("--tokens-per-second", type=float, default=TOKENS_PER_SECOND)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    # Measure the recipes, not the response cache of earlier runs
+    os.environ["RECIPES_RESPONSE_CACHE"] = "off"
+    settings = {
+        "requests": args.requests,
+        "latency_median": args.latency_median,
+        "latency_p95": args.latency_p95,
+        "tokens_per_second": args.tokens_per_second,
+        "failure_rate": args.failure_rate,
+    }
+    results: dict[str, Any] = {
+        "commit": current_commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "settings": settings,
+        "scenarios": {},
+    }
+    print(
+        f"{'recipe':<34}{'conc':>5}{'wall s':>8}{'req/s':>8}{'p50 s':>8}{'p95 s':>8}"
+        f"{'calls':>7}{'tok in':>9}{'tok out':>9}{'peak':>6}{'errors':>7}"
+    )
+    for index, scenario in enumerate(SCENARIOS):
+        name = scenario.path.removesuffix(".py")
+        if args.only and not any(part in scenario.path for part in args.only):
+            continue
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                recipe = load_recipe(scenario.path)
+        except ImportError as e:
+            results["scenarios"][name] = {"skipped": str(e)}
+            print(f"{name:<34} skipped: {e}")
+            continue
+        levels = []
+        for concurrency in args.concurrency:
+            level = await run_level(
+                scenario, recipe, concurrency, settings, seed=index * 1000 + concurrency
+            )
+            levels.append(level)
+            print_level(name, level)
+        results["scenarios"][name] = {"levels": levels}
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+    if args.compare:
+        print_comparison(json.loads(args.compare.read_text(encoding="utf-8")), results)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
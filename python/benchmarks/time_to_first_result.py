@@ -0,0 +1,74 @@
+# Time to the first worker result of the orchestrator-workers recipes, when waiting for
+# all workers (`orchestrator_workers`) versus iterating `stream_orchestrator_workers`.
+# Model calls take a random time, so the slowest worker decides when `gather` returns.
+
+import asyncio
+import contextlib
+import io
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.fake_models import ScriptedChatModel  # noqa: E402
+from shared.recipes import load_recipe  # noqa: E402
+
+TRIALS = 10
+LATENCY = (0.2, 1.5)
+TASK = "Write a product description for a new eco-friendly water bottle."
+
+TASK_LIST = {
+    "analysis": "Three tones for three kinds of reader.",
+    "tasks": [
+        {"reasoning": "", "type": style, "description": f"Write it in a {style} style."}
+        for style in ["Formal", "Conversational", "Hybrid"]
+    ],
+}
+
+
+def fake_model(rng: random.Random) -> ScriptedChatModel:
+    def responder(messages, schema):
+        return TASK_LIST if schema == "TaskList" else "A bottle for life."
+
+    return ScriptedChatModel(responder=responder, latency=lambda: rng.uniform(*LATENCY))
+
+
+async def time_gather(recipe) -> tuple[float, float]:
+    start = time.perf_counter()
+    await recipe.orchestrator_workers(TASK)
+    elapsed = time.perf_counter() - start
+    return elapsed, elapsed
+
+
+async def time_stream(recipe) -> tuple[float, float]:
+    start = time.perf_counter()
+    first = None
+    async for _ in recipe.stream_orchestrator_workers(TASK):
+        first = first or time.perf_counter() - start
+    return first, time.perf_counter() - start  # type: ignore
+
+
+async def main():
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    print(f"{'recipe':<12}{'mode':<8}{'first result s':>16}{'all results s':>15}")
+    for name in ["langchain", "langgraph"]:
+        recipe = load_recipe(f"{name}/orchestrator_workers.py")
+        for mode, run in [("gather", time_gather), ("stream", time_stream)]:
+            trials = []
+            for seed in range(TRIALS):
+                recipe.model = fake_model(random.Random(seed))
+                with contextlib.redirect_stdout(io.StringIO()):
+                    trials.append(await run(recipe))
+            print(
+                f"{name:<12}{mode:<8}"
+                f"{statistics.mean(first for first, _ in trials):>16.3f}"
+                f"{statistics.mean(total for _, total in trials):>15.3f}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
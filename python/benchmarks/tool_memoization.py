@@ -0,0 +1,82 @@
+# Runs concurrent agent sessions of langchain/tool_calling.py whose tool calls overlap,
+# with slow tools marked pure (memoized, deduplicated) and not. Each session asks for
+# the same conversion twice in its first turn and once more in its second, and the
+# sessions share most of their arguments.
+
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+from pathlib import Path
+
+from langchain_core.messages import AIMessage
+from langchain_core.tools import tool
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.fake_models import ScriptedChatModel  # noqa: E402
+from shared.recipes import load_recipe  # noqa: E402
+from shared.tool_cache import ToolResultCache, pure  # noqa: E402
+
+SESSIONS = 20
+TOOL_SECONDS = 0.2
+executions = 0
+
+
+@tool
+def convert(amount: float, currency: str) -> float:
+    """Converts an amount in GBP to another currency."""
+    global executions
+    executions += 1
+    time.sleep(TOOL_SECONDS)
+    return round(amount * 1.17, 2)
+
+
+def responder(messages, schema):
+    session = int(str(messages[0].content).split()[-1])
+    amount = 10 * (session % 4)  # four distinct amounts across the sessions
+    turn = sum(isinstance(m, AIMessage) for m in messages)
+    if turn == 0:
+        calls = [
+            {"name": "convert", "args": {"amount": amount, "currency": "EUR"}},
+            {"name": "convert", "args": {"currency": "EUR", "amount": amount}},
+            {"name": "convert", "args": {"amount": amount, "currency": "USD"}},
+        ]
+    elif turn == 1:
+        calls = [{"name": "convert", "args": {"amount": amount, "currency": "EUR"}}]
+    else:
+        return "Done."
+    for i, call in enumerate(calls):
+        call["id"] = f"call_{session}_{turn}_{i}"
+    return AIMessage(content="", tool_calls=calls)
+
+
+async def main():
+    global executions
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    recipe = load_recipe("langchain/tool_calling.py")
+    model = ScriptedChatModel(responder=responder, latency=0.05)
+
+    print(f"{SESSIONS} concurrent sessions, 4 tool calls each\n")
+    print(f"{'mode':<10}{'executions':>12}{'hit rate':>10}{'deduped':>9}{'wall s':>8}")
+    for name, tools in [("plain", [convert]), ("pure", [pure(convert.model_copy())])]:
+        recipe.tools = tools
+        recipe.llm_with_tools = model.bind_tools(tools)
+        recipe.tool_cache = ToolResultCache()
+        executions = 0
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            await asyncio.gather(
+                *[recipe.run_agent(f"Convert for session {i}") for i in range(SESSIONS)]
+            )
+        cache = recipe.tool_cache
+        print(
+            f"{name:<10}{executions:>12}{cache.hit_rate:>10.0%}"
+            f"{cache.deduplicated:>9}{time.perf_counter() - start:>8.3f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,104 @@
+# Cost of tracing with shared/tracing.py: the langchain orchestrator-workers recipe
+# run many times against a zero-latency fake model with tracing off, sampled and on
+# for every run, exported to a file. The last mode exports through an exporter that
+# takes half a second per batch, with a smaller queue, to show that a slow backend
+# drops spans instead of slowing the traced code down.
+
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared import tracing  # noqa: E402
+from shared.fake_models import ScriptedChatModel  # noqa: E402
+from shared.recipes import load_recipe  # noqa: E402
+
+RUNS = 500
+TRIALS = 3
+TASK = "Write a product description for an insulated, plastic-free water bottle."
+
+
+def responder(messages, schema):
+    if schema == "TaskList":
+        return {
+            "analysis": "Three angles.",
+            "tasks": [
+                {"reasoning": "", "type": kind, "description": f"A {kind} take."}
+                for kind in ("Formal", "Conversational", "Hybrid")
+            ],
+        }
+    return "A short product description. " * 200
+
+
+class SlowExporter(tracing.FileExporter):
+    def export(self, spans):
+        time.sleep(0.5)
+        super().export(spans)
+
+
+async def time_runs(recipe) -> float:
+    """Seconds for `RUNS` runs of the recipe."""
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        await recipe.orchestrator_workers(TASK)
+    return time.perf_counter() - start
+
+
+async def main():
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    os.environ["RECIPES_RESPONSE_CACHE"] = "off"
+    recipe = load_recipe("langchain/orchestrator_workers.py")
+    recipe.model = ScriptedChatModel(responder=responder)
+
+    directory = Path(tempfile.mkdtemp())
+    modes = {
+        "off": lambda: tracing.configure_tracing("off"),
+        "sampled": lambda: tracing.configure_tracing(
+            "sampled", 0.1, tracing.FileExporter(directory / "sampled.jsonl")
+        ),
+        "full": lambda: tracing.configure_tracing(
+            "full", exporter=tracing.FileExporter(directory / "full.jsonl")
+        ),
+        "full, slow": lambda: tracing.configure_tracing(
+            "full", exporter=SlowExporter(directory / "slow.jsonl"), queue_size=1000
+        ),
+    }
+    timings: dict[str, list[float]] = {name: [] for name in modes}
+    stats = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        await time_runs(recipe)  # warm up
+        for _ in range(TRIALS):
+            for name, configure in modes.items():
+                tracer = configure()
+                timings[name].append(await time_runs(recipe))
+                if tracer is not None:
+                    stats[name] = tracer.stats
+
+    # The root, three workers and four model calls
+    spans = 8
+    best = {name: min(seconds) for name, seconds in timings.items()}
+    print(f"{RUNS} runs of {spans} spans each, best of {TRIALS}")
+    print(
+        f"{'tracing':<12}{'seconds':>9}{'ms per run':>12}{'µs per span':>13}"
+        f"{'exported':>10}{'dropped':>9}"
+    )
+    for name, seconds in best.items():
+        extra = (seconds - best["off"]) / (RUNS * spans) * 1e6
+        exported = stats[name].exported if name in stats else 0
+        dropped = stats[name].dropped if name in stats else 0
+        print(
+            f"{name:<12}{seconds:>9.3f}{seconds / RUNS * 1000:>12.3f}{extra:>13.1f}"
+            f"{exported:>10}{dropped:>9}"
+        )
+    full = directory / "full.jsonl"
+    print(f"\nfull trace file: {full.stat().st_size / RUNS / TRIALS:.0f} bytes per run")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,12 +1,24 @@
-from langchain_openai import ChatOpenAI
 from langchain_ollama.chat_models import ChatOllama
 from langchain.schema import HumanMessage, SystemMessage
 from langchain.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from typing import TypedDict, Annotated
+from typing import Iterator, TypedDict, Annotated
 import json
+import sys
+import time
+from pathlib import Path
 from langsmith import traceable
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.clients import chat_model  # noqa: E402
+from shared.registry import registry  # noqa: E402
+from shared.response_cache import install_response_cache  # noqa: E402
+from shared.streaming_json import (  # noqa: E402
+    json_schema_response_format,
+    stream_partial_objects,
+)
+
 
 class Ingredient(TypedDict):
     name: Annotated[str, ..., "食材名"]
@@ -19,8 +31,11 @@ class Recipe(TypedDict):
     instructions: Annotated[list[str], ..., "作り方"]
 
 
-model = ChatOpenAI(model="gpt-4o-mini", temperature=0.0)
+install_response_cache()
+
+model = chat_model(model="gpt-4o-mini", temperature=0.0)
 # model = ChatOllama(model="qwen2.5-coder:1.5b", temperature=0.0)
+# Or both, with RECIPES_MODEL_POOL="https://api.openai.com/v1,ollama:qwen2.5-coder:1.5b"
 
 prompt = """
 あなたはプロ料理人です。ユーザーの要望に沿った料理の提案、レシピの提供、調理法の解説を行います。
@@ -68,6 +83,25 @@ messages = ChatPromptTemplate.from_messages(
 # LCEL(LangChain Express Language)
 chain = messages | model.with_structured_output(Recipe)
 
-result = chain.invoke({"input": "美味しいオムレツの作り方を教えてください。"})
 
-print(json.dumps(result, indent=2, ensure_ascii=False))
+def stream_recipe(input: str) -> Iterator[Recipe]:
+    """Yield the recipe as it is generated: the name, then each ingredient and
+    instruction as soon as it is complete. Fields not generated yet are missing."""
+    stream_chain = registry.get(
+        ("stream_recipe", id(messages), id(model), id(Recipe)),
+        lambda: messages
+        | model.bind(response_format=json_schema_response_format(Recipe)),
+        messages,
+        model,
+        Recipe,
+    )
+    for partial in stream_partial_objects(stream_chain.stream({"input": input})):
+        yield partial  # type: ignore
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    for recipe in stream_recipe("美味しいオムレツの作り方を教えてください。"):
+        print(f"{time.perf_counter() - start:.2f}s: {list(recipe)}")
+
+    print(json.dumps(recipe, indent=2, ensure_ascii=False))
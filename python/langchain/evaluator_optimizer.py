@@ -6,13 +6,44 @@
 # with adjustments, continuing until the evaluator confirms all requirements are met.
 
 import asyncio
+import sys
+from pathlib import Path
 from typing import TypedDict, Annotated, Literal, Optional
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
-from langsmith import traceable
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.cascade import Cascade, valid_python  # noqa: E402
+from shared.clients import chat_model  # noqa: E402
+from shared.convergence import (  # noqa: E402
+    EvaluationMemo,
+    code_converged,
+    score_plateaued,
+)
+from shared.diagnostics import install_diagnostics  # noqa: E402
+from shared.registry import registry  # noqa: E402
+from shared.response_cache import install_response_cache  # noqa: E402
+from shared.sandbox import ExecutionEvaluator, TestCase  # noqa: E402
+from shared.tracing import traced  # noqa: E402
+
+install_response_cache()
+install_diagnostics()
 
 # Initialize the model
-model = ChatOpenAI(model="gpt-4o", temperature=0)
+model = chat_model(model="gpt-4o", temperature=0)
+# Cheaper models tried first, when `RECIPES_CASCADE` names them (see shared/cascade.py)
+generator_cascade = Cascade("generate_code")
+evaluator_cascade = Cascade("evaluate_code")
+
+MAX_ITERATIONS = 3
+# Iterations in a row without a better evaluation before `optimize_code` stops early;
+# less than MAX_ITERATIONS - 1, so that stopping still saves an iteration
+PLATEAU_PATIENCE = 1
+# Number of candidates generated per iteration by `optimize_code_best_of_n`
+CANDIDATES = 3
+# Candidates are sampled with some temperature so that they actually differ
+CANDIDATE_TEMPERATURE = 0.7
+# Used to compare evaluations, e.g. to pick the best of several candidates
+EVALUATION_RANK = {"PASS": 2, "NEEDS_IMPROVEMENT": 1, "FAIL": 0}
 
 
 # Define response types for better type safety
@@ -34,11 +65,7 @@ class EvaluatorResponse(TypedDict):
     ]
 
 
-# Generator function to create code based on task and feedback
-async def generate_code(
-    task: str, feedback: Optional[str] = None, code: Optional[str] = None
-) -> GeneratorResponse:
-    GENERATOR_PROMPT = """
+GENERATOR_PROMPT = """
 Your objective is to execute the task delineated by <user input>. Should there be any critiques from your prior iterations,
 Generate high-quality code that includes the following components:
 - Proper error handling: Ensure the code effectively catches and handles potential errors and exceptions.
@@ -56,24 +83,8 @@ Produce the code with comments embedded, error handling code blocks, and indicat
 Task:
 {task}
     """
-    messages = [
-        ("system", GENERATOR_PROMPT.format(task=task)),
-    ]
-
-    if code:
-        messages.append(("user", f"Code: {code}\n\nFeedback: {feedback}"))
-
-    chain = ChatPromptTemplate.from_messages(messages) | model.with_structured_output(
-        GeneratorResponse, method="json_schema", strict=True
-    )
-    response = await chain.ainvoke({})
-    return GeneratorResponse(thoughts=response["thoughts"], code=response["code"])
 
-
-# Evaluator function to assess code quality
-@traceable(name="evaluate_task")
-async def evaluate_code(task: str, code: str) -> EvaluatorResponse:
-    EVALUATOR_PROMPT = """
+EVALUATOR_PROMPT = """
     Evaluate this following code implementation for:
     1. code correctness
     2. time complexity
@@ -88,35 +99,143 @@ async def evaluate_code(task: str, code: str) -> EvaluatorResponse:
     Only output JSON.
     """
 
+# Used when correctness and performance are already checked by running tests
+STYLE_EVALUATOR_PROMPT = """
+    Evaluate the style and best practices of this following code implementation.
+    Its correctness and time complexity have already been verified by tests, so do not evaluate them.
+
+    You should be evaluating only and not attempting to solve the task.
+
+    Only output "PASS" if you have no further suggestions for improvements.
+
+    Provide detailed feedback if there are areas that need improvement. You should specify what needs improvement and why.
+
+    Only output JSON.
+    """
+
+
+# Generator function to create code based on task and feedback
+async def generate_code(
+    task: str,
+    feedback: Optional[str] = None,
+    code: Optional[str] = None,
+    temperature: Optional[float] = None,
+) -> GeneratorResponse:
+    messages = [("system", GENERATOR_PROMPT)]
+
+    if code:
+        messages.append(("user", "Code: {code}\n\nFeedback: {feedback}"))
+
+    async def generate(tier) -> GeneratorResponse:
+        generator = tier
+        if temperature is not None:
+            generator = registry.variant(tier, temperature=temperature)
+        chain = registry.structured_chat_prompt_chain(
+            messages, generator, GeneratorResponse, method="json_schema", strict=True
+        )
+        response = await chain.ainvoke(
+            {"task": task, "code": code, "feedback": feedback}
+        )
+        return GeneratorResponse(thoughts=response["thoughts"], code=response["code"])
+
+    # Code that does not even compile is generated again by the next model
+    return await generator_cascade.run(
+        model, generate, accept=lambda response: valid_python(response["code"])
+    )
+
+
+# Evaluator function to assess code quality
+@traced(name="evaluate_task")
+async def evaluate_code(task: str, code: str) -> EvaluatorResponse:
     messages = [
         ("system", EVALUATOR_PROMPT),
-        ("user", f"Task: {task}\n\nCode: {code}"),
+        ("user", "Task: {task}\n\nCode: {code}"),
     ]
+    return await evaluate_with_cascade(messages, task, code)
+
 
-    chain = model.with_structured_output(
-        EvaluatorResponse, method="json_schema", strict=True
+async def evaluate_with_cascade(
+    messages: list[tuple[str, str]], task: str, code: str
+) -> EvaluatorResponse:
+    async def evaluate(tier) -> EvaluatorResponse:
+        chain = registry.structured_chat_prompt_chain(
+            messages, tier, EvaluatorResponse, method="json_schema", strict=True
+        )
+        response = await chain.ainvoke({"task": task, "code": code})
+        return EvaluatorResponse(
+            feedback=response["feedback"], evaluation=response["evaluation"]
+        )
+
+    # A PASS ends the loop with this code, so it is confirmed by the next model;
+    # other verdicts only cost another iteration if they are wrong
+    return await evaluator_cascade.run(
+        model, evaluate, accept=lambda response: response["evaluation"] != "PASS"
     )
-    response = await chain.ainvoke(messages)
+
+
+# Evaluator that runs the code against test cases, and only asks the model about style
+@traced(name="evaluate_task_with_tests")
+async def evaluate_code_with_tests(
+    task: str, code: str, test_cases: list[TestCase], style_check: bool = True
+) -> EvaluatorResponse:
+    execution = await ExecutionEvaluator(test_cases).evaluate(code)
+    if execution["evaluation"] != "PASS" or not style_check:
+        return EvaluatorResponse(**execution)
+
+    messages = [
+        ("system", STYLE_EVALUATOR_PROMPT),
+        ("user", "Task: {task}\n\nCode: {code}"),
+    ]
+    response = await evaluate_with_cascade(messages, task, code)
     return EvaluatorResponse(
-        feedback=response["feedback"], evaluation=response["evaluation"]
+        feedback=f"{execution['feedback']}\n\n{response['feedback']}",
+        evaluation=response["evaluation"],
     )
 
 
+async def evaluate(
+    task: str, code: str, test_cases: Optional[list[TestCase]] = None
+) -> EvaluatorResponse:
+    if test_cases:
+        return await evaluate_code_with_tests(task, code, test_cases)
+    return await evaluate_code(task, code)
+
+
 # Main workflow function using a while loop instead of recursion
-@traceable(name="optimize_code")
-async def optimize_code(task: str) -> str:
-    MAX_ITERATIONS = 3
+@traced(name="optimize_code")
+async def optimize_code(
+    task: str,
+    test_cases: Optional[list[TestCase]] = None,
+    detect_convergence: bool = True,
+) -> str:
+    """Generate and evaluate code until it passes or MAX_ITERATIONS is reached.
+
+    With `detect_convergence`, evaluations are memoized by normalized code hash, and
+    the loop stops early once the code stops changing or the evaluation stops improving.
+    """
     current_iteration = 0
     current_code = ""
     current_feedback = None
+    memo: EvaluationMemo[EvaluatorResponse] = EvaluationMemo()
+    ranks: list[int] = []
 
     while current_iteration < MAX_ITERATIONS:
         # Generate code based on current feedback
         generated_result = await generate_code(task, current_feedback, current_code)
-        current_code = generated_result["code"]
+        previous_code, current_code = current_code, generated_result["code"]
+
+        # The generator made no real change, so another round would not either
+        if detect_convergence and code_converged(previous_code, current_code):
+            print("Code stopped changing. Returning last generated code.")
+            return current_code
 
         # Evaluate the generated code
-        evaluation = await evaluate_code(task, current_code)
+        if detect_convergence:
+            evaluation = await memo.get_or_evaluate(
+                current_code, lambda: evaluate(task, current_code, test_cases), task
+            )
+        else:
+            evaluation = await evaluate(task, current_code, test_cases)
 
         # Check if code passes all criteria
         if evaluation["evaluation"] == "PASS":
@@ -132,10 +251,96 @@ async def optimize_code(task: str) -> str:
         )
         print("Feedback:", current_feedback)
 
+        ranks.append(EVALUATION_RANK[evaluation["evaluation"]])
+        if detect_convergence and score_plateaued(
+            ranks, min_gain=1, patience=PLATEAU_PATIENCE
+        ):
+            print("Evaluation stopped improving. Returning last generated code.")
+            return current_code
+
     print("Reached maximum iterations. Returning last generated code.")
     return current_code
 
 
+async def generate_candidate(
+    task: str,
+    feedback: Optional[str],
+    code: str,
+    test_cases: Optional[list[TestCase]] = None,
+    memo: Optional[EvaluationMemo[EvaluatorResponse]] = None,
+) -> tuple[str, EvaluatorResponse]:
+    generated_result = await generate_code(
+        task, feedback, code, temperature=CANDIDATE_TEMPERATURE
+    )
+    code = generated_result["code"]
+    if memo is None:
+        return code, await evaluate(task, code, test_cases)
+    evaluation = await memo.get_or_evaluate(
+        code, lambda: evaluate(task, code, test_cases), task
+    )
+    return code, evaluation
+
+
+# Variant of `optimize_code` that generates several candidates concurrently per iteration
+@traced(name="optimize_code_best_of_n")
+async def optimize_code_best_of_n(
+    task: str, n: int = CANDIDATES, test_cases: Optional[list[TestCase]] = None
+) -> str:
+    current_code = ""
+    current_feedback = None
+    # Candidates often repeat earlier code, which then does not need another evaluation
+    memo: EvaluationMemo[EvaluatorResponse] = EvaluationMemo()
+
+    for current_iteration in range(1, MAX_ITERATIONS + 1):
+        candidates = [
+            asyncio.create_task(
+                generate_candidate(
+                    task, current_feedback, current_code, test_cases, memo
+                )
+            )
+            for _ in range(n)
+        ]
+        best: Optional[tuple[str, EvaluatorResponse]] = None
+        errors: list[BaseException] = []
+        try:
+            # Evaluate candidates in the order they finish, and stop at the first PASS
+            for next_candidate in asyncio.as_completed(candidates):
+                try:
+                    code, evaluation = await next_candidate
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                if evaluation["evaluation"] == "PASS":
+                    return code
+                if (
+                    best is None
+                    or EVALUATION_RANK[evaluation["evaluation"]]
+                    > EVALUATION_RANK[best[1]["evaluation"]]
+                ):
+                    best = (code, evaluation)
+        finally:
+            for candidate in candidates:
+                candidate.cancel()
+
+        if best is None:
+            # Every candidate failed, so there is nothing to carry forward
+            raise errors[0]
+
+        # Carry the best candidate and its feedback into the next iteration
+        current_code, evaluation = best
+        current_feedback = evaluation["feedback"]
+
+        # Log progress
+        print(
+            f"Iteration {current_iteration}/{MAX_ITERATIONS}: {evaluation['evaluation']}"
+            f" (best of {n})"
+        )
+        print("Feedback:", current_feedback)
+
+    print("Reached maximum iterations. Returning best generated code.")
+    return current_code
+
+
 async def main():
     task = """
     Implement a Stack with:
@@ -143,8 +348,25 @@ async def main():
     2. pop()
     3. getMin()
     All operations should be O(1).
+    The class should be named `Stack`.
     """
-    result = await optimize_code(task)
+    # Correctness and complexity are checked by running these, the model only reviews style
+    test_cases: list[TestCase] = [
+        {
+            "name": "push_pop",
+            "code": "s = Stack()\ns.push(3)\ns.push(1)\nassert s.pop() == 1\nassert s.pop() == 3",
+        },
+        {
+            "name": "get_min",
+            "code": "s = Stack()\nfor x in [5, 2, 8, 1]:\n    s.push(x)\nassert s.getMin() == 1\ns.pop()\nassert s.getMin() == 2",
+        },
+        {
+            "name": "get_min_is_constant_time",
+            "code": "s = Stack()\nfor x in range(100000, 0, -1):\n    s.push(x)\nfor _ in range(100000):\n    s.getMin()",
+            "max_seconds": 1.0,
+        },
+    ]
+    result = await optimize_code(task, test_cases)
     print("Final result:", result)
 
 
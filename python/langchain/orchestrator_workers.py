@@ -4,15 +4,29 @@
 # then processed in parallel by multiple worker LLMs. Finally, the orchestrator
 # LLM synthesizes the workers' outputs into the final result.
 from dotenv import load_dotenv
-from langchain_core.prompts import PromptTemplate
-from typing import Annotated, List, TypedDict, Literal
-from langchain_openai import ChatOpenAI
+from typing import Annotated, AsyncIterator, List, TypedDict, Literal
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import PromptTemplate
 import asyncio
 import json
-from langsmith import traceable
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.clients import chat_model  # noqa: E402
+from shared.diagnostics import install_diagnostics  # noqa: E402
+from shared.registry import registry  # noqa: E402
+from shared.response_cache import install_response_cache  # noqa: E402
+from shared.streaming_json import (  # noqa: E402
+    StreamingJSONParser,
+    json_schema_response_format,
+)
+from shared.tracing import traced  # noqa: E402
 
 load_dotenv()
+install_response_cache()
+install_diagnostics()
 
 ORCHESTRATOR_PROMPT = """
 Analyze this task and break it down into 2-3 distinct approaches:
@@ -61,14 +75,18 @@ class TaskList(TypedDict):
     tasks: Annotated[List[Task], ..., "The approaches to tackle the task"]
 
 
-model = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+class WorkerResult(TypedDict):
+    task: Task
+    response: str
+
+
+model = chat_model(model="gpt-4o-mini", temperature=0)
 parser = StrOutputParser()
 
 
-@traceable(name="run_task")
+@traced(name="run_task")
 async def run_task(task: Task) -> str:
-    prompt = PromptTemplate.from_template(WORKER_PROMPT)
-    chain = prompt | model | parser
+    chain = registry.prompt_chain(WORKER_PROMPT, model, parser)
     response = await chain.ainvoke(
         {
             "original_task": task["description"],
@@ -79,11 +97,18 @@ async def run_task(task: Task) -> str:
     return response
 
 
-@traceable(name="orchestrator_workers")
+async def cancel_all(workers: list[asyncio.Future]):
+    """Cancel the workers that are still running and wait until they have stopped."""
+    pending = [worker for worker in workers if not worker.done()]
+    for worker in pending:
+        worker.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+
+@traced(name="orchestrator_workers")
 async def orchestrator_workers(task: str) -> list[str]:
-    prompt = PromptTemplate.from_template(ORCHESTRATOR_PROMPT)
-    chain = prompt | model.with_structured_output(
-        TaskList, method="json_schema", strict=True
+    chain = registry.structured_prompt_chain(
+        ORCHESTRATOR_PROMPT, model, TaskList, method="json_schema", strict=True
     )
     response = await chain.ainvoke({"task": task})
     analysis = response["analysis"]
@@ -94,15 +119,66 @@ async def orchestrator_workers(task: str) -> list[str]:
     return await asyncio.gather(*[run_task(task) for task in tasks])
 
 
+async def stream_orchestrator_workers(task: str) -> AsyncIterator[WorkerResult]:
+    """Like `orchestrator_workers`, but yields each worker's result, with its task, as
+    soon as that worker finishes instead of waiting for the slowest one."""
+    chain = registry.structured_prompt_chain(
+        ORCHESTRATOR_PROMPT, model, TaskList, method="json_schema", strict=True
+    )
+    response = await chain.ainvoke({"task": task})
+
+    async def run_tagged(task: Task) -> WorkerResult:
+        return WorkerResult(task=task, response=await run_task(task))
+
+    workers = [asyncio.ensure_future(run_tagged(task)) for task in response["tasks"]]
+    try:
+        for worker in asyncio.as_completed(workers):
+            yield await worker
+    finally:
+        # The caller may stop iterating early
+        await cancel_all(workers)
+
+
+def orchestrator_stream_chain():
+    # The orchestrator with the raw JSON output streamed, instead of parsed at the end
+    return registry.get(
+        ("orchestrator_stream", id(model)),
+        lambda: PromptTemplate.from_template(ORCHESTRATOR_PROMPT)
+        | model.bind(response_format=json_schema_response_format(TaskList)),
+        model,
+    )
+
+
+@traced(name="orchestrator_workers_pipelined")
+async def orchestrator_workers_pipelined(task: str) -> list[str]:
+    """Like `orchestrator_workers`, but each task is handed to a worker as soon as the
+    orchestrator has finished writing it, while the rest of the task list streams in."""
+    json_parser = StreamingJSONParser()
+    workers: list[asyncio.Task[str]] = []
+    try:
+        async for chunk in orchestrator_stream_chain().astream({"task": task}):
+            for event in json_parser.feed(str(chunk.content)):
+                if event["kind"] == "member" and event["key"] == "analysis":
+                    print("\n=== ORCHESTRATOR OUTPUT ===")
+                    print(f"\nAnalysis: {event['value']}")
+                elif event["kind"] == "item" and event["key"] == "tasks":
+                    print(f"\nTask: {json.dumps(event['value'], indent=2)}")
+                    workers.append(asyncio.create_task(run_task(event["value"])))
+        return await asyncio.gather(*workers)
+    finally:
+        # When the stream or one worker fails, or the caller is cancelled, the other
+        # workers are stopped rather than left running
+        await cancel_all(workers)
+
+
 async def main():
     task = """Write a product description for a new eco-friendly water bottle. 
     The target_audience is environmentally conscious millennials and key product
     features are: plastic-free, insulated, lifetime warranty
     """
-    tasks = await orchestrator_workers(task)
-    print("\n=== WORKER OUTPUT ===")
-    for task in tasks:
-        print(f"\nTask: {task}")
+    async for result in stream_orchestrator_workers(task):
+        print(f"\n=== WORKER OUTPUT ({result['task']['type']}) ===")
+        print(f"\nTask: {result['response']}")
 
 
 if __name__ == "__main__":
@@ -4,54 +4,62 @@
 # their answers are all sent to a final LLM call to be aggregated for the final answer.
 
 import asyncio
-from langchain_openai import ChatOpenAI
+import sys
+from pathlib import Path
 from langchain_core.output_parsers import StrOutputParser
-from langsmith import traceable
 from langchain_community.document_loaders import WebBaseLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_core.prompts import PromptTemplate
 from langchain_core.documents import Document
 from typing import List
 from dotenv import load_dotenv
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.clients import chat_model  # noqa: E402
+from shared.diagnostics import install_diagnostics  # noqa: E402
+from shared.registry import registry  # noqa: E402
+from shared.response_cache import install_response_cache  # noqa: E402
+from shared.tracing import traced  # noqa: E402
+
 load_dotenv()
+install_response_cache()
+install_diagnostics()
 
 # In this example, we are analyzing a lengthy document by dividing
 # it into sections and assigning each section to a separate LLM for summarization,
 # then combining the summaries into a comprehensive overview.
 
-model = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+model = chat_model(model="gpt-4o-mini", temperature=0)
 parser = StrOutputParser()
 
+SUMMARIZE_PROMPT = "Write a concise summary of the following: {chunk}"
 
-@traceable(name="summarize_chunk")
-async def summarize_chunk(document: Document) -> str:
-    prompt = PromptTemplate.from_template(
-        "Write a concise summary of the following: {chunk}"
-    )
-    chain = prompt | model | parser
-    return await chain.ainvoke({"chunk": document.page_content})
-
-
-@traceable(name="aggregate_summaries")
-async def aggregate_summaries(summaries: List[str]) -> str:
-    prompt = PromptTemplate.from_template(
-        """
+AGGREGATE_PROMPT = """
 The following is a set of summaries:
 {docs}
 Take these and distill it into a final, consolidated summary
 of the main themes.
 """
-    )
-    chain = prompt | model | parser
+
+
+@traced(name="summarize_chunk")
+async def summarize_chunk(document: Document) -> str:
+    chain = registry.prompt_chain(SUMMARIZE_PROMPT, model, parser)
+    return await chain.ainvoke({"chunk": document.page_content})
+
+
+@traced(name="aggregate_summaries")
+async def aggregate_summaries(summaries: List[str]) -> str:
+    chain = registry.prompt_chain(AGGREGATE_PROMPT, model, parser)
     return await chain.ainvoke({"docs": "\n\n".join(summaries)})
 
 
-@traceable(name="parallelization")
+@traced(name="parallelization")
 async def parallelization(url: str) -> str:
     """Create a workflow that uses multiple LLMs to analyze a URL and return a summary of the content."""
     loader = WebBaseLoader(url)
-    docs = loader.load()
+    # The loader fetches the page synchronously, which would block the event loop
+    docs = await asyncio.to_thread(loader.load)
     text_splitter = RecursiveCharacterTextSplitter(chunk_size=5000, chunk_overlap=200)
     texts = text_splitter.split_documents(docs)
     # Gather and await all summary tasks
@@ -3,35 +3,103 @@
 # This sequential design allows for structured reasoning and step-by-step task completion.
 
 import asyncio
-from typing import List
-from langchain_openai import ChatOpenAI
+import sys
+from pathlib import Path
+from typing import List, Optional
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage
-from langsmith import traceable
 from dotenv import load_dotenv
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.clients import chat_model  # noqa: E402
+from shared.compaction import (  # noqa: E402
+    HISTORY_TOKEN_BUDGET,
+    format_steps,
+    stale_step_count,
+    summary_messages,
+)
+from shared.diagnostics import install_diagnostics  # noqa: E402
+from shared.registry import registry  # noqa: E402
+from shared.response_cache import install_response_cache  # noqa: E402
+from shared.tracing import traced  # noqa: E402
+
 load_dotenv()
+install_response_cache()
+install_diagnostics()
 
-model = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+model = chat_model(model="gpt-4o-mini", temperature=0)
 parser = StrOutputParser()
 
+SYSTEM_PROMPT = "You are a helpful assistant that can solve math problems."
+
+HISTORY_SUMMARY_PROMPT = """Summarize the earlier steps of the conversation below, so that the next steps can be completed without them.
+Keep every number, intermediate result and conclusion.
+
+Summary so far:
+{summary}
+
+Earlier steps:
+{steps}"""
+
+
+async def compact_history(
+    summary: Optional[str],
+    steps: List[List[BaseMessage]],
+    token_budget: int,
+    summarize: bool,
+) -> tuple[Optional[str], List[List[BaseMessage]]]:
+    """Fold the oldest steps into the summary (or drop them) once past `token_budget`."""
+    count = stale_step_count(steps, model.get_num_tokens, token_budget)
+    if not count:
+        return summary, steps
+    stale, steps = steps[:count], steps[count:]
+    print(f"Compacting {len(stale)} steps")
+    if summarize:
+        chain = registry.prompt_chain(HISTORY_SUMMARY_PROMPT, model, parser)
+        summary = await chain.ainvoke(
+            {"summary": summary or "(none)", "steps": format_steps(stale)}
+        )
+    return summary, steps
+
+
+@traced(name="prompt_chaining")
+async def prompt_chaining(
+    input_query: str,
+    prompts: List[str],
+    token_budget: Optional[int] = HISTORY_TOKEN_BUDGET,
+    summarize: bool = True,
+) -> str:
+    """Run the prompts one after another, each seeing the responses so far.
 
-@traceable(name="prompt_chaining")
-async def prompt_chaining(input_query: str, prompts: List[str]) -> str:
+    Once the history grows past `token_budget` tokens, the oldest steps are summarized
+    (or dropped, with `summarize=False`); `None` keeps the whole history. The prompt
+    starts with the system message and the query, which never change, then the
+    summary, which changes only when compacting, and then the steps in order, so
+    consecutive calls share a long prefix for the provider's prompt cache.
+    """
     response_chain = []
-    messages: List[BaseMessage] = [
-        SystemMessage(
-            content="You are a helpful assistant that can solve math problems."
-        ),
+    prefix: List[BaseMessage] = [
+        SystemMessage(content=SYSTEM_PROMPT),
         HumanMessage(content=input_query),
     ]
-    response = input_query
+    summary: Optional[str] = None
+    steps: List[List[BaseMessage]] = []
+    chain = registry.chain(model, parser)
     for i, prompt in enumerate(prompts):
         print(f"Step {i+1}")
-        messages.append(HumanMessage(content=prompt))
-        chain = model | parser
+        if token_budget is not None:
+            summary, steps = await compact_history(
+                summary, steps, token_budget, summarize
+            )
+        messages = [
+            *prefix,
+            *summary_messages(summary),
+            *(message for step in steps for message in step),
+            HumanMessage(content=prompt),
+        ]
         response = await chain.ainvoke(messages)
-        messages.append(AIMessage(content=response))
+        steps.append([HumanMessage(content=prompt), AIMessage(content=response)])
         response_chain.append(response)
         print(f"Response: {response}")
     return response_chain[-1]
@@ -1,12 +1,19 @@
 from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langsmith import traceable
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+
+from shared.clients import chat_model, openai_embeddings  # noqa: E402
+from shared.response_cache import install_response_cache  # noqa: E402
+from shared.tracing import traced  # noqa: E402
+
+install_response_cache()
 
 # 埋め込みモデルの初期化
-embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+embeddings = openai_embeddings(model="text-embedding-3-small")
 
 # Chromaベクターストアの作成
 vectorstore = Chroma(
@@ -24,7 +31,7 @@ retriever = vectorstore.as_retriever(
 # result = retriever.invoke("AIエージェントとは何ですか？")
 # print(result)
 # LLMの初期化
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.0)
+llm = chat_model(model="gpt-4o-mini", temperature=0.0)
 
 # プロンプトテンプレート
 prompt = ChatPromptTemplate.from_messages(
@@ -42,7 +49,7 @@ rag_chain = prompt | llm | StrOutputParser()
 
 
 # 質問への回答
-@traceable(name="ask_question")
+@traced(name="ask_question")
 def ask_question(question):
     documents = retriever.invoke(question)
     response = rag_chain.invoke(
@@ -55,5 +62,6 @@ def ask_question(question):
 
 
 # 使用例
-print(ask_question("AIエージェントとは何ですか？"))
-print(ask_question("プロンプトエンジニアリングの基本的な戦略は？"))
+if __name__ == "__main__":
+    print(ask_question("AIエージェントとは何ですか？"))
+    print(ask_question("プロンプトエンジニアリングの基本的な戦略は？"))
@@ -1,8 +1,13 @@
 from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
 from langchain_community.document_loaders import WebBaseLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_docling import DoclingLoader
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+
+from shared.clients import openai_embeddings  # noqa: E402
 
 # 1. ドキュメントの読み込み
 urls = [
@@ -18,7 +23,7 @@ text_splitter = RecursiveCharacterTextSplitter(chunk_size=5000, chunk_overlap=10
 doc_splits = text_splitter.split_documents(docs)
 
 # 埋め込みモデルの初期化
-embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+embeddings = openai_embeddings(model="text-embedding-3-small")
 
 # Chromaベクターストアの作成
 # FAISS
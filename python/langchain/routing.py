@@ -1,17 +1,47 @@
 # https://www.agentrecipes.com/routing
 # Conditional Router Agent Workflow
 from typing import Annotated
-from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_openai import ChatOpenAI
-from typing import TypedDict, List
+from typing import TypedDict, List, Optional
 import asyncio
-from langsmith import traceable
+import sys
+from pathlib import Path
 from dotenv import load_dotenv
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.batching import split_by_token_budget  # noqa: E402
+from shared.cascade import Cascade  # noqa: E402
+from shared.clients import chat_model  # noqa: E402
+from shared.diagnostics import install_diagnostics  # noqa: E402
+from shared.registry import registry  # noqa: E402
+from shared.response_cache import install_response_cache  # noqa: E402
+from shared.tracing import traced  # noqa: E402
+
 load_dotenv()
+install_response_cache()
+install_diagnostics()
+
+model = chat_model(model="gpt-4o-mini", temperature=0)
+parser = StrOutputParser()
+
+ROUTER_PROMPT = """Given a user prompt/query: {user_query}, select the best option out of the following routes:
+{routes}. Answer only in JSON format."""
+
+BATCH_ROUTER_PROMPT = """For each of the numbered user prompts/queries below, select the best option out of the following routes:
+{routes}
+
+Queries:
+{user_queries}
 
-model = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+Return exactly one route per query, using the query's number as its index. Answer only in JSON format."""
+
+# Token budget for the queries packed into a single batch routing call
+BATCH_TOKEN_BUDGET = 2000
+# Routes sampled from a cheaper model, which must all agree (see shared/cascade.py)
+CASCADE_SAMPLES = 3
+
+router_cascade = Cascade("route")
 
 
 class Assistant:
@@ -28,8 +58,7 @@ class Assistant:
 
     async def run(self, input_query: str) -> str:
         messages = [("system", self.system_prompt), ("user", input_query)]
-        parser = StrOutputParser()
-        chain = model | parser
+        chain = registry.chain(model, parser)
         response = await chain.ainvoke(messages)
         return response
 
@@ -43,61 +72,153 @@ class RouterSchema(TypedDict):
     ]
 
 
+class IndexedRoute(TypedDict):
+    """A route selected for one query of a batch."""
+
+    index: Annotated[int, ..., "The number of the query this route is for"]
+    reason: Annotated[str, ..., "The reason for selecting the route"]
+    route: Annotated[
+        str, ..., "The route selected. Must be one of the ids in the list of routes."
+    ]
+
+
+class BatchRouterSchema(TypedDict):
+    """A schema for routing several queries in a single call."""
+
+    routes: Annotated[list[IndexedRoute], ..., "One route for each query"]
+
+
 class RouterWorkflow:
     """A workflow that routes a task to the assistant best suited for the task."""
 
     def __init__(self, assistants: List[Assistant]):
         self.assistants = assistants
 
-    @traceable(name="routing")
-    async def run(self, input_query: str) -> str:
-        """Given a `input_query` and a dictionary of `routes` containing options and details for each.
-        Selects the best route for the task and return the response from the model.
-        """
-        ROUTER_PROMPT = """Given a user prompt/query: {user_query}, select the best option out of the following routes:
-        {routes}. Answer only in JSON format."""
-        prompt = PromptTemplate.from_template(ROUTER_PROMPT)
-        model_routes_str = "\n".join(
+    def _routes_str(self) -> str:
+        return "\n".join(
             [f"id: {v.id}, description: {v.description}" for v in self.assistants]
         )
-        chain = prompt | model.with_structured_output(
-            RouterSchema, method="json_schema", strict=True
+
+    def _get_assistant(self, route: str) -> Assistant:
+        profiles_dict = {profile.id: profile for profile in self.assistants}
+        assistant = profiles_dict.get(route)
+        if not assistant:
+            raise ValueError(f"Assistant with id {route} not found")
+        return assistant
+
+    async def route(self, input_query: str) -> RouterSchema:
+        """Select the best route for a single `input_query`."""
+        valid_ids = {assistant.id for assistant in self.assistants}
+
+        async def route(tier) -> RouterSchema:
+            chain = registry.structured_prompt_chain(
+                ROUTER_PROMPT, tier, RouterSchema, method="json_schema", strict=True
+            )
+            return await chain.ainvoke(
+                {"user_query": input_query, "routes": self._routes_str()}
+            )
+
+        return await router_cascade.run(
+            model,
+            route,
+            accept=lambda response: response["route"] in valid_ids,
+            samples=CASCADE_SAMPLES,
+            key=lambda response: response["route"],
+        )
+
+    async def _route_one_batch(self, input_queries: List[str]) -> List[RouterSchema]:
+        chain = registry.structured_prompt_chain(
+            BATCH_ROUTER_PROMPT,
+            model,
+            BatchRouterSchema,
+            method="json_schema",
+            strict=True,
+        )
+        user_queries = "\n".join(
+            f"{i}. {query}" for i, query in enumerate(input_queries)
         )
         response = await chain.ainvoke(
-            {"user_query": input_query, "routes": model_routes_str}
+            {"user_queries": user_queries, "routes": self._routes_str()}
         )
-        profiles_dict = {profile.id: profile for profile in self.assistants}
-        assistant = profiles_dict[response["route"]]
-        if not assistant:
-            raise ValueError(f"Assistant with id {response['route']} not found")
+        valid_ids = {assistant.id for assistant in self.assistants}
+        results: List[Optional[RouterSchema]] = [None] * len(input_queries)
+        for item in response["routes"]:
+            if 0 <= item["index"] < len(input_queries) and item["route"] in valid_ids:
+                results[item["index"]] = RouterSchema(
+                    reason=item["reason"], route=item["route"]
+                )
+        # Queries the model skipped or routed to an unknown id are routed one by one
+        missing = [i for i, result in enumerate(results) if result is None]
+        retried = await asyncio.gather(*[self.route(input_queries[i]) for i in missing])
+        for i, result in zip(missing, retried):
+            results[i] = result
+        return results  # type: ignore
+
+    @traced(name="route_batch")
+    async def route_batch(
+        self, input_queries: List[str], token_budget: int = BATCH_TOKEN_BUDGET
+    ) -> List[RouterSchema]:
+        """Select the best route for every query in `input_queries`.
+
+        Queries are packed into as few structured-output calls as the `token_budget` allows,
+        and the routes are returned in the same order as the queries.
+        """
+        batches = split_by_token_budget(
+            input_queries, model.get_num_tokens, token_budget
+        )
+        responses = await asyncio.gather(
+            *[self._route_one_batch(batch) for batch in batches]
+        )
+        return [route for batch in responses for route in batch]
+
+    @traced(name="routing")
+    async def run(self, input_query: str) -> str:
+        """Given a `input_query` and a dictionary of `routes` containing options and details for each.
+        Selects the best route for the task and return the response from the model.
+        """
+        response = await self.route(input_query)
+        assistant = self._get_assistant(response["route"])
         return await assistant.run(input_query)
 
+    @traced(name="routing_batch")
+    async def run_batch(self, input_queries: List[str]) -> List[str]:
+        """Route all `input_queries` with batched router calls and run the selected assistants."""
+        routes = await self.route_batch(input_queries)
+        return await asyncio.gather(
+            *[
+                self._get_assistant(route["route"]).run(input_query)
+                for input_query, route in zip(input_queries, routes)
+            ]
+        )
+
+
+ASSISTANTS = [
+    Assistant(
+        id="code_generation",
+        description="Suited for code generation",
+        system_prompt="You are a helpful assistant that generates code for a website",
+    ),
+    Assistant(
+        id="trip_planner",
+        description="Suited for trip planning",
+        system_prompt="You are a helpful assistant that plans trips",
+    ),
+    Assistant(
+        id="story_teller",
+        description="Suited for story telling",
+        system_prompt="You are a helpful assistant that tells stories",
+    ),
+]
+
 
 async def main():
-    assistants = [
-        Assistant(
-            id="code_generation",
-            description="Suited for code generation",
-            system_prompt="You are a helpful assistant that generates code for a website",
-        ),
-        Assistant(
-            id="trip_planner",
-            description="Suited for trip planning",
-            system_prompt="You are a helpful assistant that plans trips",
-        ),
-        Assistant(
-            id="story_teller",
-            description="Suited for story telling",
-            system_prompt="You are a helpful assistant that tells stories",
-        ),
-    ]
     tasks = [
         "Write a Python function to check if a number is prime.",
         "Plan a 2-week trip to Europe.",
         "Write a story about a brave knight and a dragon.",
     ]
-    router = RouterWorkflow(assistants)
-    responses = await asyncio.gather(*[router.run(task) for task in tasks])
+    router = RouterWorkflow(ASSISTANTS)
+    responses = await router.run_batch(tasks)
     return responses
 
 
@@ -1,11 +1,22 @@
-from langchain_openai import ChatOpenAI
 from langchain_ollama.chat_models import ChatOllama
 from langchain.schema import HumanMessage, SystemMessage
 from langchain.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from typing import TypedDict, Annotated
+from typing import Iterator, TypedDict, Annotated
 import json
-from langsmith import traceable
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.clients import chat_model  # noqa: E402
+from shared.registry import registry  # noqa: E402
+from shared.streaming_json import (  # noqa: E402
+    json_schema_response_format,
+    stream_partial_objects,
+)
+from shared.tracing import traced  # noqa: E402
 
 
 class Ingredient(TypedDict):
@@ -20,16 +31,19 @@ class Recipe(TypedDict):
     instructions: Annotated[list[str], ..., "作り方"]
 
 
-@traceable(name="recipe_search")
+model = chat_model(model="gpt-4o-mini")
+# model = ChatOllama(model="qwen2.5-coder:1.5b")
+# Or both, with RECIPES_MODEL_POOL="https://api.openai.com/v1,ollama:qwen2.5-coder:1.5b"
+messages = ChatPromptTemplate.from_messages(
+    [
+        ("system", "あなたはプロ料理研究家です。"),
+        ("user", "{query}"),
+    ]
+)
+
+
+@traced(name="recipe_search")
 def main(query: str):
-    model = ChatOpenAI(model="gpt-4o-mini")
-    # model = ChatOllama(model="qwen2.5-coder:1.5b")
-    messages = ChatPromptTemplate.from_messages(
-        [
-            ("system", "あなたはプロ料理研究家です。"),
-            ("user", "{query}"),
-        ]
-    )
     model_with_structured_output = model.with_structured_output(Recipe)
 
     parser = StrOutputParser()
@@ -41,5 +55,24 @@ def main(query: str):
     print(json.dumps(result, indent=2, ensure_ascii=False))
 
 
+@traced(name="recipe_search_stream")
+def stream_recipe(query: str) -> Iterator[Recipe]:
+    """Yield the recipe as it is generated: each field, ingredient and instruction as
+    soon as it is complete. Fields not generated yet are missing."""
+    stream_chain = registry.get(
+        ("stream_recipe", id(messages), id(model), id(Recipe)),
+        lambda: messages
+        | model.bind(response_format=json_schema_response_format(Recipe)),
+        messages,
+        model,
+        Recipe,
+    )
+    for partial in stream_partial_objects(stream_chain.stream({"query": query})):
+        yield partial  # type: ignore
+
+
 if __name__ == "__main__":
-    main("子どもが好きな料理のレシピを教えてください。")
+    start = time.perf_counter()
+    for recipe in stream_recipe("子どもが好きな料理のレシピを教えてください。"):
+        print(f"{time.perf_counter() - start:.2f}s: {list(recipe)}")
+    print(json.dumps(recipe, indent=2, ensure_ascii=False))
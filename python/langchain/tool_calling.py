@@ -1,17 +1,37 @@
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage, BaseMessage, AIMessage
-from langchain_core.tools import tool
-from langsmith import traceable
+import asyncio
+import sys
+from pathlib import Path
+from typing import Hashable, Optional
+from langchain_core.messages import HumanMessage, BaseMessage, AIMessage, ToolMessage
+from langchain_core.messages.tool import ToolCall
+from langchain_core.tools import BaseTool, tool
 
-llm = ChatOpenAI(model="gpt-4o-mini")
+sys.path.append(str(Path(__file__).resolve().parents[1]))
 
+from shared.clients import chat_model  # noqa: E402
+from shared.diagnostics import install_diagnostics  # noqa: E402
+from shared.tool_cache import is_pure, pure, tool_cache  # noqa: E402
+from shared.tracing import traced  # noqa: E402
 
+install_diagnostics()
+
+llm = chat_model(model="gpt-4o-mini")
+
+# Rounds of tool calls before the model is made to answer without tools
+MAX_ROUNDS = 5
+# Seconds a tool call may take, by default and per tool name
+TOOL_TIMEOUT = 30.0
+TOOL_TIMEOUTS: dict[str, float] = {}
+
+
+@pure
 @tool
 def add(a: int, b: int) -> int:
     """Adds a and b."""
     return a + b
 
 
+@pure
 @tool
 def multiply(a: int, b: int) -> int:
     """Multiplies a and b."""
@@ -21,28 +41,107 @@ def multiply(a: int, b: int) -> int:
 tools = [add, multiply]
 
 llm_with_tools = llm.bind_tools(tools)
-
-
-@traceable(name="tool_calling")
-def main():
-    query = "What is 3 * 12? Also, what is 11 + 49?"
-
+# Used for the last round, so the model answers with what it has
+llm_without_tool_use = llm.bind_tools(tools, tool_choice="none")
+
+
+async def run_tool_call(
+    tool_call: ToolCall, tools_by_name: dict[str, BaseTool]
+) -> ToolMessage:
+    """Run one tool call, returning failures and timeouts to the model as errors."""
+    name = tool_call["name"].lower()
+    selected_tool = tools_by_name.get(name)
+    if selected_tool is None:
+        return ToolMessage(
+            content=f"Error: unknown tool {name}",
+            tool_call_id=tool_call["id"],
+            status="error",
+        )
+    if not is_pure(selected_tool):
+        return await invoke_tool(selected_tool, tool_call)
+    # Pure tools' results are reused from earlier calls, of any session
+    message = await tool_cache.get_or_run(
+        name,
+        tool_call["args"],
+        lambda: invoke_tool(selected_tool, tool_call),
+        cacheable=lambda message: message.status != "error",
+    )
+    return message.model_copy(update={"tool_call_id": tool_call["id"]})
+
+
+async def invoke_tool(selected_tool: BaseTool, tool_call: ToolCall) -> ToolMessage:
+    timeout = TOOL_TIMEOUTS.get(selected_tool.name, TOOL_TIMEOUT)
+    try:
+        # Sync tools run in the default thread pool, so they do not block the loop.
+        # A timed out sync tool cannot be stopped, but its result is no longer awaited.
+        return await asyncio.wait_for(selected_tool.ainvoke(tool_call), timeout)
+    except asyncio.TimeoutError:
+        error = f"{selected_tool.name} timed out after {timeout}s"
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return ToolMessage(
+        content=f"Error: {error}", tool_call_id=tool_call["id"], status="error"
+    )
+
+
+async def run_tool_calls(
+    tool_calls: list[ToolCall], tools_by_name: dict[str, BaseTool]
+) -> list[ToolMessage]:
+    """Run a turn's tool calls concurrently, identical calls to pure tools only once."""
+
+    def call_key(tool_call: ToolCall) -> Hashable:
+        selected_tool = tools_by_name.get(tool_call["name"].lower())
+        if selected_tool is not None and is_pure(selected_tool):
+            return tool_cache.key(selected_tool.name, tool_call["args"])
+        return tool_call["id"]
+
+    keys = [call_key(call) for call in tool_calls]
+    unique: dict[Hashable, ToolCall] = {}
+    for key, call in zip(keys, tool_calls):
+        unique.setdefault(key, call)
+    tool_cache.deduplicated += len(tool_calls) - len(unique)
+    results = dict(
+        zip(
+            unique,
+            await asyncio.gather(
+                *[run_tool_call(call, tools_by_name) for call in unique.values()]
+            ),
+        )
+    )
+    # Every call still needs its own answer
+    return [
+        results[key].model_copy(update={"tool_call_id": call["id"]})
+        for key, call in zip(keys, tool_calls)
+    ]
+
+
+@traced(name="tool_calling")
+async def run_agent(query: str, max_rounds: Optional[int] = None) -> str:
+    """Answer `query`, running the tool calls of each turn concurrently until the
+    model stops calling tools, or for at most `max_rounds` rounds."""
+    max_rounds = MAX_ROUNDS if max_rounds is None else max_rounds
     messages: list[BaseMessage] = [HumanMessage(query)]
-
-    ai_msg = llm_with_tools.invoke(messages)
-
-    assert isinstance(ai_msg, AIMessage), "Expected AIMessage but got different type"
-    messages.append(ai_msg)
     tools_by_name = {t.name: t for t in tools}
-    for tool_call in ai_msg.tool_calls:
-        selected_tool = tools_by_name[tool_call["name"].lower()]
-        tool_msg = selected_tool.invoke(tool_call)
-        messages.append(tool_msg)
-
-    result = llm_with_tools.invoke(messages)
-
-    print(result.content)
+    for turn in range(max_rounds + 1):
+        model = llm_with_tools if turn < max_rounds else llm_without_tool_use
+        ai_msg = await model.ainvoke(messages)
+        assert isinstance(
+            ai_msg, AIMessage
+        ), "Expected AIMessage but got different type"
+        messages.append(ai_msg)
+        if not ai_msg.tool_calls:
+            break
+        print(f"Round {turn + 1}: {[call['name'] for call in ai_msg.tool_calls]}")
+        messages.extend(await run_tool_calls(ai_msg.tool_calls, tools_by_name))
+    return str(messages[-1].content)
+
+
+async def main():
+    query = "What is 3 * 12? Also, what is 11 + 49?"
+    result = await run_agent(query)
+    print(result)
+    print(tool_cache)
 
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
@@ -1,25 +1,80 @@
-from typing import TypedDict, Annotated
-from langchain_core.messages import BaseMessage, AIMessage, HumanMessage
-from langchain_openai import ChatOpenAI
+from typing import NotRequired, Optional, TypedDict, Annotated
+from langchain_core.messages import BaseMessage, AIMessage, HumanMessage, RemoveMessage
 from langgraph.graph import StateGraph, END
-from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
 from langgraph.graph.message import add_messages
 import asyncio
+import operator
+import sys
+from pathlib import Path
 from dotenv import load_dotenv
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.clients import chat_model  # noqa: E402
+from shared.compaction import fold_feedback  # noqa: E402
+from shared.convergence import (  # noqa: E402
+    code_converged,
+    code_hash,
+    score_plateaued,
+)
+from shared.diagnostics import install_diagnostics  # noqa: E402
+from shared.metrics import install_metrics, metrics  # noqa: E402
+from shared.patching import PatchError, apply_unified_diff  # noqa: E402
+from shared.registry import registry  # noqa: E402
+from shared.response_cache import install_response_cache  # noqa: E402
+from shared.sandbox import ExecutionEvaluator, TestCase  # noqa: E402
+from shared.usage import collect_token_usage  # noqa: E402
+
 load_dotenv()
+install_response_cache()
+install_metrics()
+install_diagnostics()
 
 # Initialize the model
-model = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+model = chat_model(model="gpt-4o-mini", temperature=0)
+
+# Callers that need more rounds pass `max_iterations`; the feedback window below only
+# fills up in such longer runs
+MAX_ITERATIONS = 2
+# Evaluation score at which the code is accepted
+SCORE_THRESHOLD = 80
+# Number of most recent feedbacks sent to the generator as they are.
+# Older feedbacks are folded into a running summary.
+FEEDBACK_WINDOW = 2
+
+
+class TokenUsage(TypedDict):
+    iteration: int
+    node: str
+    calls: int
+    input_tokens: int
+    output_tokens: int
 
 
 # Define the state
 class AgentState(TypedDict):
     messages: Annotated[list[BaseMessage], add_messages]
     task: str
-    feedbacks: Annotated[list[str], add_messages]
+    feedbacks: Annotated[list[BaseMessage], add_messages]
     code: str
     iteration_count: int
+    # None for MAX_ITERATIONS
+    max_iterations: NotRequired[Optional[int]]
+    score: NotRequired[int]
+    scores: Annotated[list[int], operator.add]
+    # When given, correctness and performance are checked by running these tests
+    test_cases: NotRequired[list[TestCase]]
+    # Memoize evaluations and stop once the code or the score stops changing
+    detect_convergence: NotRequired[bool]
+    converged: NotRequired[bool]
+    # Evaluations by normalized code hash
+    evaluations: NotRequired[dict[str, dict]]
+    # None keeps every feedback in the prompt
+    feedback_window: NotRequired[Optional[int]]
+    feedback_summary: NotRequired[str]
+    # Ask the generator for a diff against `code` instead of the whole file
+    patch_mode: NotRequired[bool]
+    token_usage: Annotated[list[TokenUsage], operator.add]
 
 
 # Prompt templates
@@ -57,24 +112,114 @@ class GenerateCodeOutput(TypedDict):
     code: Annotated[str, ..., "The code you generated"]
 
 
-# Node functions
-async def generate_code(state: AgentState):
-    message = ChatPromptTemplate.from_messages(
-        [("system", GENERATOR_PROMPT), ("human", "Feedbacks: {feedbacks}")]
+class GeneratePatchOutput(TypedDict):
+    thoughts: Annotated[
+        str,
+        ...,
+        "Your understanding of the task and feedback and how you plan to improve",
+    ]
+    patch: Annotated[str, ..., "A unified diff against the current code"]
+
+
+PATCH_PROMPT = """Current code:
+{code}
+
+Feedbacks: {feedbacks}
+
+Return your changes as a unified diff against the current code, not the whole file.
+Use `@@ -start,count +start,count @@` hunks with 3 lines of unchanged context around every change."""
+
+
+def format_feedbacks(state: AgentState) -> str:
+    parts = []
+    if state.get("feedback_summary"):
+        parts.append(f"\nSummary of earlier feedback: {state['feedback_summary']}")
+    parts.extend(f"\nFeedback: {feedback.content}" for feedback in state["feedbacks"])
+    return "\n".join(parts)
+
+
+def usage_record(node: str, iteration: int, usage) -> TokenUsage:
+    return TokenUsage(
+        iteration=iteration,
+        node=node,
+        calls=usage.calls,
+        input_tokens=usage.input_tokens,
+        output_tokens=usage.output_tokens,
     )
-    # Prepare the generation prompt
-    generation_chain = message | model.with_structured_output(
-        GenerateCodeOutput, method="json_schema", strict=True
+
+
+# Node functions
+async def compact_feedback(state: AgentState):
+    """Fold the feedbacks that fell out of the window into `feedback_summary`."""
+    window = state.get("feedback_window", FEEDBACK_WINDOW)
+    feedbacks = state["feedbacks"]
+    if window is None or len(feedbacks) <= window:
+        return {}
+
+    # Folded without a model call, so that compaction adds no LLM calls to the loop
+    stale = feedbacks[: len(feedbacks) - window]
+    summary = fold_feedback(
+        state.get("feedback_summary"), [str(feedback.content) for feedback in stale]
     )
 
-    # Generate code
-    response = await generation_chain.ainvoke(
+    # The message log is trimmed to the same window, so old code blobs are dropped too
+    stale_messages = state["messages"][: max(len(state["messages"]) - 2 * window, 0)]
+    return {
+        "feedback_summary": summary,
+        "feedbacks": [RemoveMessage(id=feedback.id) for feedback in stale],  # type: ignore
+        "messages": [RemoveMessage(id=message.id) for message in stale_messages],  # type: ignore
+    }
+
+
+async def generate_patch(state: AgentState) -> Optional[GenerateCodeOutput]:
+    """Ask for a diff against the current code, or None if it does not apply."""
+    patch_chain = registry.structured_chat_prompt_chain(
+        [("system", GENERATOR_PROMPT), ("human", PATCH_PROMPT)],
+        model,
+        GeneratePatchOutput,
+        method="json_schema",
+        strict=True,
+    )
+    # The current code was written with the earlier feedback in front of it, so only
+    # the newest feedback is sent along with it
+    response = await patch_chain.ainvoke(
         {
             "task": state["task"],
-            "feedbacks": [f"\nFeedback: {feedback}" for feedback in state["feedbacks"]],
+            "feedbacks": f"\nFeedback: {state['feedbacks'][-1].content}",
             "code": state["code"],
         }
     )
+    try:
+        code = apply_unified_diff(state["code"], response["patch"])
+    except PatchError as e:
+        print(f"Patch did not apply ({e}), regenerating the whole file")
+        return None
+    return GenerateCodeOutput(thoughts=response["thoughts"], code=code)
+
+
+async def generate_code(state: AgentState):
+    # Prepare the generation prompt
+    generation_chain = registry.structured_chat_prompt_chain(
+        [("system", GENERATOR_PROMPT), ("human", "Feedbacks: {feedbacks}")],
+        model,
+        GenerateCodeOutput,
+        method="json_schema",
+        strict=True,
+    )
+
+    with collect_token_usage() as usage:
+        response = None
+        if state.get("patch_mode") and state["code"]:
+            response = await generate_patch(state)
+        if response is None:
+            # Generate code
+            response = await generation_chain.ainvoke(
+                {
+                    "task": state["task"],
+                    "feedbacks": format_feedbacks(state),
+                    "code": state["code"],
+                }
+            )
 
     # Prepare the new message with thoughts and code
     content = f"""
@@ -86,9 +231,19 @@ async def generate_code(state: AgentState):
         "messages": [AIMessage(content=content)],
         "code": response["code"],
         "iteration_count": state["iteration_count"] + 1,
+        "converged": state.get("detect_convergence", True)
+        and code_converged(state["code"], response["code"]),
+        "token_usage": [usage_record("generate", state["iteration_count"] + 1, usage)],
     }
 
 
+def after_generate(state: AgentState):
+    # Code that did not change does not need another evaluation
+    if state.get("converged"):
+        return END
+    return "evaluate"
+
+
 class EvaluateCodeOutput(TypedDict):
     feedback: Annotated[str, ..., "Detailed feedback on the code"]
     score: Annotated[
@@ -114,36 +269,91 @@ Only output JSON.
 {code}
 """
 
+# Used when correctness and performance are already checked by running tests
+STYLE_EVALUATOR_PROMPT = """
+Evaluate the style and best practices of this following code implementation.
+Its correctness and time complexity have already been verified by tests, so do not evaluate them.
 
-async def evaluate_code(state: AgentState):
+You should be evaluating only and not attempting to solve the task.
+
+Score should be between 0 and 100 where 100 is the highest score, and 0 is the lowest score.
 
-    message = PromptTemplate.from_template(EVALUATOR_PROMPT)
+Provide detailed feedback if there are areas that need improvement. You should specify what needs improvement and why.
+
+Only output JSON.
+{code}
+"""
+
+
+async def evaluate_with_tests(state: AgentState) -> EvaluateCodeOutput:
+    execution = await ExecutionEvaluator(state["test_cases"]).score(state["code"])
+    if execution["score"] < 100:
+        # Failing tests cap the score at 50, so the loop never ends on incorrect code
+        return EvaluateCodeOutput(
+            feedback=execution["feedback"], score=execution["score"] // 2
+        )
+
+    style_chain = registry.structured_prompt_chain(
+        STYLE_EVALUATOR_PROMPT,
+        model,
+        EvaluateCodeOutput,
+        method="json_schema",
+        strict=True,
+    )
+    response = await style_chain.ainvoke({"code": state["code"]})
+    return EvaluateCodeOutput(
+        feedback=f"{execution['feedback']}\n\n{response['feedback']}",
+        score=response["score"],
+    )
+
+
+async def evaluate_with_model(state: AgentState) -> EvaluateCodeOutput:
     # Prepare the evaluation chain
-    evaluation_chain = message | model.with_structured_output(
-        EvaluateCodeOutput, method="json_schema", strict=True
+    evaluation_chain = registry.structured_prompt_chain(
+        EVALUATOR_PROMPT, model, EvaluateCodeOutput, method="json_schema", strict=True
     )
 
     # Evaluate the code
     response = await evaluation_chain.ainvoke({"code": state["code"]})
+    return EvaluateCodeOutput(feedback=response["feedback"], score=response["score"])
+
+
+async def evaluate_code(state: AgentState):
+    evaluate = evaluate_with_tests if state.get("test_cases") else evaluate_with_model
+    evaluations = state.get("evaluations") or {}
+    key = code_hash(state["code"])
+
+    with collect_token_usage() as usage:
+        if state.get("detect_convergence", True) and key in evaluations:
+            # The same code was already evaluated in an earlier iteration
+            response = evaluations[key]
+        else:
+            response = await evaluate(state)
 
     return {
         "messages": [HumanMessage(content=response["feedback"])],
         "score": response["score"],
+        "scores": [response["score"]],
         "feedbacks": [response["feedback"]],
+        "evaluations": {**evaluations, key: response},
+        "token_usage": [usage_record("evaluate", state["iteration_count"], usage)],
     }
 
 
 # Routing function
 def should_continue(state: AgentState):
     # Check iteration count
-    if state["iteration_count"] >= 2:
+    if state["iteration_count"] >= (state.get("max_iterations") or MAX_ITERATIONS):
         return END
     # Check evaluation result
     score = state.get("score", 0)  # Get evaluation score with default 0
-    if isinstance(score, (int, float)) and score >= 80:
+    if isinstance(score, (int, float)) and score >= SCORE_THRESHOLD:
+        return END
+    # Stop when further iterations are no longer improving the score
+    if state.get("detect_convergence", True) and score_plateaued(state["scores"]):
         return END
 
-    return "generate"
+    return "compact_feedback"
 
 
 # Workflow setup
@@ -153,25 +363,75 @@ workflow = StateGraph(AgentState)
 # Add nodes
 workflow.add_node("generate", generate_code)
 workflow.add_node("evaluate", evaluate_code)
+workflow.add_node("compact_feedback", compact_feedback)
 
 # Add edges
 workflow.set_entry_point("generate")
-workflow.add_edge("generate", "evaluate")
+workflow.add_conditional_edges("generate", after_generate)
 
 workflow.add_conditional_edges(
     "evaluate",
     should_continue,
 )
-agent = workflow.compile()
-
-
-async def create_evaluator_optimizer_workflow(task: str):
-    response = await agent.ainvoke(
-        {"code": "", "iteration_count": 0, "task": task, "feedbacks": []}
+workflow.add_edge("compact_feedback", "generate")
+agent = workflow.compile().with_config(run_name="evaluator_optimizer")
+
+
+async def run_evaluator_optimizer(
+    task: str,
+    test_cases: Optional[list[TestCase]] = None,
+    detect_convergence: bool = True,
+    feedback_window: Optional[int] = FEEDBACK_WINDOW,
+    patch_mode: bool = False,
+    max_iterations: Optional[int] = None,
+) -> AgentState:
+    """Run the workflow and return its final state."""
+    return await agent.ainvoke(
+        {
+            "code": "",
+            "iteration_count": 0,
+            "max_iterations": max_iterations,
+            "task": task,
+            "feedbacks": [],
+            "scores": [],
+            "test_cases": test_cases or [],
+            "detect_convergence": detect_convergence,
+            "evaluations": {},
+            "feedback_window": feedback_window,
+            "patch_mode": patch_mode,
+            "token_usage": [],
+        }
+    )  # type: ignore
+
+
+async def create_evaluator_optimizer_workflow(
+    task: str,
+    test_cases: Optional[list[TestCase]] = None,
+    detect_convergence: bool = True,
+    feedback_window: Optional[int] = FEEDBACK_WINDOW,
+    patch_mode: bool = False,
+    max_iterations: Optional[int] = None,
+):
+    response = await run_evaluator_optimizer(
+        task,
+        test_cases,
+        detect_convergence,
+        feedback_window,
+        patch_mode,
+        max_iterations,
     )
     return response["code"]
 
 
+def print_token_usage(token_usage: list[TokenUsage]):
+    print(f"{'iteration':>9}  {'node':<18}{'calls':>6}{'prompt':>9}{'completion':>12}")
+    for record in token_usage:
+        print(
+            f"{record['iteration']:>9}  {record['node']:<18}{record['calls']:>6}"
+            f"{record['input_tokens']:>9}{record['output_tokens']:>12}"
+        )
+
+
 async def main():
     task = """
     Implement a Stack with:
@@ -179,9 +439,28 @@ async def main():
     2. pop()
     3. getMin()
     All operations should be O(1).
+    The class should be named `Stack`.
     """
-    response = await create_evaluator_optimizer_workflow(task)
-    print(response)
+    # Correctness and complexity are checked by running these, the model only reviews style
+    test_cases: list[TestCase] = [
+        {
+            "name": "push_pop",
+            "code": "s = Stack()\ns.push(3)\ns.push(1)\nassert s.pop() == 1\nassert s.pop() == 3",
+        },
+        {
+            "name": "get_min",
+            "code": "s = Stack()\nfor x in [5, 2, 8, 1]:\n    s.push(x)\nassert s.getMin() == 1\ns.pop()\nassert s.getMin() == 2",
+        },
+        {
+            "name": "get_min_is_constant_time",
+            "code": "s = Stack()\nfor x in range(100000, 0, -1):\n    s.push(x)\nfor _ in range(100000):\n    s.getMin()",
+            "max_seconds": 1.0,
+        },
+    ]
+    response = await run_evaluator_optimizer(task, test_cases, patch_mode=True)
+    print(response["code"])
+    print_token_usage(response["token_usage"])
+    print(metrics.summary())
 
 
 if __name__ == "__main__":
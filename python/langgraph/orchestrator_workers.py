@@ -4,17 +4,39 @@
 # then processed in parallel by multiple worker LLMs. Finally, the orchestrator
 # LLM synthesizes the workers' outputs into the final result.
 from dotenv import load_dotenv
-from langchain_core.prompts import PromptTemplate
-from typing import Annotated, List, TypedDict, Literal
-from langchain_openai import ChatOpenAI
+from typing import (
+    Annotated,
+    AsyncIterator,
+    List,
+    Literal,
+    NotRequired,
+    Optional,
+    TypedDict,
+)
 from langgraph.constants import Send
 from langchain_core.output_parsers import StrOutputParser
 from langgraph.graph import StateGraph, END
 import asyncio
+import functools
 import operator
-from langsmith import traceable
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.batching import split_by_token_budget  # noqa: E402
+from shared.clients import chat_model  # noqa: E402
+from shared.diagnostics import install_diagnostics  # noqa: E402
+from shared.metrics import install_metrics, metrics  # noqa: E402
+from shared.registry import registry  # noqa: E402
+from shared.resilience import ResilientNode  # noqa: E402
+from shared.response_cache import install_response_cache  # noqa: E402
+from shared.tracing import traced  # noqa: E402
 
 load_dotenv()
+install_response_cache()
+install_metrics()
+install_diagnostics()
 
 
 class Task(TypedDict):
@@ -30,6 +52,19 @@ class TaskList(TypedDict):
     tasks: Annotated[List[Task], ..., "The approaches to tackle the task"]
 
 
+class WorkerResult(TypedDict):
+    task: Task
+    response: str
+
+
+class BatchStats(TypedDict):
+    """How many calls and prompt tokens one batch of tasks took, and saved."""
+
+    tasks: int
+    calls: int
+    prompt_tokens_saved: int
+
+
 class WorkflowState(TypedDict):
     """State for the orchestrator workflow."""
 
@@ -37,9 +72,14 @@ class WorkflowState(TypedDict):
     tasks: List[Task]
     analysis: str
     responses: Annotated[List[str], operator.add]
+    # The responses again, each with the task it was generated for
+    results: Annotated[List[WorkerResult], operator.add]
+    # Generate the responses of several tasks in one call
+    batch_tasks: NotRequired[bool]
+    batch_stats: Annotated[List[BatchStats], operator.add]
 
 
-model = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+model = chat_model(model="gpt-4o-mini", temperature=0)
 parser = StrOutputParser()
 
 
@@ -63,12 +103,11 @@ Return only JSON output.
 """
 
 
-@traceable(name="analyze_task")
+@traced(name="analyze_task")
 async def analyze_task(state: WorkflowState):
     """Analyze the task and break it down into subtasks."""
-    prompt = PromptTemplate.from_template(ORCHESTRATOR_PROMPT)
-    chain = prompt | model.with_structured_output(
-        TaskList, method="json_schema", strict=True
+    chain = registry.structured_prompt_chain(
+        ORCHESTRATOR_PROMPT, model, TaskList, method="json_schema", strict=True
     )
     response = await chain.ainvoke({"task": state["input"]})
     return {
@@ -78,6 +117,11 @@ async def analyze_task(state: WorkflowState):
     }
 
 
+# Bounds how many worker calls run at once, and retries the ones that hit rate
+# limits, server errors or timeouts instead of failing the whole run
+worker_guard = ResilientNode(max_in_flight=8, max_attempts=4, timeout=60)
+
+
 class ProcessTaskState(TypedDict):
     task: Task
     original_task: str
@@ -94,11 +138,10 @@ Return only your response:
 """
 
 
-@traceable(name="process_task")
+@traced(name="process_task")
 async def process_task(state: ProcessTaskState):
     """Process all tasks in parallel."""
-    prompt = PromptTemplate.from_template(WORKER_PROMPT)
-    chain = prompt | model | parser
+    chain = registry.prompt_chain(WORKER_PROMPT, model, parser)
     task: Task = state["task"]
     response = await chain.ainvoke(
         {
@@ -107,16 +150,147 @@ async def process_task(state: ProcessTaskState):
             "task_description": task["description"],
         }
     )
+    return {
+        "responses": [response],
+        "results": [WorkerResult(task=task, response=response)],
+    }
 
-    print("\n=== WORKER OUTPUT ===")
-    print(f"\nTask: {response}")
-    return {"responses": [response]}
+
+BATCH_WORKER_PROMPT = """
+Generate content for each of the numbered approaches below, all for the same task.
+Task: {original_task}
+
+Approaches:
+{tasks}
+
+For each approach, return its number and your response, maintaining the specified style and fully addressing requirements.
+"""
+
+# Tasks are batched until their guidelines add up to this many tokens. The responses
+# of a batch are generated one after another, so batches are also capped in size.
+BATCH_TOKEN_BUDGET = 1000
+BATCH_MAX_TASKS = 5
+
+
+class IndexedResponse(TypedDict):
+    index: Annotated[int, ..., "The number of the approach this response is for"]
+    response: Annotated[str, ..., "The content generated for the approach"]
+
+
+class BatchWorkerOutput(TypedDict):
+    responses: Annotated[List[IndexedResponse], ..., "One response per approach"]
+
+
+class ProcessBatchState(TypedDict):
+    tasks: List[Task]
+    original_task: str
+
+
+def format_batch_tasks(tasks: List[Task]) -> str:
+    return "\n".join(
+        f"{i}. Style: {task['type']}\nGuidelines: {task['description']}"
+        for i, task in enumerate(tasks)
+    )
+
+
+def worker_prompt_tokens(task: Task, original_task: str) -> int:
+    prompt = WORKER_PROMPT.format(
+        original_task=original_task,
+        task_type=task["type"],
+        task_description=task["description"],
+    )
+    return model.get_num_tokens(prompt)
+
+
+def batch_stats(
+    tasks: List[Task], original_task: str, batch_prompt: str, missing: List[int]
+) -> BatchStats:
+    # Tokenizing is CPU-bound, so this runs in a thread, and each prompt is counted once
+    individual = [worker_prompt_tokens(task, original_task) for task in tasks]
+    return BatchStats(
+        tasks=len(tasks),
+        calls=1 + len(missing),
+        prompt_tokens_saved=sum(individual)
+        - model.get_num_tokens(batch_prompt)
+        - sum(individual[i] for i in missing),
+    )
+
+
+@traced(name="process_batch")
+async def process_batch(state: ProcessBatchState):
+    """Process several tasks with one call, falling back to one call per task."""
+    tasks, original_task = state["tasks"], state["original_task"]
+    chain = registry.structured_prompt_chain(
+        BATCH_WORKER_PROMPT, model, BatchWorkerOutput, method="json_schema", strict=True
+    )
+    prompt = {"original_task": original_task, "tasks": format_batch_tasks(tasks)}
+    responses: List[Optional[str]] = [None] * len(tasks)
+    try:
+        # A single attempt: if it fails, only the tasks are retried, one call each,
+        # rather than the whole batch
+        output = await worker_guard.run(lambda: chain.ainvoke(prompt), max_attempts=1)
+        for item in output["responses"]:
+            if 0 <= item["index"] < len(tasks):
+                responses[item["index"]] = item["response"]
+    except Exception as e:
+        # ValueError includes OutputParserException, when the output does not match
+        # the schema; other errors, like a rejected API key, would fail every call
+        if not isinstance(e, ValueError) and not worker_guard.retryable(e):
+            raise
+        print(f"\nBatch of {len(tasks)} tasks failed ({e!r}), processing one by one")
+
+    # Tasks the model skipped are processed on their own
+    missing = [i for i, response in enumerate(responses) if response is None]
+    retried = await asyncio.gather(
+        *[
+            worker_guard.run(
+                functools.partial(
+                    process_task, {"task": tasks[i], "original_task": original_task}
+                )
+            )
+            for i in missing
+        ]
+    )
+    for i, update in zip(missing, retried):
+        responses[i] = update["responses"][0]
+
+    stats = await asyncio.to_thread(
+        batch_stats,
+        tasks,
+        original_task,
+        BATCH_WORKER_PROMPT.format(**prompt),
+        missing,
+    )
+    return {
+        "responses": responses,
+        "results": [
+            WorkerResult(task=task, response=response)  # type: ignore
+            for task, response in zip(tasks, responses)
+        ],
+        "batch_stats": [stats],
+    }
 
 
 def map_tasks(state: WorkflowState):
+    original_task = state["input"]
+    if not state.get("batch_tasks"):
+        return [
+            Send("process", {"task": task, "original_task": original_task})
+            for task in state["tasks"]
+        ]
+    batches = split_by_token_budget(
+        state["tasks"],
+        lambda task: model.get_num_tokens(task["description"]),
+        BATCH_TOKEN_BUDGET,
+        max_items=BATCH_MAX_TASKS,
+    )
     return [
-        Send("process", {"task": task, "original_task": state["input"]})
-        for task in state["tasks"]
+        (
+            Send("process_batch", {"tasks": batch, "original_task": original_task})
+            if len(batch) > 1
+            else Send("process", {"task": batch[0], "original_task": original_task})
+        )
+        for batch in batches
     ]
 
 
@@ -125,36 +299,63 @@ workflow = StateGraph(WorkflowState)
 
 # Add nodes
 workflow.add_node("analyze", analyze_task)
-workflow.add_node("process", process_task)
+workflow.add_node("process", worker_guard(process_task))
+# Not guarded as a whole: its calls are, and it falls back to one call per task
+workflow.add_node("process_batch", process_batch)
 # Add edges
 workflow.set_entry_point("analyze")
-workflow.add_conditional_edges("analyze", map_tasks, ["process"])
+workflow.add_conditional_edges("analyze", map_tasks, ["process", "process_batch"])
 workflow.add_edge("process", END)
+workflow.add_edge("process_batch", END)
 
 # Compile the workflow
-agent = workflow.compile()
+agent = workflow.compile().with_config(run_name="orchestrator_workers")
 
 
-async def orchestrator_workers(task: str) -> list[str]:
+async def orchestrator_workers(task: str, batch_tasks: bool = False) -> list[str]:
     """Run the orchestrator workflow."""
     response = await agent.ainvoke(
         {
-            "task": task,
-        },
-        debug=True,
+            "input": task,
+            "batch_tasks": batch_tasks,
+        }
     )
+    if batch_tasks:
+        print_batch_stats(response.get("batch_stats", []))
     return response["responses"]
 
 
+async def stream_orchestrator_workers(
+    task: str, batch_tasks: bool = False
+) -> AsyncIterator[WorkerResult]:
+    """Yield each worker's result, with its task, as soon as its `process` node finishes."""
+    async for update in agent.astream(
+        {"input": task, "batch_tasks": batch_tasks}, stream_mode="updates"
+    ):
+        for node in ("process", "process_batch"):
+            for result in (update.get(node) or {}).get("results", []):
+                yield result
+
+
+def print_batch_stats(batch_stats: List[BatchStats]):
+    tasks = sum(stats["tasks"] for stats in batch_stats)
+    calls = sum(stats["calls"] for stats in batch_stats)
+    saved = sum(stats["prompt_tokens_saved"] for stats in batch_stats)
+    print(
+        f"\nBatched {tasks} tasks into {calls} calls: "
+        f"{tasks - calls} calls and ~{saved} prompt tokens saved"
+    )
+
+
 async def main():
     task = """Write a product description for a new eco-friendly water bottle. 
     The target_audience is environmentally conscious millennials and key product
     features are: plastic-free, insulated, lifetime warranty
     """
-    responses = await orchestrator_workers(task)
-    print("\n=== FINAL OUTPUT ===")
-    for response in responses:
-        print(f"\nResponse: {response}")
+    async for result in stream_orchestrator_workers(task):
+        print(f"\n=== FINAL OUTPUT ({result['task']['type']}) ===")
+        print(f"\nResponse: {result['response']}")
+    print(metrics.summary())
 
 
 if __name__ == "__main__":
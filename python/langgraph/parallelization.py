@@ -8,16 +8,29 @@ from langchain.chains.combine_documents.reduce import (
 from langchain_core.documents import Document
 from langgraph.constants import Send
 from langgraph.graph import END, START, StateGraph
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_community.document_loaders import WebBaseLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langsmith import traceable
 import asyncio
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.clients import chat_model  # noqa: E402
+from shared.diagnostics import install_diagnostics  # noqa: E402
+from shared.metrics import install_metrics, metrics  # noqa: E402
+from shared.registry import registry  # noqa: E402
+from shared.resilience import ResilientNode  # noqa: E402
+from shared.response_cache import install_response_cache  # noqa: E402
+from shared.tracing import traced  # noqa: E402
+
+install_response_cache()
+install_metrics()
+install_diagnostics()
 
 token_max = 3000
-model = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+model = chat_model(model="gpt-4o-mini", temperature=0)
 
 
 # This will be the overall state of the main graph.
@@ -41,15 +54,20 @@ Take these and distill it into a final, consolidated summary
 of the main themes.
 """
 
-reduce_prompt = ChatPromptTemplate([("human", reduce_template)])
+reduce_messages = [("human", reduce_template)]
 
-reduce_chain = reduce_prompt | model | StrOutputParser()
+map_messages = [("human", "Write a concise summary of the following:\\n\\n{context}")]
 
-map_prompt = ChatPromptTemplate.from_messages(
-    [("human", "Write a concise summary of the following:\\n\\n{context}")]
-)
+parser = StrOutputParser()
 
-map_chain = map_prompt | model | StrOutputParser()
+
+# The chains are looked up on each call, so that they use the current `model`
+def reduce_chain():
+    return registry.chat_prompt_chain(reduce_messages, model, parser)
+
+
+def map_chain():
+    return registry.chat_prompt_chain(map_messages, model, parser)
 
 
 def length_function(documents: List[Document]) -> int:
@@ -65,7 +83,7 @@ class SummaryState(TypedDict):
 
 # Here we generate a summary, given a document
 async def generate_summary(state: SummaryState):
-    response = await map_chain.ainvoke({"context": state["content"]})
+    response = await map_chain().ainvoke({"context": state["content"]})
     return {"summaries": [response]}
 
 
@@ -93,21 +111,25 @@ async def collapse_summaries(state: OverallState):
     )
     results = []
     for doc_list in doc_lists:
-        results.append(await acollapse_docs(doc_list, reduce_chain.ainvoke))  # type: ignore
+        results.append(await acollapse_docs(doc_list, reduce_chain().ainvoke))  # type: ignore
 
     return {"collapsed_summaries": results}
 
 
 # Here we will generate the final summary
 async def generate_final_summary(state: OverallState):
-    response = await reduce_chain.ainvoke({"docs": state["collapsed_summaries"]})
+    response = await reduce_chain().ainvoke({"docs": state["collapsed_summaries"]})
     return {"final_summary": response}
 
 
+# Bounds how many summaries are generated at once, and retries the ones that hit rate
+# limits, server errors or timeouts instead of failing the whole run
+summary_guard = ResilientNode(max_in_flight=8, max_attempts=4, timeout=60)
+
 # Construct the graph
 # Nodes:
 graph = StateGraph(OverallState)
-graph.add_node("generate_summary", generate_summary)  # same as before
+graph.add_node("generate_summary", summary_guard(generate_summary))  # same as before
 graph.add_node("collect_summaries", collect_summaries)
 graph.add_node("collapse_summaries", collapse_summaries)
 graph.add_node("generate_final_summary", generate_final_summary)
@@ -119,13 +141,14 @@ graph.add_edge("collect_summaries", "collapse_summaries")
 graph.add_edge("collapse_summaries", "generate_final_summary")
 graph.add_edge("generate_final_summary", END)
 
-app = graph.compile(debug=True)
+app = graph.compile().with_config(run_name="parallelization")
 
 
-@traceable(name="parallelization")
+@traced(name="parallelization")
 async def parallelization(url: str) -> str:
     loader = WebBaseLoader(url)
-    docs = loader.load()
+    # The loader fetches the page synchronously, which would block the event loop
+    docs = await asyncio.to_thread(loader.load)
     text_splitter = RecursiveCharacterTextSplitter(chunk_size=5000, chunk_overlap=200)
     texts = text_splitter.split_documents(docs)
     result = await app.ainvoke({"contents": [text.page_content for text in texts]})
@@ -136,6 +159,7 @@ async def main():
     url = "https://lilianweng.github.io/posts/2023-06-23-agent/"
     summary = await parallelization(url)
     print(summary)
+    print(metrics.summary())
 
 
 if __name__ == "__main__":
@@ -1,63 +1,137 @@
 import asyncio
-from langchain_openai import ChatOpenAI
+import sys
+from pathlib import Path
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, RemoveMessage
 from langgraph.graph import StateGraph, END
 from langgraph.graph.message import add_messages
-from typing import TypedDict, Annotated, Literal
+from typing import NotRequired, Optional, TypedDict, Annotated, Literal
 from dotenv import load_dotenv
-from langsmith import traceable
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.clients import chat_model  # noqa: E402
+from shared.compaction import (  # noqa: E402
+    HISTORY_TOKEN_BUDGET,
+    format_steps,
+    stale_step_count,
+    summary_messages,
+)
+from shared.diagnostics import install_diagnostics  # noqa: E402
+from shared.metrics import install_metrics, metrics  # noqa: E402
+from shared.registry import registry  # noqa: E402
+from shared.response_cache import install_response_cache  # noqa: E402
+from shared.tracing import traced  # noqa: E402
 
 load_dotenv()
+install_response_cache()
+install_metrics()
+install_diagnostics()
 
-model = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+model = chat_model(model="gpt-4o-mini", temperature=0)
 parser = StrOutputParser()
 
 
+HISTORY_SUMMARY_PROMPT = """Summarize the earlier steps of the conversation below, so that the next steps can be completed without them.
+Keep every number, intermediate result and conclusion.
+
+Summary so far:
+{summary}
+
+Earlier steps:
+{steps}"""
+
+
 class State(TypedDict):
     prompts: list[str]
+    # The task, followed by the prompt and response of each step not yet compacted
     messages: Annotated[list[BaseMessage], add_messages]
     iteration_count: int
+    # Summary of the compacted steps
+    summary: NotRequired[str]
+    # Compact the steps past this many tokens (None keeps them all), by summarizing
+    # them or, with `summarize` False, by dropping them
+    token_budget: NotRequired[Optional[int]]
+    summarize: NotRequired[bool]
+
+
+async def compact_history(state: State):
+    """Remove the oldest steps from `messages` once they exceed the token budget."""
+    token_budget = state.get("token_budget", HISTORY_TOKEN_BUDGET)
+    if token_budget is None:
+        return {}
+    history = state["messages"][1:]
+    steps = [history[i : i + 2] for i in range(0, len(history), 2)]
+    count = stale_step_count(steps, model.get_num_tokens, token_budget)
+    if not count:
+        return {}
+
+    stale = steps[:count]
+    print(f"Compacting {count} steps")
+    stale_messages = [message for step in stale for message in step]
+    update: dict = {
+        "messages": [RemoveMessage(id=message.id) for message in stale_messages]  # type: ignore
+    }
+    if state.get("summarize", True):
+        chain = registry.prompt_chain(HISTORY_SUMMARY_PROMPT, model, parser)
+        update["summary"] = await chain.ainvoke(
+            {"summary": state.get("summary") or "(none)", "steps": format_steps(stale)}
+        )
+    return update
 
 
 async def call_llm(state: State):
-    print(f"Step {state['iteration_count'] + 1}")
     prompt = state["prompts"][state["iteration_count"]]
-    chat_messages = state["messages"].copy() + [HumanMessage(content=prompt)]
-    chain = model | parser
+    # The task and summary come first, so consecutive calls share a prefix
+    task, *history = state["messages"]
+    chat_messages = [
+        task,
+        *summary_messages(state.get("summary")),
+        *history,
+        HumanMessage(content=prompt),
+    ]
+    chain = registry.chain(model, parser)
     response = await chain.ainvoke(chat_messages)
-    print(f"Response: {response}")
     return {
         "messages": [HumanMessage(content=prompt), AIMessage(content=response)],
         "iteration_count": state["iteration_count"] + 1,
     }
 
 
-def should_continue(state: State) -> Literal["call_llm", END]:  # type: ignore
+def should_continue(state: State) -> Literal["compact_history", END]:  # type: ignore
     if state["iteration_count"] < len(state["prompts"]):
-        return "call_llm"
+        return "compact_history"
     else:
         return END
 
 
 graph = StateGraph(State)
+graph.add_node("compact_history", compact_history)
 graph.add_node("call_llm", call_llm)
-graph.set_entry_point("call_llm")
+graph.set_entry_point("compact_history")
+graph.add_edge("compact_history", "call_llm")
 graph.add_conditional_edges("call_llm", should_continue)
 graph.add_edge("call_llm", END)
-graph.compile()
-agent = graph.compile()
+agent = graph.compile().with_config(run_name="prompt_chaining")
 
 
-@traceable(name="prompt_chaining")
-async def prompt_chaining(task: str, prompts: list[str]) -> str:
+@traced(name="prompt_chaining")
+async def prompt_chaining(
+    task: str,
+    prompts: list[str],
+    token_budget: Optional[int] = HISTORY_TOKEN_BUDGET,
+    summarize: bool = True,
+) -> str:
     response = await agent.ainvoke(
         {
             "prompts": prompts,
             "messages": [HumanMessage(content=task)],
             "iteration_count": 0,
+            "token_budget": token_budget,
+            "summarize": summarize,
         },
-        debug=True,
+        # Two nodes run per prompt
+        {"recursion_limit": 2 * len(prompts) + 1},
     )
     return response["messages"][-1].content
 
@@ -71,6 +145,8 @@ async def main():
     ]
     response = await prompt_chaining(task, prompts)
     print(response)
+    print(metrics.summary())
 
 
-asyncio.run(main())
+if __name__ == "__main__":
+    asyncio.run(main())
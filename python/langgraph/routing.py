@@ -1,18 +1,32 @@
 # https://www.agentrecipes.com/routing
 # Conditional Router Agent Workflow
-from typing import Annotated, TypedDict
-from langchain_core.prompts import PromptTemplate
+from typing import Annotated, List, Optional, TypedDict
 from langchain_core.output_parsers import StrOutputParser
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import BaseMessage, AIMessage
 import asyncio
+import sys
+from pathlib import Path
 from dotenv import load_dotenv
-from langgraph.graph import StateGraph, END
+from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.batching import split_by_token_budget  # noqa: E402
+from shared.cascade import Cascade  # noqa: E402
+from shared.clients import chat_model  # noqa: E402
+from shared.diagnostics import install_diagnostics  # noqa: E402
+from shared.metrics import install_metrics, metrics  # noqa: E402
+from shared.registry import registry  # noqa: E402
+from shared.response_cache import install_response_cache  # noqa: E402
+
 load_dotenv()
+install_response_cache()
+install_metrics()
+install_diagnostics()
 
-model = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+model = chat_model(model="gpt-4o-mini", temperature=0)
+parser = StrOutputParser()
 
 # Define node descriptions for routing
 AVAILABLE_NODES = [
@@ -40,19 +54,64 @@ class RouterSchema(TypedDict):
     ]
 
 
+class IndexedRoute(TypedDict):
+    """A route selected for one query of a batch."""
+
+    index: Annotated[int, ..., "The number of the query this route is for"]
+    reason: Annotated[str, ..., "The reason for selecting the route"]
+    route: Annotated[
+        str, ..., "The route selected. Must be one of the ids in the list of routes."
+    ]
+
+
+class BatchRouterSchema(TypedDict):
+    """A schema for routing several queries in a single call."""
+
+    routes: Annotated[list[IndexedRoute], ..., "One route for each query"]
+
+
+ROUTER_PROMPT = """Given a user prompt/query: {user_query}, select the best option out of the following routes:
+{routes}. Answer only in JSON format."""
+
+BATCH_ROUTER_PROMPT = """For each of the numbered user prompts/queries below, select the best option out of the following routes:
+{routes}
+
+Queries:
+{user_queries}
+
+Return exactly one route per query, using the query's number as its index. Answer only in JSON format."""
+
+# Token budget for the queries packed into a single batch routing call
+BATCH_TOKEN_BUDGET = 2000
+# Routes sampled from a cheaper model, which must all agree (see shared/cascade.py)
+CASCADE_SAMPLES = 3
+
+router_cascade = Cascade("route_task")
+
+model_routes_str = "\n".join(
+    [f"id: {v['id']}, description: {v['description']}" for v in AVAILABLE_NODES]
+)
+
+
 async def route_task(state: RouterState):
     """Route the task to the appropriate node."""
-    ROUTER_PROMPT = """Given a user prompt/query: {user_query}, select the best option out of the following routes:
-    {routes}. Answer only in JSON format."""
-    prompt = PromptTemplate.from_template(ROUTER_PROMPT)
-    model_routes_str = "\n".join(
-        [f"id: {v['id']}, description: {v['description']}" for v in AVAILABLE_NODES]
-    )
-    chain = prompt | model.with_structured_output(
-        RouterSchema, method="json_schema", strict=True
-    )
-    response = await chain.ainvoke(
-        {"user_query": state["input_query"], "routes": model_routes_str}
+    valid_ids = {node["id"] for node in AVAILABLE_NODES}
+
+    async def route(tier) -> RouterSchema:
+        chain = registry.structured_prompt_chain(
+            ROUTER_PROMPT, tier, RouterSchema, method="json_schema", strict=True
+        )
+        return await chain.ainvoke(
+            {"user_query": state["input_query"], "routes": model_routes_str}
+        )
+
+    # A cheaper model's route is taken when its samples all agree on a known one
+    response = await router_cascade.run(
+        model,
+        route,
+        accept=lambda response: response["route"] in valid_ids,
+        samples=CASCADE_SAMPLES,
+        key=lambda response: response["route"],
     )
 
     return {
@@ -69,8 +128,7 @@ async def route_task(state: RouterState):
 async def execute_node(state: RouterState, system_prompt: str) -> RouterState:
     """Common implementation for executing a node with a specific system prompt."""
     messages = [("system", system_prompt), ("user", state["input_query"])]
-    parser = StrOutputParser()
-    chain = model | parser
+    chain = registry.chain(model, parser)
     response = await chain.ainvoke(messages)
 
     return {
@@ -105,30 +163,71 @@ async def story_teller(state: RouterState):
     )
 
 
+def choose_node(state: RouterState):
+    return state["route"]
+
+
+def add_route_nodes(workflow: StateGraph, source: str):
+    """Add the route nodes, reached from `source` through the selected route."""
+    workflow.add_node("code_generation", code_generation)
+    workflow.add_node("trip_planner", trip_planner)
+    workflow.add_node("story_teller", story_teller)
+    workflow.add_conditional_edges(
+        source, choose_node, {node["id"]: node["id"] for node in AVAILABLE_NODES}
+    )
+    for node in AVAILABLE_NODES:
+        workflow.add_edge(node["id"], END)
+
+
 workflow = StateGraph(RouterState)
 
 # Add nodes
 workflow.add_node("router", route_task)
-workflow.add_node("code_generation", code_generation)
-workflow.add_node("trip_planner", trip_planner)
-workflow.add_node("story_teller", story_teller)
 
 # Add edges
 workflow.set_entry_point("router")
+add_route_nodes(workflow, "router")
 
+agent = workflow.compile().with_config(run_name="routing")
 
-def choose_node(state: RouterState):
-    return state["route"]
+# The same graph without the router node, for tasks that were already routed in a batch
+routed_workflow = StateGraph(RouterState)
+add_route_nodes(routed_workflow, START)
+routed_agent = routed_workflow.compile().with_config(run_name="routing_batch")
 
 
-workflow.add_conditional_edges(
-    "router", choose_node, {node["id"]: node["id"] for node in AVAILABLE_NODES}
-)
+async def _route_one_batch(queries: List[str]) -> List[RouterSchema]:
+    chain = registry.structured_prompt_chain(
+        BATCH_ROUTER_PROMPT, model, BatchRouterSchema, method="json_schema", strict=True
+    )
+    user_queries = "\n".join(f"{i}. {query}" for i, query in enumerate(queries))
+    response = await chain.ainvoke(
+        {"user_queries": user_queries, "routes": model_routes_str}
+    )
+    valid_ids = {node["id"] for node in AVAILABLE_NODES}
+    results: List[Optional[RouterSchema]] = [None] * len(queries)
+    for item in response["routes"]:
+        if 0 <= item["index"] < len(queries) and item["route"] in valid_ids:
+            results[item["index"]] = RouterSchema(
+                reason=item["reason"], route=item["route"]
+            )
+    # Queries the model skipped or routed to an unknown id are routed one by one
+    missing = [i for i, result in enumerate(results) if result is None]
+    retried = await asyncio.gather(
+        *[route_task({"input_query": queries[i]}) for i in missing]  # type: ignore
+    )
+    for i, state in zip(missing, retried):
+        results[i] = RouterSchema(reason="", route=state["route"])
+    return results  # type: ignore
 
-for node in AVAILABLE_NODES:
-    workflow.add_edge(node["id"], END)
 
-agent = workflow.compile(debug=True)
+async def route_batch(
+    queries: List[str], token_budget: int = BATCH_TOKEN_BUDGET
+) -> List[RouterSchema]:
+    """Select a route for every query, packing as many queries per call as `token_budget` allows."""
+    batches = split_by_token_budget(queries, model.get_num_tokens, token_budget)
+    responses = await asyncio.gather(*[_route_one_batch(batch) for batch in batches])
+    return [route for batch in responses for route in batch]
 
 
 async def execute_task(task: str):
@@ -139,6 +238,19 @@ async def execute_task(task: str):
     )
 
 
+async def execute_tasks(tasks: List[str]):
+    """Route all `tasks` with batched router calls, then run each selected node."""
+    routes = await route_batch(tasks)
+    return await asyncio.gather(
+        *[
+            routed_agent.ainvoke(
+                {"input_query": task, "route": route["route"], "response": ""}
+            )
+            for task, route in zip(tasks, routes)
+        ]
+    )
+
+
 async def main():
     tasks = [
         "Write a Python function to check if a number is prime.",
@@ -146,9 +258,10 @@ async def main():
         "Write a story about a brave knight and a dragon.",
     ]
 
-    for task in tasks:
-        response = await execute_task(task)
+    responses = await execute_tasks(tasks)
+    for response in responses:
         print(response["response"])
+    print(metrics.summary())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,5 @@
+"""Helpers shared by the langchain and langgraph recipes.
+
+The recipes are run as standalone scripts, so they put the `python/` directory
+on `sys.path` before importing from this package.
+"""
@@ -0,0 +1,222 @@
+"""An adaptive limit on the API requests in flight, found by AIMD.
+
+A fixed limit is either too cautious for the capacity the API has or trips its rate
+limits when that capacity shrinks. `AdaptiveLimiter` instead probes for it as TCP
+congestion control does: while requests use every slot and succeed, the limit grows
+by one slot per window of requests (additive increase); a rate limited response, a
+timeout or, with `latency_slo` set, a response slower than it, cuts the limit by
+`backoff` (multiplicative decrease). One cut is made per congestion event: failures
+of requests that were sent before the last cut do not cut it again.
+
+`AdaptiveLimitTransport` puts the shared clients of `shared.clients` under the
+limiter, so every fan-out of the recipes, whether an `asyncio.gather` or the `Send`s
+of a graph, shares one limit. A request holds its slot until its response has been
+read, and requests beyond the limit wait for a slot in the order they came. Changes
+of the limit are kept in `trajectory`.
+"""
+
+import asyncio
+import collections
+import time
+from typing import AsyncIterator, NamedTuple, Optional
+
+import httpx
+
+# Statuses with which the API says it is over capacity
+OVERLOAD_STATUS_CODES = {429, 503}
+# Changes of the limit kept in `AdaptiveLimiter.trajectory`
+TRAJECTORY_LENGTH = 10_000
+
+
+class LimitChange(NamedTuple):
+    """A change of the limit, `at` seconds after the limiter was created or reset."""
+
+    at: float
+    limit: float
+    in_flight: int
+    reason: str
+
+
+class AdaptiveLimiter:
+    """Slots for requests in flight, between `min_limit` and `max_limit` of them.
+
+    The limit is shared by the event loops using it one after the other, as the
+    recipes' clients are; requests waiting for a slot belong to the running loop.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        initial: int = 32,
+        min_limit: int = 1,
+        max_limit: int = 256,
+        backoff: float = 0.5,
+        latency_slo: Optional[float] = None,
+    ):
+        self.enabled = enabled
+        self.initial = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_slo = latency_slo
+        self._waiters: collections.deque[asyncio.Future] = collections.deque()
+        self.in_flight = 0
+        self.reset()
+
+    def reset(self):
+        """Start over from the initial limit, with no counts and no trajectory."""
+        self.limit = float(self.initial)
+        self.successes = 0
+        self.rate_limited = 0
+        self.timeouts = 0
+        self.slow = 0
+        self.peak_in_flight = self.in_flight
+        self._start = time.perf_counter()
+        self._last_cut = float("-inf")
+        self.trajectory: collections.deque[LimitChange] = collections.deque(
+            maxlen=TRAJECTORY_LENGTH
+        )
+        self._record("start")
+
+    @property
+    def slots(self) -> int:
+        return int(self.limit)
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self):
+        """Wait for a free slot and take it."""
+        if self.in_flight < self.slots and not self._waiters:
+            self._take()
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Handed a slot just as it was cancelled
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def release(self):
+        """Give back a slot taken by `acquire`."""
+        self.in_flight -= 1
+        self._wake()
+
+    def record(self, sent: float, outcome: str):
+        """Adjust the limit to the `outcome` of a request sent at `sent`, a
+        `time.perf_counter()` time: "ok", "rate_limited" or "timeout"."""
+        if outcome == "rate_limited":
+            self.rate_limited += 1
+            self._cut(sent, outcome)
+        elif outcome == "timeout":
+            self.timeouts += 1
+            self._cut(sent, outcome)
+        elif (
+            self.latency_slo is not None
+            and time.perf_counter() - sent > self.latency_slo
+        ):
+            self.slow += 1
+            self._cut(sent, "slow")
+        else:
+            self.successes += 1
+            # Only grown while it is the limit that holds requests back
+            if self.in_flight >= self.slots or self._waiters:
+                slots = self.slots
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                if self.slots != slots:
+                    self._record("increase")
+                self._wake()
+
+    def _take(self):
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def _wake(self):
+        while self._waiters and self.in_flight < self.slots:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self._take()
+                waiter.set_result(None)
+
+    def _cut(self, sent: float, reason: str):
+        if sent < self._last_cut:
+            return
+        self.limit = max(self.min_limit, self.limit * self.backoff)
+        self._last_cut = time.perf_counter()
+        self._record(reason)
+
+    def _record(self, reason: str):
+        self.trajectory.append(
+            LimitChange(
+                time.perf_counter() - self._start, self.limit, self.in_flight, reason
+            )
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"AdaptiveLimiter(enabled={self.enabled}, limit={self.limit:.1f}, "
+            f"in_flight={self.in_flight}, peak_in_flight={self.peak_in_flight}, "
+            f"successes={self.successes}, rate_limited={self.rate_limited}, "
+            f"timeouts={self.timeouts}, slow={self.slow})"
+        )
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """A response body that gives back its request's slot once it is closed."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, limiter: AdaptiveLimiter):
+        self.stream = stream
+        self.limiter = limiter
+        self._released = False
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self.stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self.stream.aclose()
+        finally:
+            if not self._released:
+                self._released = True
+                self.limiter.release()
+
+
+class AdaptiveLimitTransport(httpx.AsyncBaseTransport):
+    """Sends the requests of `transport` under `limiter`, and reports how they went."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, limiter: AdaptiveLimiter):
+        self.transport = transport
+        self.limiter = limiter
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if not self.limiter.enabled:
+            return await self.transport.handle_async_request(request)
+        await self.limiter.acquire()
+        sent = time.perf_counter()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except httpx.TimeoutException:
+            self.limiter.record(sent, "timeout")
+            self.limiter.release()
+            raise
+        except BaseException:
+            self.limiter.release()
+            raise
+        # Latency is measured to the response headers, the first token when streamed
+        overloaded = response.status_code in OVERLOAD_STATUS_CODES
+        self.limiter.record(sent, "rate_limited" if overloaded else "ok")
+        response.stream = _ReleasingStream(
+            response.stream, self.limiter  # type: ignore[arg-type]
+        )
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
@@ -0,0 +1,224 @@
+"""Run a recipe over a JSONL dataset.
+
+    cd python
+    python -m shared.batch_runner langchain.prompt_chaining inputs.jsonl -o outputs.jsonl
+
+Each input line is a JSON object with the recipe's arguments (see `TARGETS`) and an
+optional `id`; lines without one are identified by their line number. Results are
+appended to the output file as they finish, one JSON object per line with the `id`
+and either the `output` or the `error`. Rerunning with the same output file skips
+the ids that already have an output, so an interrupted run can be resumed.
+
+Response cache lookups are counted under the recipe's path, e.g. `langchain/routing`.
+Connections to the API are opened before the first records are run, and how often
+they were reused is reported at the end.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import math
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Iterator, NamedTuple, Optional
+
+from langchain_core.globals import get_llm_cache
+
+from shared.clients import connection_stats, prewarm
+from shared.recipes import load_recipe
+from shared.response_cache import ResponseCache, cache_scope, format_stats
+
+CONCURRENCY = 8
+
+
+class Target(NamedTuple):
+    """A recipe file and how to call it with the fields of one input record."""
+
+    path: str
+    call: Callable[[Any, dict], Awaitable[Any]]
+
+
+async def _ask_question(recipe, record: dict) -> str:
+    # The RAG recipe is synchronous
+    return await asyncio.to_thread(recipe.ask_question, record["question"])
+
+
+async def _route(recipe, record: dict) -> str:
+    return await recipe.RouterWorkflow(recipe.ASSISTANTS).run(record["input"])
+
+
+TARGETS: dict[str, Target] = {
+    "langchain.prompt_chaining": Target(
+        "langchain/prompt_chaining.py",
+        lambda recipe, record: recipe.prompt_chaining(
+            record["input"], record["prompts"]
+        ),
+    ),
+    "langgraph.prompt_chaining": Target(
+        "langgraph/prompt_chaining.py",
+        lambda recipe, record: recipe.prompt_chaining(
+            record["input"], record["prompts"]
+        ),
+    ),
+    "langchain.evaluator_optimizer": Target(
+        "langchain/evaluator_optimizer.py",
+        lambda recipe, record: recipe.optimize_code(
+            record["task"], record.get("test_cases")
+        ),
+    ),
+    "langchain.routing": Target("langchain/routing.py", _route),
+    "langchain.orchestrator_workers": Target(
+        "langchain/orchestrator_workers.py",
+        lambda recipe, record: recipe.orchestrator_workers(record["task"]),
+    ),
+    "langgraph.orchestrator_workers": Target(
+        "langgraph/orchestrator_workers.py",
+        lambda recipe, record: recipe.orchestrator_workers(record["task"]),
+    ),
+    "langchain.rag": Target("langchain/rag/app.py", _ask_question),
+}
+
+
+class BatchStats:
+    """Counts and latencies of one batch run."""
+
+    def __init__(self):
+        self.skipped = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.latencies: list[float] = []
+        self.elapsed = 0.0
+
+    def percentile(self, p: float) -> float:
+        """The `p`-th percentile latency (nearest rank), in seconds."""
+        if not self.latencies:
+            return math.nan
+        latencies = sorted(self.latencies)
+        return latencies[max(0, math.ceil(p / 100 * len(latencies)) - 1)]
+
+    def report(self) -> str:
+        done = self.succeeded + self.failed
+        throughput = done / self.elapsed if self.elapsed else 0.0
+        return (
+            f"{done} done ({self.failed} failed, {self.skipped} skipped) "
+            f"in {self.elapsed:.1f}s, {throughput:.2f}/s, latency "
+            f"p50 {self.percentile(50):.2f}s p90 {self.percentile(90):.2f}s "
+            f"p99 {self.percentile(99):.2f}s"
+        )
+
+
+def read_records(path: Path) -> Iterator[dict]:
+    with path.open(encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if line.strip():
+                record = json.loads(line)
+                record.setdefault("id", line_number)
+                yield record
+
+
+def completed_ids(path: Path) -> set:
+    """Ids that already have an output in `path`; failed ones are run again."""
+    if not path.exists():
+        return set()
+    ids = set()
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a line cut short when the last run was interrupted
+            if "output" in result:
+                ids.add(result["id"])
+    return ids
+
+
+async def run_batch(
+    target: Target,
+    input_path: Path,
+    output_path: Path,
+    concurrency: int = CONCURRENCY,
+    recipe: Any = None,
+) -> BatchStats:
+    """Run `target` on every record of `input_path` not yet completed in `output_path`."""
+    recipe = recipe or load_recipe(target.path)
+    stats = BatchStats()
+    done = completed_ids(output_path)
+    # Bounded, so that records are read from the file only as workers get to them
+    queue: asyncio.Queue[Optional[dict]] = asyncio.Queue(maxsize=2 * concurrency)
+
+    async def produce():
+        for record in read_records(input_path):
+            if record["id"] in done:
+                stats.skipped += 1
+            else:
+                await queue.put(record)
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def work(output):
+        while (record := await queue.get()) is not None:
+            start = time.perf_counter()
+            result: dict[str, Any] = {"id": record["id"]}
+            try:
+                with cache_scope(target.path.removesuffix(".py")):
+                    result["output"] = await target.call(recipe, record)
+                stats.succeeded += 1
+            except Exception as e:
+                result["error"] = f"{type(e).__name__}: {e}"
+                stats.failed += 1
+            result["seconds"] = round(time.perf_counter() - start, 3)
+            stats.latencies.append(result["seconds"])
+            output.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+            output.flush()
+
+    start = time.perf_counter()
+    with output_path.open("a+", encoding="utf-8") as output:
+        if output.tell() > 0:
+            output.seek(output.tell() - 1)
+            if output.read(1) != "\n":
+                output.write("\n")  # end the line an interrupted run cut short
+        await asyncio.gather(produce(), *[work(output) for _ in range(concurrency)])
+    stats.elapsed = time.perf_counter() - start
+    return stats
+
+
+async def prewarm_and_run(
+    target: Target, input_path: Path, output_path: Path, concurrency: int
+) -> BatchStats:
+    # The workers' first requests would otherwise all open connections at once
+    await prewarm(connections=concurrency)
+    return await run_batch(target, input_path, output_path, concurrency)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a recipe over a JSONL dataset.")
+    parser.add_argument("target", choices=sorted(TARGETS))
+    parser.add_argument("input", type=Path, help="JSONL file of recipe inputs")
+    parser.add_argument("-o", "--output", type=Path, required=True)
+    parser.add_argument("-c", "--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="show the recipes' own output"
+    )
+    args = parser.parse_args()
+
+    with contextlib.ExitStack() as stack:
+        if not args.verbose:
+            devnull = stack.enter_context(open(os.devnull, "w"))
+            stack.enter_context(contextlib.redirect_stdout(devnull))
+        stats = asyncio.run(
+            prewarm_and_run(
+                TARGETS[args.target], args.input, args.output, args.concurrency
+            )
+        )
+    print(stats.report(), file=sys.stderr)
+    print(connection_stats, file=sys.stderr)
+    cache = get_llm_cache()
+    if isinstance(cache, ResponseCache) and cache.stats:
+        print(format_stats(cache.stats), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
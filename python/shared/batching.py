@@ -0,0 +1,32 @@
+from typing import Callable, Optional, Sequence, TypeVar
+
+T = TypeVar("T")
+
+
+def split_by_token_budget(
+    items: Sequence[T],
+    length_function: Callable[[T], int],
+    token_budget: int,
+    max_items: Optional[int] = None,
+) -> list[list[T]]:
+    """Split `items` into consecutive batches whose total length stays within `token_budget`.
+
+    An item that is larger than the budget on its own is put in a batch by itself
+    rather than dropped, so every item ends up in exactly one batch.
+    """
+    batches: list[list[T]] = []
+    current: list[T] = []
+    current_tokens = 0
+    for item in items:
+        tokens = length_function(item)
+        over_budget = current_tokens + tokens > token_budget
+        over_count = max_items is not None and len(current) >= max_items
+        if current and (over_budget or over_count):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(item)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
@@ -0,0 +1,239 @@
+"""Model cascades: cheaper models answer first, the recipe's model only when their
+answer fails a confidence check.
+
+    generator = Cascade("generate_code")
+
+    response = await generator.run(
+        model,
+        lambda tier: registry.structured_chat_prompt_chain(
+            messages, tier, Schema, method="json_schema"
+        ).ainvoke(inputs),
+        accept=lambda response: valid_python(response["code"]),
+    )
+
+`run` calls each of the cheaper models in turn, then `model`, until an answer passes.
+A cheaper model's answer is escalated to the next model when:
+
+- it is not valid structured output: the call raised a `ValueError` (which parsing
+  and schema validation errors are), a `KeyError` or a `TypeError`;
+- `accept` rejects it, e.g. an evaluator verdict that needs a second opinion, or code
+  that does not compile;
+- with `samples` above one, the samples drawn from the model at `SAMPLE_TEMPERATURE`
+  do not all agree on `key`, a self-consistency check.
+
+Other errors, such as rate limits, are raised as usual. The last model's answer is
+always taken. The cheaper models are listed, cheapest first, in `RECIPES_CASCADE`,
+e.g. `gpt-4o-mini`; without it the cascade only calls `model`. Each cascade counts
+the calls, time, tokens and dollars of each model, and the answers escalated and why,
+in `stats`.
+"""
+
+import asyncio
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Iterator, Optional, Sequence, TypeVar
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.tracers.context import register_configure_hook
+
+from shared.registry import registry
+from shared.response_cache import token_cost
+from shared.usage import TokenUsageCallback
+
+T = TypeVar("T")
+
+# Temperature the samples of a self-consistency check are drawn at
+SAMPLE_TEMPERATURE = 0.7
+# Errors of a call whose answer was not valid structured output
+INVALID_OUTPUT_ERRORS = (ValueError, KeyError, TypeError)
+
+_tier_usage: ContextVar[Optional[TokenUsageCallback]] = ContextVar(
+    "cascade_tier_usage", default=None
+)
+register_configure_hook(_tier_usage, inheritable=True)
+
+
+def model_name(model: BaseChatModel) -> str:
+    return str(
+        getattr(model, "model_name", None)
+        or getattr(model, "model", None)
+        or model._identifying_params.get("model")
+        or type(model).__name__
+    )
+
+
+def valid_python(code: str) -> bool:
+    """Whether `code` is non-empty Python that compiles."""
+    if not code.strip():
+        return False
+    try:
+        compile(code, "<generated>", "exec")
+    except (SyntaxError, ValueError):
+        return False
+    return True
+
+
+def cascade_models() -> list[BaseChatModel]:
+    """The cheaper models of `RECIPES_CASCADE`, cheapest first."""
+    # Imported here, so that the models are only built for cascades that are used
+    from shared.clients import chat_model
+
+    names = [n.strip() for n in os.environ.get("RECIPES_CASCADE", "").split(",")]
+    return [chat_model(model=name, temperature=0) for name in names if name]
+
+
+class TierStats:
+    """Calls made to one model of a cascade."""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.calls = 0
+        self.answered = 0
+        self.seconds = 0.0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    @property
+    def cost(self) -> float:
+        return token_cost(self.model, self.input_tokens, self.output_tokens)
+
+    def __repr__(self) -> str:
+        return (
+            f"TierStats({self.model!r}, calls={self.calls}, answered={self.answered}, "
+            f"seconds={self.seconds:.2f}, cost=${self.cost:.4f})"
+        )
+
+
+class CascadeStats:
+    """Runs of a cascade, the model that answered each, and why answers escalated."""
+
+    def __init__(self):
+        self.runs = 0
+        self.seconds = 0.0
+        self.tiers: dict[str, TierStats] = {}
+        self.escalations: dict[str, int] = {}
+
+    def tier(self, model: str) -> TierStats:
+        if model not in self.tiers:
+            self.tiers[model] = TierStats(model)
+        return self.tiers[model]
+
+    @property
+    def escalated(self) -> int:
+        return sum(self.escalations.values())
+
+    @property
+    def cost(self) -> float:
+        return sum(tier.cost for tier in self.tiers.values())
+
+    def report(self) -> str:
+        lines = [
+            f"{'model':<16}{'calls':>7}{'answered':>10}{'seconds':>10}{'cost $':>10}"
+        ]
+        for tier in self.tiers.values():
+            lines.append(
+                f"{tier.model:<16}{tier.calls:>7}{tier.answered:>10}"
+                f"{tier.seconds:>10.2f}{tier.cost:>10.4f}"
+            )
+        lines.append(
+            f"{self.runs} runs in {self.seconds:.2f}s, ${self.cost:.4f}; "
+            f"escalated {self.escalated}: {self.escalations}"
+        )
+        return "\n".join(lines)
+
+    def reset(self):
+        self.__init__()
+
+
+class Cascade:
+    """Cheaper models tried before the one a recipe passes to `run`."""
+
+    def __init__(self, name: str, models: Optional[Sequence[BaseChatModel]] = None):
+        self.name = name
+        self._models = None if models is None else list(models)
+        self.stats = CascadeStats()
+
+    @property
+    def models(self) -> list[BaseChatModel]:
+        if self._models is None:
+            self._models = cascade_models()
+        return self._models
+
+    @models.setter
+    def models(self, models: Sequence[BaseChatModel]):
+        self._models = list(models)
+
+    @contextmanager
+    def _timed(self, model: BaseChatModel) -> Iterator[None]:
+        tier = self.stats.tier(model_name(model))
+        usage = TokenUsageCallback()
+        token = _tier_usage.set(usage)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            tier.seconds += time.perf_counter() - started
+            tier.calls += max(1, usage.calls)
+            tier.input_tokens += usage.input_tokens
+            tier.output_tokens += usage.output_tokens
+            _tier_usage.reset(token)
+
+    async def _try(
+        self,
+        model: BaseChatModel,
+        call: Callable[[BaseChatModel], Awaitable[T]],
+        accept: Optional[Callable[[T], bool]],
+        samples: int,
+        key: Optional[Callable[[T], Any]],
+    ) -> tuple[Optional[T], Optional[str]]:
+        """The answer of a cheaper `model`, or the reason it is escalated."""
+        with self._timed(model):
+            try:
+                if samples > 1:
+                    sampler = registry.variant(model, temperature=SAMPLE_TEMPERATURE)
+                    answers = await asyncio.gather(
+                        *[call(sampler) for _ in range(samples)]
+                    )
+                else:
+                    answers = [await call(model)]
+            except INVALID_OUTPUT_ERRORS:
+                return None, "invalid"
+        if key is not None and len({key(answer) for answer in answers}) > 1:
+            return None, "disagreement"
+        if accept is not None and not accept(answers[0]):
+            return None, "rejected"
+        return answers[0], None
+
+    async def run(
+        self,
+        model: BaseChatModel,
+        call: Callable[[BaseChatModel], Awaitable[T]],
+        accept: Optional[Callable[[T], bool]] = None,
+        samples: int = 1,
+        key: Optional[Callable[[T], Any]] = None,
+    ) -> T:
+        """`call(m)` for the cheaper models `m` in turn, then `model`, until an answer
+        passes the checks described above."""
+        started = time.perf_counter()
+        self.stats.runs += 1
+        try:
+            for cheaper in self.models:
+                answer, reason = await self._try(cheaper, call, accept, samples, key)
+                if reason is None:
+                    self.stats.tier(model_name(cheaper)).answered += 1
+                    return answer  # type: ignore[return-value]
+                self.stats.escalations[reason] = (
+                    self.stats.escalations.get(reason, 0) + 1
+                )
+            with self._timed(model):
+                answer = await call(model)
+            self.stats.tier(model_name(model)).answered += 1
+            return answer
+        finally:
+            self.stats.seconds += time.perf_counter() - started
+
+    def __repr__(self) -> str:
+        models = [model_name(m) for m in self.models]
+        return f"Cascade({self.name!r}, models={models}, runs={self.stats.runs})"
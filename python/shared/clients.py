@@ -0,0 +1,354 @@
+"""One pooled HTTP client per process, shared by every OpenAI model and embeddings.
+
+    from shared.clients import chat_openai
+
+    model = chat_openai(model="gpt-4o-mini", temperature=0)
+
+`ChatOpenAI` and `OpenAIEmbeddings` otherwise each open their own connection pool, so
+every recipe module pays its own TCP and TLS handshakes, and they show up in the
+latency of its first requests. Here they share one keep-alive pool, over HTTP/2 when
+the `h2` package is installed, so concurrent requests are multiplexed over a few
+connections. Asynchronous connections belong to the event loop that opened them, so
+the async client keeps a pool per running loop. Each is split into a few shards that
+take requests in turn: httpcore's bookkeeping on every request grows with the square
+of the connections in a pool, and over HTTP/1.1 a single pool of a few dozen
+connections spends more CPU on it than the connections it saves.
+
+The pool is configured from the environment:
+
+    RECIPES_HTTP2                      off to use HTTP/1.1 only
+    RECIPES_HTTP_MAX_CONNECTIONS       connections per pool (default 100)
+    RECIPES_HTTP_MAX_KEEPALIVE         idle connections kept open (default 100)
+    RECIPES_HTTP_POOL_SHARDS           shards of each async pool (default 4)
+    RECIPES_HTTP_KEEPALIVE_EXPIRY      seconds an idle connection is kept (default 60)
+    RECIPES_SINGLEFLIGHT               off to send identical concurrent requests
+    RECIPES_ADAPTIVE_CONCURRENCY       off to send async requests without a limit
+    RECIPES_CONCURRENCY_LIMIT          async requests in flight to start from (32)
+    RECIPES_CONCURRENCY_MAX            most async requests in flight (default 256)
+    RECIPES_LATENCY_SLO_MS             response time above which the limit is cut
+    RECIPES_MODEL_POOL                 backends for `chat_model` to spread calls over
+
+`connection_stats` counts the requests sent and the connections opened for them,
+`singleflight` the identical requests that shared one (see `shared.singleflight`) and
+`limiter` adapts the number of async requests in flight (see `shared.adaptive_limit`).
+
+`chat_model` is the recipes' model: a `chat_openai`, or with `RECIPES_MODEL_POOL` set,
+a `ModelPool` of several backends (see `shared.model_pool`), separated by commas:
+
+    RECIPES_MODEL_POOL="https://api.openai.com/v1,http://gpu-box:8000/v1*4,\
+        ollama:qwen2.5-coder:1.5b@http://localhost:11434*2"
+
+An OpenAI-compatible backend is its base URL, optionally preceded by `model@` to use
+another model than the recipe's; an Ollama one is `ollama:` and its model, optionally
+followed by `@` and the server's URL. `*n` caps the calls in flight on a backend.
+"""
+
+import asyncio
+import importlib.util
+import itertools
+import os
+import threading
+import weakref
+from typing import Any, Optional
+
+import httpx
+from langchain_core.language_models import BaseChatModel
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+from shared.adaptive_limit import AdaptiveLimiter, AdaptiveLimitTransport
+from shared.metrics import OFF
+from shared.model_pool import ModelPool
+from shared.singleflight import (
+    AsyncSingleflightTransport,
+    Singleflight,
+    SingleflightTransport,
+)
+
+MAX_CONNECTIONS = 100
+# httpcore closes idle connections whenever a pool holds more connections than this,
+# so below the requests in flight it closes and reopens connections between bursts
+MAX_KEEPALIVE_CONNECTIONS = 100
+KEEPALIVE_EXPIRY = 60.0
+# The OpenAI client's own default
+TIMEOUT = httpx.Timeout(600.0, connect=5.0)
+OPENAI_BASE_URL = "https://api.openai.com/v1"
+# Connections opened by `prewarm` over HTTP/1.1
+PREWARM_CONNECTIONS = 8
+# Shards of each async pool, which split its connections and limits between them
+POOL_SHARDS = 4
+# Calls in flight on each backend of a model pool, unless set with `*n`
+POOL_MAX_IN_FLIGHT = 16
+# Retries of a pool's OpenAI backends before failing over to another
+POOL_MAX_RETRIES = 0
+# Async requests in flight the adaptive limit starts from, and its ceiling
+CONCURRENCY_LIMIT = 32
+MAX_CONCURRENCY = 256
+
+
+class ConnectionStats:
+    """Requests sent through the shared clients, and connections opened for them."""
+
+    def __init__(self):
+        self.requests = 0
+        self.connections = 0
+        self.tls_handshakes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def reused(self) -> int:
+        """Requests sent over a connection that an earlier request opened."""
+        return max(0, self.requests - self.connections)
+
+    @property
+    def reuse_rate(self) -> float:
+        return self.reused / self.requests if self.requests else 0.0
+
+    def _record(self, event: str):
+        with self._lock:
+            if event == "connection.connect_tcp.complete":
+                self.connections += 1
+            elif event == "connection.start_tls.complete":
+                self.tls_handshakes += 1
+
+    def _request(self):
+        with self._lock:
+            self.requests += 1
+
+    def reset(self):
+        with self._lock:
+            self.requests = self.connections = self.tls_handshakes = 0
+
+    def __repr__(self) -> str:
+        return (
+            f"ConnectionStats(requests={self.requests}, "
+            f"connections={self.connections}, tls_handshakes={self.tls_handshakes}, "
+            f"reused={self.reused}, reuse_rate={self.reuse_rate:.0%})"
+        )
+
+
+connection_stats = ConnectionStats()
+singleflight = Singleflight(
+    enabled=os.environ.get("RECIPES_SINGLEFLIGHT", "").lower() not in OFF
+)
+limiter = AdaptiveLimiter(
+    enabled=os.environ.get("RECIPES_ADAPTIVE_CONCURRENCY", "").lower() not in OFF,
+    initial=int(os.environ.get("RECIPES_CONCURRENCY_LIMIT", CONCURRENCY_LIMIT)),
+    max_limit=int(os.environ.get("RECIPES_CONCURRENCY_MAX", MAX_CONCURRENCY)),
+    latency_slo=(
+        float(os.environ["RECIPES_LATENCY_SLO_MS"]) / 1000
+        if os.environ.get("RECIPES_LATENCY_SLO_MS")
+        else None
+    ),
+)
+
+
+def pool_shards() -> int:
+    return max(1, int(os.environ.get("RECIPES_HTTP_POOL_SHARDS", POOL_SHARDS)))
+
+
+def pool_limits(shards: int = 1) -> httpx.Limits:
+    """The limits of a pool, or of each of its `shards`."""
+    max_connections = int(
+        os.environ.get("RECIPES_HTTP_MAX_CONNECTIONS", MAX_CONNECTIONS)
+    )
+    max_keepalive = int(
+        os.environ.get("RECIPES_HTTP_MAX_KEEPALIVE", MAX_KEEPALIVE_CONNECTIONS)
+    )
+    return httpx.Limits(
+        max_connections=-(-max_connections // shards),
+        max_keepalive_connections=-(-max_keepalive // shards),
+        keepalive_expiry=float(
+            os.environ.get("RECIPES_HTTP_KEEPALIVE_EXPIRY", KEEPALIVE_EXPIRY)
+        ),
+    )
+
+
+def http2_enabled() -> bool:
+    """Whether to negotiate HTTP/2: unless turned off, when `h2` is installed."""
+    if os.environ.get("RECIPES_HTTP2", "").lower() in OFF:
+        return False
+    return importlib.util.find_spec("h2") is not None
+
+
+class CountingTransport(httpx.BaseTransport):
+    """Counts the requests sent through `transport` and the connections they open."""
+
+    def __init__(self, transport: httpx.BaseTransport, stats: ConnectionStats):
+        self.transport = transport
+        self.stats = stats
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        traced = request.extensions.get("trace")
+
+        def trace(event: str, info: dict):
+            self.stats._record(event)
+            if traced is not None:
+                traced(event, info)
+
+        request.extensions = {**request.extensions, "trace": trace}
+        self.stats._request()
+        return self.transport.handle_request(request)
+
+    def close(self):
+        self.transport.close()
+
+
+class LoopPooledTransport(httpx.AsyncBaseTransport):
+    """An async transport with a connection pool per event loop, counting as
+    `CountingTransport` does.
+
+    A connection can only be used from the loop that opened it, and the recipes may
+    run several loops one after the other, e.g. one `asyncio.run` per batch. A
+    loop's pool is made of `shards` transports, which take its requests in turn.
+    """
+
+    def __init__(
+        self, stats: ConnectionStats, shards: int = 1, **transport_kwargs: Any
+    ):
+        self.stats = stats
+        self.shards = shards
+        self.transport_kwargs = transport_kwargs
+        self._transports: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, list[httpx.AsyncHTTPTransport]
+        ] = weakref.WeakKeyDictionary()
+        self._turn = itertools.count()
+
+    def _transport(self) -> httpx.AsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        transports = self._transports.get(loop)
+        if transports is None:
+            transports = [
+                httpx.AsyncHTTPTransport(**self.transport_kwargs)
+                for _ in range(self.shards)
+            ]
+            self._transports[loop] = transports
+        return transports[next(self._turn) % len(transports)]
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        traced = request.extensions.get("trace")
+
+        async def trace(event: str, info: dict):
+            self.stats._record(event)
+            if traced is not None:
+                await traced(event, info)
+
+        request.extensions = {**request.extensions, "trace": trace}
+        self.stats._request()
+        return await self._transport().handle_async_request(request)
+
+    async def aclose(self):
+        for transport in self._transports.pop(asyncio.get_running_loop(), []):
+            await transport.aclose()
+
+
+_http_client: Optional[httpx.Client] = None
+_http_async_client: Optional[httpx.AsyncClient] = None
+_lock = threading.Lock()
+
+
+def http_client() -> httpx.Client:
+    """The process's shared synchronous client."""
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            transport = httpx.HTTPTransport(http2=http2_enabled(), limits=pool_limits())
+            _http_client = httpx.Client(
+                transport=SingleflightTransport(
+                    CountingTransport(transport, connection_stats), singleflight
+                ),
+                timeout=TIMEOUT,
+            )
+        return _http_client
+
+
+def http_async_client() -> httpx.AsyncClient:
+    """The process's shared asynchronous client, usable from any event loop."""
+    global _http_async_client
+    with _lock:
+        if _http_async_client is None:
+            shards = pool_shards()
+            transport = LoopPooledTransport(
+                connection_stats,
+                shards,
+                http2=http2_enabled(),
+                limits=pool_limits(shards),
+            )
+            _http_async_client = httpx.AsyncClient(
+                # Coalesced requests wait for their leader without taking a slot
+                transport=AsyncSingleflightTransport(
+                    AdaptiveLimitTransport(transport, limiter), singleflight
+                ),
+                timeout=TIMEOUT,
+            )
+        return _http_async_client
+
+
+def chat_openai(**kwargs: Any) -> ChatOpenAI:
+    """A `ChatOpenAI` that sends its requests through the shared clients."""
+    return ChatOpenAI(
+        http_client=http_client(), http_async_client=http_async_client(), **kwargs
+    )
+
+
+def pool_backend(spec: str, **kwargs: Any) -> tuple[BaseChatModel, int]:
+    """The model of one backend of `RECIPES_MODEL_POOL`, and its cap on calls in
+    flight. `kwargs` are those of `chat_model`."""
+    spec, _, cap = spec.strip().partition("*")
+    max_in_flight = int(cap) if cap else POOL_MAX_IN_FLIGHT
+    if spec.startswith("ollama:"):
+        from langchain_ollama import ChatOllama
+
+        name, _, url = spec.removeprefix("ollama:").partition("@")
+        options = (
+            {"temperature": kwargs["temperature"]} if "temperature" in kwargs else {}
+        )
+        return ChatOllama(model=name, base_url=url or None, **options), max_in_flight
+    name, _, url = spec.rpartition("@")
+    if name:
+        kwargs = {**kwargs, "model": name}
+    kwargs.setdefault("max_retries", POOL_MAX_RETRIES)
+    return chat_openai(base_url=url, **kwargs), max_in_flight
+
+
+def chat_model(**kwargs: Any) -> BaseChatModel:
+    """`chat_openai(**kwargs)`, or a `ModelPool` of the backends in
+    `RECIPES_MODEL_POOL` when it is set."""
+    specs = [s for s in os.environ.get("RECIPES_MODEL_POOL", "").split(",") if s]
+    if not specs:
+        return chat_openai(**kwargs)
+    backends = [pool_backend(spec, **kwargs) for spec in specs]
+    return ModelPool(
+        models=[model for model, _ in backends],
+        max_in_flight=[max_in_flight for _, max_in_flight in backends],
+    )
+
+
+def openai_embeddings(**kwargs: Any) -> OpenAIEmbeddings:
+    """An `OpenAIEmbeddings` that sends its requests through the shared clients."""
+    return OpenAIEmbeddings(
+        http_client=http_client(), http_async_client=http_async_client(), **kwargs
+    )
+
+
+async def prewarm(
+    base_url: Optional[str] = None, connections: int = PREWARM_CONNECTIONS
+) -> int:
+    """Open connections to the API in the current loop's pool before they are needed.
+
+    Sends `connections` concurrent requests, over HTTP/2 only one per shard of the
+    pool, which multiplexes the rest over it, and ignores their responses: an
+    unauthenticated request opens the connection as well as any other. Returns the
+    number of connections opened; failures are ignored, the requests will open
+    connections when they are sent.
+    """
+    base_url = base_url or os.environ.get("OPENAI_BASE_URL") or OPENAI_BASE_URL
+    client = http_async_client()
+    before = connection_stats.connections
+    # HTTP/2 is only negotiated over TLS
+    http2 = http2_enabled() and base_url.startswith("https://")
+    count = pool_shards() if http2 else connections
+    await asyncio.gather(
+        *[client.get(f"{base_url.rstrip('/')}/models") for _ in range(count)],
+        return_exceptions=True,
+    )
+    return connection_stats.connections - before
@@ -0,0 +1,84 @@
+import re
+from typing import Callable, Optional, Sequence
+
+from langchain_core.messages import BaseMessage, HumanMessage
+
+# Compact the history once its steps add up to more than this many tokens
+HISTORY_TOKEN_BUDGET = 2000
+# ...down to this fraction of the budget, so that the following steps only append
+# to the prompt and the provider's prompt cache keeps matching its prefix
+COMPACT_TARGET_RATIO = 0.5
+# Feedback folded out of a window is kept up to this many characters, newest first
+FEEDBACK_SUMMARY_CHARS = 600
+
+# A step is the messages of one turn of a chain, e.g. its prompt and the response
+Step = Sequence[BaseMessage]
+
+
+def stale_step_count(
+    steps: Sequence[Step],
+    length_function: Callable[[str], int],
+    token_budget: int = HISTORY_TOKEN_BUDGET,
+    target_ratio: float = COMPACT_TARGET_RATIO,
+) -> int:
+    """How many of the oldest `steps` to summarize or drop before the next call.
+
+    Nothing is compacted while the steps fit in `token_budget`. Past it, old steps are
+    compacted until the rest fit in `target_ratio` of the budget, rather than one step
+    per call, which would change the prompt right after its prefix every time. The
+    latest step is always kept, since the next prompt usually refers to it.
+    """
+    sizes = [
+        sum(length_function(str(message.content)) for message in step) for step in steps
+    ]
+    total = sum(sizes)
+    if total <= token_budget:
+        return 0
+    count = 0
+    while count < len(sizes) - 1 and total > token_budget * target_ratio:
+        total -= sizes[count]
+        count += 1
+    return count
+
+
+def format_steps(steps: Sequence[Step]) -> str:
+    """The steps as plain text, for a summarization prompt."""
+    return "\n\n".join(
+        f"{message.type}: {message.content}" for step in steps for message in step
+    )
+
+
+def summary_messages(summary: Optional[str]) -> list[BaseMessage]:
+    """The summary of compacted steps, to be placed after the fixed start of the prompt."""
+    if not summary:
+        return []
+    return [HumanMessage(content=f"Summary of the earlier steps:\n{summary}")]
+
+
+def fold_feedback(
+    summary: Optional[str],
+    feedbacks: Sequence[str],
+    max_chars: int = FEEDBACK_SUMMARY_CHARS,
+) -> str:
+    """Fold `feedbacks` into `summary` without a model call.
+
+    Review feedback repeats itself from one iteration to the next, so the sentences of
+    the summary and the feedbacks are deduplicated, keeping the newest copy, and the
+    oldest are dropped beyond `max_chars`.
+    """
+    sentences: dict[str, str] = {}
+    for text in [summary or "", *feedbacks]:
+        for sentence in re.split(r"(?<=[.!?])\s+|\n+", text):
+            sentence = " ".join(sentence.split()).lstrip("- ")
+            if sentence:
+                key = sentence.lower()
+                sentences.pop(key, None)
+                sentences[key] = sentence
+    kept: list[str] = []
+    size = 0
+    for sentence in reversed(sentences.values()):
+        size += len(sentence) + 3
+        if kept and size > max_chars:
+            break
+        kept.append(f"- {sentence}")
+    return "\n".join(reversed(kept))
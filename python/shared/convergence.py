@@ -0,0 +1,109 @@
+import ast
+import asyncio
+import difflib
+import hashlib
+from typing import Awaitable, Callable, Generic, Optional, Sequence, TypeVar
+
+T = TypeVar("T")
+
+# Code at least this similar to the previous iteration's (after normalization) counts
+# as unchanged. Small real edits, like adding a type hint, are already ~0.99 similar,
+# so by default only code that normalizes to the same text counts.
+SIMILARITY_THRESHOLD = 1.0
+# A score that improves less than this per iteration, `PATIENCE` times in a row, has plateaued
+MIN_SCORE_GAIN = 2.0
+PATIENCE = 2
+
+
+def normalize_code(code: str) -> str:
+    """Normalize code so that formatting and comment-only changes compare equal.
+
+    Python code is round-tripped through the AST, which drops comments and
+    formatting; anything that does not parse only has its whitespace normalized.
+    """
+    try:
+        return ast.unparse(ast.parse(code))
+    except (SyntaxError, ValueError):
+        lines = (" ".join(line.split()) for line in code.strip().splitlines())
+        return "\n".join(line for line in lines if line)
+
+
+def code_hash(code: str, *context: str) -> str:
+    """Hash of the normalized `code`, plus anything else the evaluation depends on."""
+    digest = hashlib.sha256(normalize_code(code).encode())
+    for part in context:
+        digest.update(b"\0" + part.encode())
+    return digest.hexdigest()
+
+
+def code_converged(
+    previous: Optional[str], current: str, threshold: float = SIMILARITY_THRESHOLD
+) -> bool:
+    """Whether the generator returned the same, or nearly the same, code as last time."""
+    if not previous:
+        return False
+    a, b = normalize_code(previous), normalize_code(current)
+    if a == b:
+        return True
+    return threshold < 1 and difflib.SequenceMatcher(None, a, b).ratio() >= threshold
+
+
+def score_plateaued(
+    scores: Sequence[float], min_gain: float = MIN_SCORE_GAIN, patience: int = PATIENCE
+) -> bool:
+    """Whether each of the last `patience` iterations improved the best score by less than `min_gain`."""
+    if len(scores) <= patience:
+        return False
+    best = max(scores[:-patience])
+    for score in scores[-patience:]:
+        if score - best >= min_gain:
+            return False
+        best = max(best, score)
+    return True
+
+
+class EvaluationMemo(Generic[T]):
+    """Remembers evaluations by normalized code hash so identical code is evaluated once.
+
+    Concurrent requests for the same code, such as best-of-N candidates that came out
+    identical, share one evaluation, which is cancelled only once all of them are.
+    """
+
+    def __init__(self):
+        self._evaluations: dict[str, T] = {}
+        self._running: dict[str, asyncio.Future] = {}
+        self._waiters: dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get_or_evaluate(
+        self, code: str, evaluate: Callable[[], Awaitable[T]], *context: str
+    ) -> T:
+        key = code_hash(code, *context)
+        if key in self._evaluations:
+            self.hits += 1
+            return self._evaluations[key]
+        running = self._running.get(key)
+        if running is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            running = asyncio.ensure_future(evaluate())
+            self._running[key] = running
+            self._waiters[key] = 0
+
+            def landed(future: asyncio.Future):
+                del self._running[key], self._waiters[key]
+                if not future.cancelled() and future.exception() is None:
+                    self._evaluations[key] = future.result()
+
+            running.add_done_callback(landed)
+
+        self._waiters[key] += 1
+        try:
+            return await asyncio.shield(running)
+        finally:
+            if not running.done():
+                self._waiters[key] -= 1
+                if not self._waiters[key]:
+                    running.cancel()
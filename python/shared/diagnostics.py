@@ -0,0 +1,327 @@
+"""Event loop diagnostics: how late the loop runs, which code blocks it, and how much
+wall, loop and CPU time each coroutine takes.
+
+    RECIPES_DIAGNOSTICS=on python langchain/orchestrator_workers.py
+
+Off unless `RECIPES_DIAGNOSTICS` is set. When on, every event loop the process
+creates (e.g. by `asyncio.run`) gets:
+
+- a heartbeat task that sleeps `LAG_INTERVAL` seconds at a time and records how
+  much later than that it wakes up: the time the loop was busy with something else;
+- a watchdog thread that samples the loop thread's stack every `SAMPLE_INTERVAL`
+  seconds, keeping the stack of each stall, when the heartbeat is more than
+  `STALL_THRESHOLD` seconds late, so that the blocking call is named;
+- a task factory that times the steps of every task's coroutine: the wall time from
+  creation to completion, the loop time spent running it, its CPU time, and its
+  longest step, which is how long it blocked the loop at once.
+
+A report is printed to stderr at exit; with `RECIPES_DIAGNOSTICS_FOLDED` set to a
+path, the loop thread's stack samples are written there in the folded format of
+flamegraph.pl and speedscope. `RECIPES_STALL_MS` overrides the stall threshold.
+"""
+
+import asyncio
+import atexit
+import functools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from types import FrameType
+from typing import Any, Coroutine, Generator, Optional, Union
+
+from shared.metrics import OFF, Histogram
+from shared.recipes import PYTHON_DIR
+
+LAG_INTERVAL = 0.05
+STALL_THRESHOLD = 0.1
+SAMPLE_INTERVAL = 0.005
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Rows of each table in the report
+REPORT_ROWS = 10
+
+Stack = tuple[str, ...]
+
+
+@functools.lru_cache(maxsize=None)
+def _location(filename: str) -> str:
+    """A short name for a source file: relative to the recipes, or to site-packages."""
+    path = Path(filename)
+    if path.is_relative_to(PYTHON_DIR):
+        return path.relative_to(PYTHON_DIR).as_posix()
+    if "site-packages" in path.parts:
+        return "/".join(path.parts[path.parts.index("site-packages") + 1 :])
+    return path.name
+
+
+def frame_stack(frame: Optional[FrameType]) -> Stack:
+    """The frames from `frame` outwards, outermost first, as `file:function`."""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        if code.co_filename != __file__:  # the profiling wrappers
+            stack.append(f"{_location(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return tuple(reversed(stack))
+
+
+def _site(stack: Stack) -> str:
+    """The innermost frame of the recipes' own code in `stack`, or its innermost."""
+    for frame in reversed(stack):
+        if frame.startswith(("langchain/", "langgraph/", "shared/", "benchmarks/")):
+            return frame
+    return stack[-1] if stack else "?"
+
+
+class Stall:
+    """The times the loop was blocked at one stack."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+
+class CoroutineStats:
+    """The tasks run of one coroutine function."""
+
+    def __init__(self):
+        self.tasks = 0
+        self.steps = 0
+        # From the task's creation to its completion
+        self.wall = 0.0
+        # Time the loop spent running the coroutine, and the CPU time of that
+        self.busy = 0.0
+        self.cpu = 0.0
+        self.max_step = 0.0
+
+
+class _ProfiledSteps:
+    """Drives a coroutine as its task would, timing each step."""
+
+    def __init__(self, coro: Coroutine, stats: CoroutineStats, created: float):
+        self.coro = coro
+        self.stats = stats
+        self.created = created
+
+    def __await__(self) -> Generator[Any, Any, Any]:
+        stats = self.stats
+        value: Any = None
+        error: Optional[BaseException] = None
+        try:
+            while True:
+                start = time.perf_counter()
+                cpu = time.thread_time()
+                try:
+                    if error is None:
+                        yielded = self.coro.send(value)
+                    else:
+                        yielded = self.coro.throw(error)
+                except StopIteration as e:
+                    return e.value
+                finally:
+                    step = time.perf_counter() - start
+                    stats.steps += 1
+                    stats.busy += step
+                    stats.cpu += time.thread_time() - cpu
+                    stats.max_step = max(stats.max_step, step)
+                try:
+                    value, error = (yield yielded), None
+                except BaseException as e:
+                    value, error = None, e
+        finally:
+            stats.tasks += 1
+            stats.wall += time.perf_counter() - self.created
+
+
+class _LoopWatch:
+    """The heartbeat and stack sampling of one running loop."""
+
+    def __init__(self, diagnostics: "LoopDiagnostics"):
+        self.diagnostics = diagnostics
+        self.thread_id = threading.get_ident()
+        self.tick = time.perf_counter()
+        self.stall_stack: Optional[Stack] = None
+        self.stopped = threading.Event()
+
+    async def heartbeat(self):
+        diagnostics = self.diagnostics
+        try:
+            while True:
+                due = time.perf_counter() + diagnostics.lag_interval
+                await asyncio.sleep(diagnostics.lag_interval)
+                self.tick = time.perf_counter()
+                lag = max(0.0, self.tick - due)
+                diagnostics.lag.observe(lag)
+                diagnostics.max_lag = max(diagnostics.max_lag, lag)
+                if lag >= diagnostics.stall_threshold:
+                    diagnostics.stalls.setdefault(
+                        self.stall_stack or ("?",), Stall()
+                    ).add(lag)
+                self.stall_stack = None
+        finally:
+            self.stopped.set()
+
+    def sample(self):
+        """Run in the watchdog thread until the heartbeat stops."""
+        diagnostics = self.diagnostics
+        late = diagnostics.lag_interval + diagnostics.stall_threshold
+        while not self.stopped.wait(diagnostics.sample_interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = frame_stack(frame)
+            del frame
+            if not stack or stack[-1].endswith("selectors.py:select"):
+                diagnostics.idle_samples += 1
+                continue
+            diagnostics.samples[stack] += 1
+            if self.stall_stack is None and time.perf_counter() - self.tick > late:
+                self.stall_stack = stack
+
+
+class LoopDiagnostics:
+    """Lag, stalls, stack samples and coroutine timings of the loops attached to it."""
+
+    def __init__(
+        self,
+        lag_interval: float = LAG_INTERVAL,
+        stall_threshold: float = STALL_THRESHOLD,
+        sample_interval: float = SAMPLE_INTERVAL,
+    ):
+        self.lag_interval = lag_interval
+        self.stall_threshold = stall_threshold
+        self.sample_interval = sample_interval
+        self.lag = Histogram(LAG_BUCKETS)
+        self.max_lag = 0.0
+        self.stalls: dict[Stack, Stall] = {}
+        self.samples: Counter[Stack] = Counter()
+        self.idle_samples = 0
+        # By coroutine name and source file
+        self.coroutines: dict[tuple[str, str], CoroutineStats] = {}
+
+    def attach(self, loop: asyncio.AbstractEventLoop):
+        """Diagnose `loop` from when it next runs until its tasks are cancelled."""
+        loop.set_task_factory(self._task_factory)
+        loop.call_soon(self._start, loop)
+
+    def _start(self, loop: asyncio.AbstractEventLoop):
+        watch = _LoopWatch(self)
+        # Created directly, so that the factory does not profile it
+        asyncio.Task(watch.heartbeat(), loop=loop, name="loop-diagnostics")
+        threading.Thread(target=watch.sample, name="loop-watchdog", daemon=True).start()
+
+    def _task_factory(
+        self, loop: asyncio.AbstractEventLoop, coro: Coroutine, **kwargs: Any
+    ) -> asyncio.Task:
+        code = getattr(coro, "cr_code", None)
+        # The name of a decorated coroutine function is that of the function it
+        # wraps, but its code is the wrapper's
+        if code is None or code.co_qualname != coro.__qualname__:
+            key = (getattr(coro, "__qualname__", type(coro).__qualname__), "")
+        else:
+            key = (coro.__qualname__, _location(code.co_filename))
+        stats = self.coroutines.setdefault(key, CoroutineStats())
+        steps = _ProfiledSteps(coro, stats, time.perf_counter())
+        return asyncio.Task(self._profiled(steps), loop=loop, **kwargs)
+
+    @staticmethod
+    async def _profiled(steps: _ProfiledSteps) -> Any:
+        return await steps
+
+    def report(self) -> str:
+        ms = 1000
+
+        def lag(q: float) -> float:
+            # Estimated within a bucket, so possibly above the largest
+            return min(self.lag.quantile(q), self.max_lag) * ms
+
+        lines = [
+            f"Event loop lag over {self.lag.count} heartbeats: "
+            f"p50 {lag(0.5):.1f}ms, p95 {lag(0.95):.1f}ms, p99 {lag(0.99):.1f}ms, "
+            f"max {self.max_lag * ms:.1f}ms"
+        ]
+        busy = sum(self.samples.values())
+        total = busy + self.idle_samples
+        if total:
+            lines.append(f"Loop thread busy in {busy / total:.0%} of {total} samples")
+
+        stalls = sorted(self.stalls.items(), key=lambda item: -item[1].total)
+        lines.append("")
+        lines.append(
+            f"Stalls over {self.stall_threshold * ms:.0f}ms: "
+            f"{sum(s.count for s in self.stalls.values())}"
+        )
+        if stalls:
+            lines.append(f"{'count':>7}{'total ms':>10}{'max ms':>9}  blocked at")
+        for stack, stall in stalls[:REPORT_ROWS]:
+            lines.append(
+                f"{stall.count:>7}{stall.total * ms:>10.0f}{stall.max * ms:>9.0f}"
+                f"  {_site(stack)}"
+            )
+            lines.extend(f"{'':>28}{frame}" for frame in stack[-4:][::-1])
+
+        coroutines = sorted(self.coroutines.items(), key=lambda item: -item[1].busy)
+        lines.append("")
+        lines.append("Coroutines by loop time")
+        lines.append(
+            f"{'coroutine':<40}{'tasks':>6}{'wall s':>9}{'loop ms':>9}"
+            f"{'cpu ms':>9}{'max step ms':>12}  file"
+        )
+        for (name, location), stats in coroutines[:REPORT_ROWS]:
+            lines.append(
+                f"{name[-40:]:<40}{stats.tasks:>6}{stats.wall:>9.2f}"
+                f"{stats.busy * ms:>9.1f}{stats.cpu * ms:>9.1f}"
+                f"{stats.max_step * ms:>12.1f}  {location}"
+            )
+        return "\n".join(lines)
+
+    def folded(self) -> str:
+        """The stack samples of the busy loop thread, one `frame;frame count` per line."""
+        return "".join(
+            f"{';'.join(stack)} {count}\n" for stack, count in self.samples.items()
+        )
+
+    def write_folded(self, path: Union[Path, str]):
+        Path(path).write_text(self.folded(), encoding="utf-8")
+
+
+# The diagnostics of every loop in the process, when installed
+diagnostics = LoopDiagnostics()
+_installed = False
+
+
+class _DiagnosedLoopPolicy(asyncio.DefaultEventLoopPolicy):
+    def new_event_loop(self) -> asyncio.AbstractEventLoop:
+        loop = super().new_event_loop()
+        diagnostics.attach(loop)
+        return loop
+
+
+def _report():
+    print(diagnostics.report(), file=sys.stderr)
+    if path := os.environ.get("RECIPES_DIAGNOSTICS_FOLDED"):
+        diagnostics.write_folded(path)
+
+
+def install_diagnostics() -> Optional[LoopDiagnostics]:
+    """Diagnose every event loop created from now on, if `RECIPES_DIAGNOSTICS` is set.
+
+    Safe to call from every recipe: the loop policy is only installed once.
+    """
+    global _installed
+    if _installed:
+        return diagnostics
+    if os.environ.get("RECIPES_DIAGNOSTICS", "off").lower() in OFF:
+        return None
+    _installed = True
+    if threshold := os.environ.get("RECIPES_STALL_MS"):
+        diagnostics.stall_threshold = float(threshold) / 1000
+    asyncio.set_event_loop_policy(_DiagnosedLoopPolicy())
+    atexit.register(_report)
+    return diagnostics
@@ -0,0 +1,336 @@
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import time
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Callable, Iterator, Optional, Sequence, Union
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import Runnable, RunnableLambda
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+# A responder gets the prompt messages and the name of the requested output schema
+# (None for plain chat calls) and returns the text, a dict for structured output, or
+# an AIMessage, e.g. one with tool calls.
+Responder = Callable[[list[BaseMessage], Optional[str]], Union[str, dict, AIMessage]]
+
+# Characters per fake token, for usage metadata and streaming
+CHARS_PER_TOKEN = 4
+
+
+def approximate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token) used for fake usage metadata."""
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+class FakeAPIError(Exception):
+    """An API error with an HTTP status, as raised by `ScriptedChatModel.failure`."""
+
+    def __init__(self, status_code: int = 429, message: str = "Rate limit exceeded"):
+        super().__init__(f"{status_code} {message}")
+        self.status_code = status_code
+
+
+def uniform_latency(
+    low: float, high: float, seed: Optional[int] = None
+) -> Callable[[], float]:
+    """Latencies spread evenly between `low` and `high` seconds."""
+    rng = random.Random(seed)
+    return lambda: rng.uniform(low, high)
+
+
+def lognormal_latency(
+    median: float, p95: float, seed: Optional[int] = None
+) -> Callable[[], float]:
+    """Latencies with a long tail, like those of a hosted model: half of them are
+    below `median` seconds and 95% below `p95`."""
+    rng = random.Random(seed)
+    sigma = math.log(p95 / median) / 1.645  # the 95th percentile of N(0, 1)
+    return lambda: rng.lognormvariate(math.log(median), sigma)
+
+
+def random_failures(
+    rate: float, status_code: int = 429, seed: Optional[int] = None
+) -> Callable[[list[BaseMessage], Optional[str]], Optional[Exception]]:
+    """A `failure` function failing a fraction `rate` of the calls with `status_code`."""
+    rng = random.Random(seed)
+
+    def failure(messages: list[BaseMessage], schema: Optional[str]):
+        if rng.random() < rate:
+            return FakeAPIError(status_code)
+        return None
+
+    return failure
+
+
+def _output_text(content: Union[str, AIMessage]) -> str:
+    if isinstance(content, str):
+        return content
+    calls = json.dumps([call["args"] for call in content.tool_calls])
+    return f"{content.content}{calls}"
+
+
+def _schema_name(kwargs: dict) -> Optional[str]:
+    if "schema" in kwargs:
+        return kwargs["schema"]
+    # Set when the JSON schema is bound directly, e.g. to stream the raw JSON
+    response_format = kwargs.get("response_format")
+    if isinstance(response_format, dict):
+        return response_format.get("json_schema", {}).get("name")
+    return None
+
+
+class ScriptedChatModel(BaseChatModel):
+    """A chat model that answers from a script instead of calling an API.
+
+    Used to run the recipes offline in benchmarks. `latency` is the time, in seconds,
+    before the first token, or a function returning it for each call. With
+    `tokens_per_second` set, generating the answer takes additional time in
+    proportion to its length, and streamed tokens arrive at that rate. With
+    `prompt_tokens_per_second` set, the first token also waits for the prompt to be
+    read, so longer prompts are slower.
+
+    `failure`, if set, is called with the same arguments as the responder before each
+    call; an exception it returns (such as a `FakeAPIError`) is raised instead of
+    answering, after the latency has passed.
+
+    Set `model_name` to let a response cache tell the model apart from others, as it
+    does for real models; without it, responses are never cached.
+    """
+
+    responder: Responder
+    latency: Union[float, Callable[[], float]] = 0.0
+    tokens_per_second: Optional[float] = None
+    prompt_tokens_per_second: Optional[float] = None
+    failure: Optional[
+        Callable[[list[BaseMessage], Optional[str]], Optional[Exception]]
+    ] = None
+    model_name: Optional[str] = None
+    temperature: float = 0.0
+    calls: int = 0
+    failures: int = 0
+    # Calls being answered right now, and the most there have been at once
+    in_flight: int = 0
+    peak_in_flight: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    @contextmanager
+    def _track_in_flight(self) -> Iterator[None]:
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        if self.model_name is None:
+            return {}
+        return {"model_name": self.model_name, "temperature": self.temperature}
+
+    def get_num_tokens(self, text: str) -> int:
+        return approximate_tokens(text)
+
+    def _latency(self, messages: list[BaseMessage]) -> float:
+        latency = self.latency() if callable(self.latency) else self.latency
+        if self.prompt_tokens_per_second:
+            input_tokens = sum(approximate_tokens(str(m.content)) for m in messages)
+            latency += input_tokens / self.prompt_tokens_per_second
+        return latency
+
+    def _failure(
+        self, messages: list[BaseMessage], **kwargs: Any
+    ) -> Optional[Exception]:
+        error = self.failure(messages, _schema_name(kwargs)) if self.failure else None
+        if error is not None:
+            self.failures += 1
+        return error
+
+    def _content(
+        self, messages: list[BaseMessage], **kwargs: Any
+    ) -> Union[str, AIMessage]:
+        self.calls += 1
+        content = self.responder(messages, _schema_name(kwargs))
+        if isinstance(content, dict):
+            content = json.dumps(content, ensure_ascii=False)
+        return content
+
+    def _generation_time(self, content: Union[str, AIMessage]) -> float:
+        if not self.tokens_per_second:
+            return 0.0
+        return approximate_tokens(_output_text(content)) / self.tokens_per_second
+
+    def _chunk_time(self, index: int) -> float:
+        # When the chunk at `index` is generated, after the first token
+        return index / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def _usage(
+        self, messages: list[BaseMessage], content: Union[str, AIMessage]
+    ) -> dict:
+        input_tokens = sum(approximate_tokens(str(m.content)) for m in messages)
+        output_tokens = approximate_tokens(_output_text(content))
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+
+    def _result(
+        self, messages: list[BaseMessage], content: Union[str, AIMessage]
+    ) -> ChatResult:
+        usage = self._usage(messages, content)
+        if isinstance(content, AIMessage):
+            message = content.model_copy(update={"usage_metadata": usage})
+        else:
+            message = AIMessage(content=content, usage_metadata=usage)  # type: ignore
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _chunks(
+        self, messages: list[BaseMessage], content: Union[str, AIMessage]
+    ) -> list[AIMessageChunk]:
+        if isinstance(content, AIMessage):
+            # Tool calls are streamed in one piece
+            chunks = [
+                AIMessageChunk(
+                    content=content.content,
+                    tool_call_chunks=[
+                        {
+                            "name": call["name"],
+                            "args": json.dumps(call["args"]),
+                            "id": call["id"],
+                            "index": i,
+                        }
+                        for i, call in enumerate(content.tool_calls)
+                    ],
+                )
+            ]
+        else:
+            pieces = [
+                content[i : i + CHARS_PER_TOKEN]
+                for i in range(0, len(content), CHARS_PER_TOKEN)
+            ] or [""]
+            chunks = [AIMessageChunk(content=piece) for piece in pieces]
+        chunks[-1].usage_metadata = self._usage(messages, content)  # type: ignore
+        return chunks
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        with self._track_in_flight():
+            error = self._failure(messages, **kwargs)
+            if error is not None:
+                time.sleep(self._latency(messages))
+                raise error
+            content = self._content(messages, **kwargs)
+            time.sleep(self._latency(messages) + self._generation_time(content))
+            return self._result(messages, content)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        with self._track_in_flight():
+            error = self._failure(messages, **kwargs)
+            if error is not None:
+                await asyncio.sleep(self._latency(messages))
+                raise error
+            content = self._content(messages, **kwargs)
+            delay = self._latency(messages) + self._generation_time(content)
+            await asyncio.sleep(delay)
+            return self._result(messages, content)
+
+    def _stream(
+        self, messages, stop=None, run_manager=None, **kwargs
+    ) -> Iterator[ChatGenerationChunk]:
+        with self._track_in_flight():
+            content = self._content(messages, **kwargs)
+            start = time.perf_counter() + self._latency(messages)
+            for i, chunk in enumerate(self._chunks(messages, content)):
+                # Sleep until the chunk is due, so per-sleep overhead does not add up
+                time.sleep(max(0.0, start + self._chunk_time(i) - time.perf_counter()))
+                if run_manager:
+                    run_manager.on_llm_new_token(str(chunk.content))
+                yield ChatGenerationChunk(message=chunk)
+
+    async def _astream(
+        self, messages, stop=None, run_manager=None, **kwargs
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        with self._track_in_flight():
+            content = self._content(messages, **kwargs)
+            start = time.perf_counter() + self._latency(messages)
+            for i, chunk in enumerate(self._chunks(messages, content)):
+                delay = start + self._chunk_time(i) - time.perf_counter()
+                await asyncio.sleep(max(0.0, delay))
+                if run_manager:
+                    await run_manager.on_llm_new_token(str(chunk.content))
+                yield ChatGenerationChunk(message=chunk)
+
+    def bind_tools(
+        self, tools: Sequence[Any], *, tool_choice: Optional[str] = None, **kwargs: Any
+    ) -> Runnable:
+        formatted = [convert_to_openai_tool(t) for t in tools]
+        return self.bind(tools=formatted, tool_choice=tool_choice, **kwargs)
+
+    def with_structured_output(
+        self, schema: Any, *, include_raw: bool = False, **kwargs: Any
+    ) -> Runnable:
+        schema_name = getattr(schema, "__name__", str(schema))
+
+        def parse(message: AIMessage) -> Any:
+            parsed = json.loads(message.content)  # type: ignore
+            if include_raw:
+                return {"raw": message, "parsed": parsed, "parsing_error": None}
+            return parsed
+
+        return self.bind(schema=schema_name) | RunnableLambda(parse)
+
+
+class ScriptedEmbeddings(Embeddings):
+    """Offline embeddings: each word is hashed to one of `dimensions` buckets, so texts
+    sharing words are similar, and every call takes `latency` seconds.
+
+    Deterministic, so a vector store filled with them returns the same documents for
+    the same query on every run.
+    """
+
+    def __init__(
+        self,
+        dimensions: int = 256,
+        latency: Union[float, Callable[[], float]] = 0.0,
+    ):
+        self.dimensions = dimensions
+        self.latency = latency
+        self.calls = 0
+
+    def _latency(self) -> float:
+        self.calls += 1
+        return self.latency() if callable(self.latency) else self.latency
+
+    def _embed(self, text: str) -> list[float]:
+        vector = [0.0] * self.dimensions
+        for word in re.findall(r"\w+", text.lower()):
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            vector[int.from_bytes(digest, "little") % self.dimensions] += 1.0
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norm for x in vector]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        time.sleep(self._latency())
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        time.sleep(self._latency())
+        return self._embed(text)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        await asyncio.sleep(self._latency())
+        return [self._embed(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> list[float]:
+        await asyncio.sleep(self._latency())
+        return self._embed(text)
@@ -0,0 +1,307 @@
+"""A local stand-in for the OpenAI API, to run the recipes' real clients offline.
+
+    with FakeOpenAIServer(responder).running() as server:
+        model = chat_openai(model="gpt-4o-mini", base_url=server.base_url, api_key="x")
+
+Serves chat completions (streamed or not, with structured output and tool calls)
+and embeddings over HTTP/1.1 with keep-alive, answering from a responder as
+`ScriptedChatModel` does. It counts the connections clients open and the requests
+they send over them, so that connection reuse can be checked from the server's
+side. With `capacity` set, requests beyond that many at once are rejected with a 429,
+as a rate limited API would; it can be changed while the server runs.
+"""
+
+import asyncio
+import base64
+import json
+import struct
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional, Union
+
+from langchain_core.messages import AIMessage, convert_to_messages
+
+from shared.fake_models import (
+    CHARS_PER_TOKEN,
+    Responder,
+    ScriptedEmbeddings,
+    approximate_tokens,
+)
+
+HOST = "127.0.0.1"
+
+
+def echo_responder(messages, schema) -> Union[str, dict]:
+    """Answers with the last message, or an empty object for structured output."""
+    return {} if schema else str(messages[-1].content)
+
+
+class FakeOpenAIServer:
+    """An OpenAI-compatible HTTP server answering from `responder`.
+
+    `latency` is the time, in seconds, each request takes, or a function returning it.
+    """
+
+    def __init__(
+        self,
+        responder: Responder = echo_responder,
+        latency: Union[float, Callable[[], float]] = 0.0,
+        capacity: Optional[int] = None,
+        host: str = HOST,
+        port: int = 0,
+    ):
+        self.responder = responder
+        self.latency = latency
+        self.capacity = capacity
+        self.host = host
+        self.port = port
+        self.embeddings = ScriptedEmbeddings()
+        self.connections = 0
+        self.requests = 0
+        self.rejected = 0
+        self.active = 0
+        self.peak_active = 0
+        self._server: Optional[asyncio.Server] = None
+        # The tasks serving open connections, and their connections
+        self._handlers: dict[asyncio.Task, asyncio.StreamWriter] = {}
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    @property
+    def reused(self) -> int:
+        """Requests received over a connection that an earlier request opened."""
+        return max(0, self.requests - self.connections)
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            # Closed rather than cancelled, so that they finish on their own
+            for writer in self._handlers.values():
+                writer.close()
+            await asyncio.gather(*self._handlers, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self) -> "FakeOpenAIServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    @contextmanager
+    def running(self) -> Iterator["FakeOpenAIServer"]:
+        """Serve from a thread with its own event loop, e.g. for synchronous clients
+        or clients that run several loops."""
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(
+            target=loop.run_forever, name="fake-openai-server", daemon=True
+        )
+        thread.start()
+        try:
+            asyncio.run_coroutine_threadsafe(self.start(), loop).result()
+            yield self
+        finally:
+            asyncio.run_coroutine_threadsafe(self.close(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        handler = asyncio.current_task()
+        assert handler is not None
+        self._handlers[handler] = writer
+        try:
+            while request_line := await reader.readline():
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                self.requests += 1
+                status, content_type, payload = await self._respond(
+                    method, path.split("?")[0], body
+                )
+                head = [
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}",
+                    f"Content-Type: {content_type}",
+                    f"Content-Length: {len(payload)}",
+                ]
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + payload)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            del self._handlers[handler]
+            writer.close()
+
+    async def _respond(
+        self, method: str, path: str, body: bytes
+    ) -> tuple[int, str, bytes]:
+        if method == "GET" and path.endswith("/models"):
+            return 200, "application/json", b'{"object": "list", "data": []}'
+        if method != "POST" or not path.endswith(("/chat/completions", "/embeddings")):
+            error = {"error": {"message": f"No route for {method} {path}"}}
+            return 404, "application/json", json.dumps(error).encode()
+        if self.capacity is not None and self.active >= self.capacity:
+            self.rejected += 1
+            error = {
+                "error": {
+                    "message": "Rate limit reached",
+                    "type": "requests",
+                    "code": "rate_limit_exceeded",
+                }
+            }
+            return 429, "application/json", json.dumps(error).encode()
+
+        self.active += 1
+        self.peak_active = max(self.peak_active, self.active)
+        try:
+            latency = self.latency() if callable(self.latency) else self.latency
+            await asyncio.sleep(latency)
+            request = json.loads(body)
+            if path.endswith("/embeddings"):
+                return 200, "application/json", self._embeddings(request)
+            if request.get("stream"):
+                return 200, "text/event-stream", self._chat_stream(request)
+            return 200, "application/json", self._chat(request)
+        finally:
+            self.active -= 1
+
+    def _answer(self, request: dict) -> tuple[Union[str, AIMessage], dict]:
+        messages = convert_to_messages(request["messages"])
+        response_format = request.get("response_format") or {}
+        schema = response_format.get("json_schema", {}).get("name")
+        tool_choice = request.get("tool_choice")
+        if schema is None and isinstance(tool_choice, dict):
+            schema = tool_choice.get("function", {}).get("name")
+        content = self.responder(messages, schema)
+        if isinstance(content, dict):
+            if isinstance(tool_choice, dict):
+                # Structured output by function calling
+                content = AIMessage(
+                    content="",
+                    tool_calls=[{"name": schema, "args": content, "id": _id("call")}],
+                )
+            else:
+                content = json.dumps(content, ensure_ascii=False)
+        prompt_tokens = sum(approximate_tokens(str(m.content)) for m in messages)
+        completion_tokens = approximate_tokens(
+            content if isinstance(content, str) else json.dumps(content.tool_calls)
+        )
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        return content, usage
+
+    def _chat(self, request: dict) -> bytes:
+        content, usage = self._answer(request)
+        message: dict[str, Any] = {"role": "assistant"}
+        if isinstance(content, AIMessage):
+            message["content"] = content.content or None
+            message["tool_calls"] = _tool_calls(content)
+        else:
+            message["content"] = content
+        completion = {
+            "id": _id("chatcmpl"),
+            "object": "chat.completion",
+            "created": 0,
+            "model": request.get("model", "fake"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": message,
+                    "finish_reason": (
+                        "tool_calls" if "tool_calls" in message else "stop"
+                    ),
+                }
+            ],
+            "usage": usage,
+        }
+        return json.dumps(completion).encode()
+
+    def _chat_stream(self, request: dict) -> bytes:
+        content, usage = self._answer(request)
+        completion_id = _id("chatcmpl")
+
+        def chunk(choices: list, **extra: Any) -> str:
+            data = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": 0,
+                "model": request.get("model", "fake"),
+                "choices": choices,
+                **extra,
+            }
+            return f"data: {json.dumps(data)}\n\n"
+
+        events = [chunk([{"index": 0, "delta": {"role": "assistant"}}])]
+        if isinstance(content, AIMessage):
+            events.append(
+                chunk([{"index": 0, "delta": {"tool_calls": _tool_calls(content)}}])
+            )
+            finish_reason = "tool_calls"
+        else:
+            for i in range(0, len(content), CHARS_PER_TOKEN):
+                piece = content[i : i + CHARS_PER_TOKEN]
+                events.append(chunk([{"index": 0, "delta": {"content": piece}}]))
+            finish_reason = "stop"
+        events.append(
+            chunk([{"index": 0, "delta": {}, "finish_reason": finish_reason}])
+        )
+        if (request.get("stream_options") or {}).get("include_usage"):
+            events.append(chunk([], usage=usage))
+        events.append("data: [DONE]\n\n")
+        return "".join(events).encode()
+
+    def _embeddings(self, request: dict) -> bytes:
+        inputs = request["input"]
+        texts = [inputs] if isinstance(inputs, str) else inputs
+        # Token ids, as OpenAIEmbeddings sends when it splits long texts itself
+        texts = [t if isinstance(t, str) else " ".join(map(str, t)) for t in texts]
+        data = []
+        for i, text in enumerate(texts):
+            vector = self.embeddings._embed(text)
+            if request.get("encoding_format") == "base64":
+                packed = struct.pack(f"<{len(vector)}f", *vector)
+                embedding: Any = base64.b64encode(packed).decode()
+            else:
+                embedding = vector
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+        tokens = sum(approximate_tokens(text) for text in texts)
+        response = {
+            "object": "list",
+            "data": data,
+            "model": request.get("model", "fake"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+        return json.dumps(response).encode()
+
+
+def _id(prefix: str) -> str:
+    return f"{prefix}-{uuid.uuid4().hex[:24]}"
+
+
+def _tool_calls(message: AIMessage) -> list[dict]:
+    return [
+        {
+            "index": i,
+            "id": call["id"] or _id("call"),
+            "type": "function",
+            "function": {"name": call["name"], "arguments": json.dumps(call["args"])},
+        }
+        for i, call in enumerate(message.tool_calls)
+    ]
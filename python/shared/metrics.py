@@ -0,0 +1,359 @@
+"""Latency, token and retry metrics of graph nodes and chains, from LangChain callbacks.
+
+    from shared.metrics import install_metrics, metrics
+
+    install_metrics()
+    ...
+    print(metrics.summary())
+
+Once installed, every LangGraph node run is recorded under its graph's run name
+(set with `graph.compile().with_config(run_name=...)`) and node name, and every other
+top-level chain under its run name. Model calls and their tokens are counted against the node or chain they
+were made in. `ResilientNode` adds the time each call waited for a free slot and its
+retries. Recording a run is a few dictionary updates, so the metrics can stay on.
+
+Set `RECIPES_METRICS` to `off` to disable them. Set `RECIPES_METRICS_FILE` to write
+the metrics in the Prometheus text format when the process exits, or
+`RECIPES_METRICS_PORT` to serve them on `http://localhost:<port>/metrics` while it
+runs.
+"""
+
+import atexit
+import bisect
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Optional, Sequence
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.runnables.config import ensure_config
+from langchain_core.tracers.context import register_configure_hook
+
+# Upper bounds of the latency buckets, in seconds
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)  # fmt: skip
+# Upper bounds of the fan-out width buckets, in parallel runs of a node in one step
+FANOUT_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+OFF = ("off", "0", "false")
+
+# A node or chain: (graph or chain name, node name or "")
+Label = tuple[str, str]
+
+
+class Histogram:
+    """Counts of observations in cumulative buckets, as Prometheus histograms have."""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        # The last count is for observations above every bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        """Estimate of the `q`-quantile, interpolated within its bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                if i == len(self.buckets):
+                    return lower  # above the last bucket
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+class NodeMetrics:
+    """Everything recorded about one node or chain."""
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.queue_wait = Histogram()
+        self.fanout = Histogram(FANOUT_BUCKETS)
+        self.max_fanout = 0
+        self.runs = 0
+        self.errors = 0
+        self.retries = 0
+        self.llm_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+
+class MetricsCallback(BaseCallbackHandler):
+    """Records node and chain runs from LangChain callbacks, see the module docstring."""
+
+    # Called in the thread that starts the run, instead of in an executor
+    run_inline = True
+
+    def __init__(self):
+        self.nodes: defaultdict[Label, NodeMetrics] = defaultdict(NodeMetrics)
+        self._lock = threading.Lock()
+        # Runs in progress: label, start time, and the graph run they are part of
+        self._runs: dict[UUID, tuple[Label, float, Optional[UUID]]] = {}
+        # Parallel runs per (step, node) of each graph run in progress
+        self._steps: dict[UUID, Counter[tuple[Any, str]]] = {}
+
+    def on_chain_start(
+        self,
+        serialized: Optional[dict[str, Any]],
+        inputs: Any,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        metadata: Optional[dict[str, Any]] = None,
+        name: Optional[str] = None,
+        **kwargs: Any,
+    ) -> None:
+        name = name or (serialized or {}).get("name") or "chain"
+        metadata = metadata or {}
+        with self._lock:
+            parent = self._runs.get(parent_run_id) if parent_run_id else None
+            if parent is None:
+                # A graph, or a chain invoked on its own
+                self._runs[run_id] = ((name, ""), time.perf_counter(), run_id)
+                self._steps[run_id] = Counter()
+                return
+            (graph, _), _, root = parent
+            if metadata.get("langgraph_node") == name and parent_run_id == root:
+                label = (graph, name)
+                if root in self._steps:
+                    self._steps[root][(metadata.get("langgraph_step"), name)] += 1
+            else:
+                label = parent[0]  # a runnable inside a node or chain
+            # Only nodes and top-level chains are timed, inner runnables are not
+            start = time.perf_counter() if label[1] == name else 0.0
+            self._runs[run_id] = (label, start, root)
+
+    def _end(self, run_id: UUID, error: bool):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+            if run is None:
+                return
+            label, start, root = run
+            if start:
+                node = self.nodes[label]
+                node.runs += 1
+                node.errors += error
+                node.latency.observe(time.perf_counter() - start)
+            if root == run_id:
+                for (_, name), width in self._steps.pop(run_id, Counter()).items():
+                    node = self.nodes[(label[0], name)]
+                    node.fanout.observe(width)
+                    node.max_fanout = max(node.max_fanout, width)
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, error=False)
+
+    def on_chain_error(
+        self, error: BaseException, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        self._end(run_id, error=True)
+
+    def on_chat_model_start(
+        self,
+        serialized: dict[str, Any],
+        messages: Any,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ) -> None:
+        with self._lock:
+            parent = self._runs.get(parent_run_id) if parent_run_id else None
+            if parent is not None:
+                self._runs[run_id] = (parent[0], 0.0, parent[2])
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+            if run is None:
+                return
+            node = self.nodes[run[0]]
+            node.llm_calls += 1
+            for generations in response.generations:
+                for generation in generations:
+                    message = getattr(generation, "message", None)
+                    usage = getattr(message, "usage_metadata", None)
+                    if usage:
+                        node.prompt_tokens += usage.get("input_tokens", 0)
+                        node.completion_tokens += usage.get("output_tokens", 0)
+
+    def on_llm_error(
+        self, error: BaseException, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        with self._lock:
+            self._runs.pop(run_id, None)
+
+    def _current_label(self) -> Optional[Label]:
+        # The node being run, from the config LangGraph sets for its code
+        manager = ensure_config().get("callbacks")
+        run = self._runs.get(getattr(manager, "parent_run_id", None))  # type: ignore
+        return run[0] if run else None
+
+    def record_queue_wait(self, seconds: float):
+        """Record how long the current node waited before it could run."""
+        with self._lock:
+            label = self._current_label()
+            if label is not None:
+                self.nodes[label].queue_wait.observe(seconds)
+
+    def record_retry(self):
+        """Count a retry of the current node."""
+        with self._lock:
+            label = self._current_label()
+            if label is not None:
+                self.nodes[label].retries += 1
+
+    def reset(self):
+        with self._lock:
+            self.nodes.clear()
+
+    def prometheus(self) -> str:
+        """The metrics in the Prometheus text exposition format."""
+        lines: list[str] = []
+
+        def histogram(name: str, help: str, get):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} histogram")
+            for (graph, node), metrics in sorted(self.nodes.items()):
+                h: Histogram = get(metrics)
+                labels = f'graph="{graph}",node="{node}"'
+                cumulative = 0
+                for bound, count in zip(h.buckets, h.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {h.count}')
+                lines.append(f"{name}_sum{{{labels}}} {h.sum}")
+                lines.append(f"{name}_count{{{labels}}} {h.count}")
+
+        def counter(name: str, help: str, attribute: str):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} counter")
+            for (graph, node), metrics in sorted(self.nodes.items()):
+                value = getattr(metrics, attribute)
+                lines.append(f'{name}{{graph="{graph}",node="{node}"}} {value}')
+
+        with self._lock:
+            histogram(
+                "recipe_node_duration_seconds",
+                "Time from a node's start to its end.",
+                lambda m: m.latency,
+            )
+            histogram(
+                "recipe_node_queue_wait_seconds",
+                "Time a node waited for a concurrency slot.",
+                lambda m: m.queue_wait,
+            )
+            histogram(
+                "recipe_node_fanout_width",
+                "Parallel runs of a node in one step of a graph.",
+                lambda m: m.fanout,
+            )
+            counter("recipe_node_runs_total", "Node runs.", "runs")
+            counter("recipe_node_errors_total", "Node runs that raised.", "errors")
+            counter("recipe_node_retries_total", "Retried node attempts.", "retries")
+            counter("recipe_node_llm_calls_total", "Model calls.", "llm_calls")
+            counter(
+                "recipe_node_prompt_tokens_total", "Prompt tokens.", "prompt_tokens"
+            )
+            counter(
+                "recipe_node_completion_tokens_total",
+                "Completion tokens.",
+                "completion_tokens",
+            )
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: Path | str):
+        """Write the metrics to `path`, e.g. for node_exporter's textfile collector."""
+        path = Path(path)
+        temporary = path.with_name(path.name + ".tmp")
+        temporary.write_text(self.prometheus(), encoding="utf-8")
+        temporary.replace(path)  # so the collector never reads a partial file
+
+    def serve_prometheus(self, port: int) -> ThreadingHTTPServer:
+        """Serve the metrics on `/metrics` from a background thread."""
+        callback = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = callback.prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: Any):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def summary(self) -> str:
+        """A table of every node and chain run so far."""
+        lines = [
+            f"{'graph':<22}{'node':<20}{'runs':>6}{'err':>5}{'p50 s':>8}{'p95 s':>8}"
+            f"{'wait s':>8}{'retry':>6}{'fanout':>7}{'llm':>5}{'prompt':>8}"
+            f"{'compl':>7}"
+        ]
+        with self._lock:
+            for (graph, node), m in sorted(self.nodes.items()):
+                lines.append(
+                    f"{graph[:21]:<22}{node[:19]:<20}{m.runs:>6}{m.errors:>5}"
+                    f"{m.latency.quantile(0.5):>8.3f}{m.latency.quantile(0.95):>8.3f}"
+                    f"{m.queue_wait.mean:>8.3f}{m.retries:>6}{m.max_fanout or '':>7}"
+                    f"{m.llm_calls:>5}{m.prompt_tokens:>8}{m.completion_tokens:>7}"
+                )
+        return "\n".join(lines)
+
+
+# The metrics of every run in the process
+metrics = MetricsCallback()
+
+_installed = False
+
+
+def install_metrics() -> MetricsCallback:
+    """Record the metrics of every run in the process in `metrics`.
+
+    Safe to call from every recipe: the callback and exporters are only set up once.
+    Nothing is recorded when `RECIPES_METRICS` is `off`.
+    """
+    global _installed
+    if _installed or os.environ.get("RECIPES_METRICS", "").lower() in OFF:
+        return metrics
+    _installed = True
+    # A default rather than a value set in this context, so every thread sees it
+    context_var: ContextVar[Optional[MetricsCallback]] = ContextVar(
+        "recipe_metrics", default=metrics
+    )
+    register_configure_hook(context_var, inheritable=True)
+    if path := os.environ.get("RECIPES_METRICS_FILE"):
+        atexit.register(metrics.write_prometheus, path)
+    if port := os.environ.get("RECIPES_METRICS_PORT"):
+        metrics.serve_prometheus(int(port))
+    return metrics
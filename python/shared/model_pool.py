@@ -0,0 +1,501 @@
+"""A chat model that spreads its calls over several backends, e.g. OpenAI-compatible
+endpoints and Ollama servers, and fails over between them.
+
+    pool = ModelPool(
+        models=[
+            chat_openai(model="gpt-4o-mini", max_retries=0),
+            ChatOllama(model="qwen2.5-coder:1.5b"),
+        ],
+        max_in_flight=[32, 2],
+    )
+    chain = registry.structured_prompt_chain(PROMPT, pool, Schema)
+
+Each call goes to the backend with the lowest score: the moving average (EWMA) of its
+latency, times the calls it has in flight plus one, divided by its moving average
+success rate. A backend whose call fails with a retryable error (a timeout,
+connection error, rate limit or server error) is left out for `cooldown` seconds and
+the call is retried on the next best backend that has not yet failed it, until one
+answers or all have failed. At most `max_in_flight` calls run on a backend at once;
+when every backend is full, calls wait for one of them to finish. Streamed calls only
+fail over until their first chunk.
+
+`with_structured_output`, `bind_tools` and copies made with `model_copy` (e.g. with
+another temperature) pool the same calls of every backend, and share its statistics
+and limits. Arguments only OpenAI's models take, like `strict`, are dropped for the
+other backends, and a structured output `method` a backend does not have falls back
+to its default. Backends that retry failed calls themselves delay the failover, so
+the OpenAI clients of a pool are best built with few retries.
+
+Tokens are counted with one tokenizer, `TOKEN_ENCODING`, whatever the backends: not
+all of them can count tokens (`ChatOllama` needs `transformers` for it), and a
+pool's counts should not depend on the order of its models. Offline, where tiktoken
+cannot download it, they are estimated from the length of the text instead.
+"""
+
+import asyncio
+import functools
+import inspect
+import math
+import threading
+import time
+import typing
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterator,
+    Optional,
+    Sequence,
+    TypeVar,
+    Union,
+)
+
+import httpx
+import tiktoken
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_openai.chat_models.base import BaseChatOpenAI
+from pydantic import PrivateAttr
+
+from shared.resilience import is_retryable
+
+T = TypeVar("T")
+
+# Weight of the latest call in the moving averages of latency and errors
+EWMA_ALPHA = 0.3
+# Latency assumed of a backend that has not answered yet, when none has
+DEFAULT_LATENCY = 1.0
+# Lowest success rate a score is divided by
+MIN_SUCCESS_RATE = 0.05
+# Arguments of `with_structured_output` and `bind_tools` only OpenAI's models take
+OPENAI_ONLY_KWARGS = {"strict", "parallel_tool_calls"}
+# The tokenizer of the gpt-4o models, and the characters per token assumed instead
+# when it cannot be loaded
+TOKEN_ENCODING = "o200k_base"
+CHARS_PER_TOKEN = 4
+
+
+def is_backend_error(error: BaseException) -> bool:
+    """Whether another backend may answer a call that failed with `error`."""
+    return is_retryable(error) or isinstance(error, httpx.TransportError)
+
+
+class Backend:
+    """Statistics and limit of one backend of a pool."""
+
+    def __init__(self, name: str, max_in_flight: int = 16):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        # Moving averages of the latency of successful calls, and of failures
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.in_flight = 0
+        self.calls = 0
+        self.failures = 0
+        self.down_until = 0.0
+
+    def score(self, default_latency: float) -> float:
+        latency = self.latency if self.latency is not None else default_latency
+        success_rate = max(MIN_SUCCESS_RATE, 1 - self.error_rate)
+        return latency * (self.in_flight + 1) / success_rate
+
+    def __repr__(self) -> str:
+        latency = "-" if self.latency is None else f"{self.latency * 1000:.0f}ms"
+        return (
+            f"Backend({self.name!r}, latency={latency}, "
+            f"error_rate={self.error_rate:.0%}, in_flight={self.in_flight}, "
+            f"calls={self.calls}, failures={self.failures})"
+        )
+
+
+class Balancer:
+    """Picks the backend for each call, and fails over to the others."""
+
+    def __init__(
+        self,
+        backends: list[Backend],
+        cooldown: float = 5.0,
+        failover: Callable[[BaseException], bool] = is_backend_error,
+    ):
+        self.backends = backends
+        self.cooldown = cooldown
+        self.failover = failover
+        self.failovers = 0
+        self._lock = threading.Lock()
+        self._freed = threading.Condition(self._lock)
+        # Async calls waiting for a backend to have room, from any loop
+        self._waiters: list[asyncio.Future] = []
+
+    def _pick(self, tried: set[int]) -> Optional[int]:
+        # Called with the lock held
+        now = time.monotonic()
+        candidates = [i for i in range(len(self.backends)) if i not in tried]
+        up = [i for i in candidates if self.backends[i].down_until <= now]
+        free = [
+            i
+            for i in up or candidates
+            if self.backends[i].in_flight < self.backends[i].max_in_flight
+        ]
+        if not free:
+            return None
+        known = [b.latency for b in self.backends if b.latency is not None]
+        default = min(known) if known else DEFAULT_LATENCY
+        best = min(free, key=lambda i: self.backends[i].score(default))
+        self.backends[best].in_flight += 1
+        return best
+
+    def _done(self, index: int, started: float, error: Optional[BaseException]):
+        """Record how a call on backend `index` went, and free its place."""
+        backend = self.backends[index]
+        with self._lock:
+            backend.calls += 1
+            if error is None:
+                latency = time.monotonic() - started
+                backend.latency = (
+                    latency
+                    if backend.latency is None
+                    else EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * backend.latency
+                )
+                backend.error_rate *= 1 - EWMA_ALPHA
+            elif self.failover(error):
+                backend.failures += 1
+                backend.error_rate = EWMA_ALPHA + (1 - EWMA_ALPHA) * backend.error_rate
+                backend.down_until = time.monotonic() + self.cooldown
+        self._release(index)
+
+    def _release(self, index: int):
+        with self._lock:
+            self.backends[index].in_flight -= 1
+            self._freed.notify_all()
+            waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            loop = waiter.get_loop()
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(_wake, waiter)
+
+    def _acquire(self, tried: set[int]) -> int:
+        with self._lock:
+            while (index := self._pick(tried)) is None:
+                self._freed.wait()
+            return index
+
+    async def _aacquire(self, tried: set[int]) -> int:
+        while True:
+            with self._lock:
+                index = self._pick(tried)
+                if index is not None:
+                    return index
+                waiter = asyncio.get_running_loop().create_future()
+                self._waiters.append(waiter)
+            await waiter
+
+    def _failed(self, error: BaseException, tried: set[int], index: int) -> bool:
+        """Whether the call that failed on backend `index` moves on to another."""
+        tried.add(index)
+        if not self.failover(error) or len(tried) == len(self.backends):
+            return False
+        self.failovers += 1
+        return True
+
+    def call(self, send: Callable[[int], T]) -> T:
+        """`send(i)` on the best backend `i`, then on the others while it fails."""
+        tried: set[int] = set()
+        while True:
+            index = self._acquire(tried)
+            started = time.monotonic()
+            try:
+                result = send(index)
+            except Exception as e:
+                self._done(index, started, e)
+                if self._failed(e, tried, index):
+                    continue
+                raise
+            self._done(index, started, None)
+            return result
+
+    async def acall(self, send: Callable[[int], Awaitable[T]]) -> T:
+        tried: set[int] = set()
+        while True:
+            index = await self._aacquire(tried)
+            started = time.monotonic()
+            try:
+                result = await send(index)
+            except Exception as e:
+                self._done(index, started, e)
+                if self._failed(e, tried, index):
+                    continue
+                raise
+            except BaseException:
+                self._release(index)
+                raise
+            self._done(index, started, None)
+            return result
+
+    def stream(self, send: Callable[[int], Iterator[T]]) -> Iterator[T]:
+        """The items of `send(i)`, failing over until the first one has arrived."""
+        tried: set[int] = set()
+        while True:
+            index = self._acquire(tried)
+            started = time.monotonic()
+            # Until the first item, whose latency is recorded, or the end
+            pending = True
+            try:
+                for item in send(index):
+                    if pending:
+                        pending = False
+                        self._done(index, started, None)
+                    yield item
+                return
+            except Exception as e:
+                if not pending:
+                    raise
+                pending = False
+                self._done(index, started, e)
+                if not self._failed(e, tried, index):
+                    raise
+            finally:
+                if pending:
+                    # Closed before its first item, or it had none
+                    self._release(index)
+
+    async def astream(
+        self, send: Callable[[int], AsyncIterator[T]]
+    ) -> AsyncIterator[T]:
+        tried: set[int] = set()
+        while True:
+            index = await self._aacquire(tried)
+            started = time.monotonic()
+            pending = True
+            try:
+                async for item in send(index):
+                    if pending:
+                        pending = False
+                        self._done(index, started, None)
+                    yield item
+                return
+            except Exception as e:
+                if not pending:
+                    raise
+                pending = False
+                self._done(index, started, e)
+                if not self._failed(e, tried, index):
+                    raise
+            finally:
+                if pending:
+                    self._release(index)
+
+    def __repr__(self) -> str:
+        backends = ", ".join(map(repr, self.backends))
+        return f"Balancer(failovers={self.failovers}, backends=[{backends}])"
+
+
+def _wake(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+def backend_kwargs(model: BaseChatModel, kwargs: dict[str, Any]) -> dict[str, Any]:
+    """The arguments of a pooled `with_structured_output` or `bind_tools` that `model`
+    takes: without OpenAI's own, and without a `method` it does not declare."""
+    if isinstance(model, BaseChatOpenAI):
+        return kwargs
+    kwargs = {k: v for k, v in kwargs.items() if k not in OPENAI_ONLY_KWARGS}
+    if "method" in kwargs:
+        parameter = inspect.signature(model.with_structured_output).parameters.get(
+            "method"
+        )
+        methods = typing.get_args(parameter.annotation) if parameter else ()
+        if methods and kwargs["method"] not in methods:
+            del kwargs["method"]
+    return kwargs
+
+
+@functools.lru_cache
+def _token_encoding() -> Optional[tiktoken.Encoding]:
+    try:
+        return tiktoken.get_encoding(TOKEN_ENCODING)
+    except Exception:
+        # tiktoken downloads the encoding on first use, which fails offline
+        return None
+
+
+def backend_name(model: BaseChatModel) -> str:
+    """The model and, if set, the base URL of a backend, e.g. `gpt-4o-mini@http://...`."""
+    name = getattr(model, "model_name", None) or getattr(model, "model", None)
+    url = getattr(model, "openai_api_base", None) or getattr(model, "base_url", None)
+    return f"{name or type(model).__name__}@{url}" if url else str(name)
+
+
+class PooledRunnable(Runnable):
+    """The same runnable built from each backend of a pool, e.g. its structured
+    output, called through the pool's `Balancer`."""
+
+    def __init__(self, runnables: Sequence[Runnable], balancer: Balancer):
+        self.runnables = list(runnables)
+        self.balancer = balancer
+
+    def invoke(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> Any:
+        return self.balancer.call(
+            lambda i: self.runnables[i].invoke(input, config, **kwargs)
+        )
+
+    async def ainvoke(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> Any:
+        return await self.balancer.acall(
+            lambda i: self.runnables[i].ainvoke(input, config, **kwargs)
+        )
+
+    def stream(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> Iterator[Any]:
+        yield from self.balancer.stream(
+            lambda i: self.runnables[i].stream(input, config, **kwargs)
+        )
+
+    async def astream(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> AsyncIterator[Any]:
+        async for chunk in self.balancer.astream(
+            lambda i: self.runnables[i].astream(input, config, **kwargs)
+        ):
+            yield chunk
+
+
+class ModelPool(BaseChatModel):
+    """A chat model that calls one of `models`, chosen as described above.
+
+    `max_in_flight` is the most calls a backend runs at once, for every backend or one
+    per backend; `names` default to the model and base URL of each.
+    """
+
+    models: list[BaseChatModel]
+    max_in_flight: Union[int, list[int]] = 16
+    names: Optional[list[str]] = None
+    cooldown: float = 5.0
+    _balancer: Balancer = PrivateAttr()
+
+    def model_post_init(self, context: Any):
+        super().model_post_init(context)
+        limits = (
+            self.max_in_flight
+            if isinstance(self.max_in_flight, list)
+            else [self.max_in_flight] * len(self.models)
+        )
+        names = self.names or [backend_name(model) for model in self.models]
+        self._balancer = Balancer(
+            [Backend(name, limit) for name, limit in zip(names, limits)],
+            cooldown=self.cooldown,
+        )
+
+    @property
+    def balancer(self) -> Balancer:
+        return self._balancer
+
+    @property
+    def backends(self) -> list[Backend]:
+        return self._balancer.backends
+
+    @property
+    def _llm_type(self) -> str:
+        return "model-pool"
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        # Cacheable when the backends share a temperature, as for a single model
+        temperatures = {getattr(model, "temperature", None) for model in self.models}
+        return {
+            "model": "|".join(backend.name for backend in self.backends),
+            "temperature": temperatures.pop() if len(temperatures) == 1 else None,
+        }
+
+    def model_copy(self, *, update: Optional[dict] = None, deep: bool = False):
+        """A copy sharing the backends' statistics and limits, with the fields of
+        `update` that are not the pool's own (e.g. `temperature`) set on every model."""
+        update = dict(update or {})
+        own = {k: update.pop(k) for k in list(update) if k in type(self).model_fields}
+        copy = super().model_copy(update=own, deep=deep)
+        if update:
+            copy.models = [model.model_copy(update=update) for model in self.models]
+        # Private attributes are copied, so the copy shares the balancer
+        copy._balancer = self._balancer
+        return copy
+
+    def get_num_tokens(self, text: str) -> int:
+        # Messages are counted from this too, by `get_num_tokens_from_messages`
+        encoding = _token_encoding()
+        if encoding is None:
+            return math.ceil(len(text) / CHARS_PER_TOKEN)
+        return len(encoding.encode(text))
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return self._balancer.call(
+            lambda i: self.models[i]._generate(messages, stop, run_manager, **kwargs)
+        )
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return await self._balancer.acall(
+            lambda i: self.models[i]._agenerate(messages, stop, run_manager, **kwargs)
+        )
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        yield from self._balancer.stream(
+            lambda i: self.models[i]._stream(messages, stop, run_manager, **kwargs)
+        )
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        async for chunk in self._balancer.astream(
+            lambda i: self.models[i]._astream(messages, stop, run_manager, **kwargs)
+        ):
+            yield chunk
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> Runnable:  # type: ignore[override]
+        return PooledRunnable(
+            [
+                model.bind_tools(tools, **backend_kwargs(model, kwargs))
+                for model in self.models
+            ],
+            self._balancer,
+        )
+
+    def with_structured_output(self, schema: Any, **kwargs: Any) -> Runnable:  # type: ignore[override]
+        return PooledRunnable(
+            [
+                model.with_structured_output(schema, **backend_kwargs(model, kwargs))
+                for model in self.models
+            ],
+            self._balancer,
+        )
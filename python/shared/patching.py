@@ -0,0 +1,78 @@
+import re
+
+_HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+# How far from its stated position a hunk may have moved and still be applied
+_MAX_OFFSET = 50
+
+
+class PatchError(ValueError):
+    """Raised when a diff does not apply to the code it was generated against."""
+
+
+def apply_unified_diff(source: str, diff: str) -> str:
+    """Apply a unified diff (as produced by `diff -u` / `difflib.unified_diff`) to `source`.
+
+    File headers (`---`/`+++`) are optional. Each hunk's context and removed lines must
+    match `source`, but the hunk may sit a few lines away from the position in its header,
+    since models often get line numbers slightly wrong.
+    """
+    lines = source.splitlines()
+    hunks = _parse_hunks(diff)
+    if not hunks:
+        raise PatchError("diff contains no hunks")
+
+    result: list[str] = []
+    position = 0
+    for start, old, new in hunks:
+        index = _find_hunk(lines, old, start, position)
+        result.extend(lines[position:index])
+        result.extend(new)
+        position = index + len(old)
+    result.extend(lines[position:])
+    return "\n".join(result) + ("\n" if source.endswith("\n") or not source else "")
+
+
+def _parse_hunks(diff: str) -> list[tuple[int, list[str], list[str]]]:
+    hunks: list[tuple[int, list[str], list[str]]] = []
+    old: list[str] = []
+    new: list[str] = []
+    start = None
+    for line in diff.splitlines():
+        header = _HUNK_HEADER.match(line)
+        if header:
+            if start is not None:
+                hunks.append((start, old, new))
+            # A hunk that removes nothing is positioned after its start line
+            start = int(header.group(1)) - (header.group(2) != "0")
+            start = max(start, 0)
+            old, new = [], []
+        elif start is None:
+            continue  # file headers and anything else before the first hunk
+        elif line.startswith("-"):
+            old.append(line[1:])
+        elif line.startswith("+"):
+            new.append(line[1:])
+        elif line.startswith(" ") or line == "":
+            old.append(line[1:])
+            new.append(line[1:])
+        elif line.startswith("\\"):
+            continue  # "\ No newline at end of file"
+        else:
+            raise PatchError(f"unexpected line in diff: {line!r}")
+    if start is not None:
+        hunks.append((start, old, new))
+    return hunks
+
+
+def _find_hunk(lines: list[str], old: list[str], start: int, minimum: int) -> int:
+    def matches(index: int) -> bool:
+        window = lines[index : index + len(old)]
+        return len(window) == len(old) and all(
+            a.rstrip() == b.rstrip() for a, b in zip(window, old)
+        )
+
+    for offset in range(_MAX_OFFSET + 1):
+        for index in (start + offset, start - offset):
+            if index >= minimum and matches(index):
+                return index
+    raise PatchError(f"hunk at line {start + 1} does not match the code")
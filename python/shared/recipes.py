@@ -0,0 +1,26 @@
+import importlib.util
+import sys
+from pathlib import Path
+from types import ModuleType
+
+PYTHON_DIR = Path(__file__).resolve().parents[1]
+
+
+def load_recipe(relative_path: str) -> ModuleType:
+    """Import a recipe script such as `langchain/evaluator_optimizer.py` as a module.
+
+    The recipe directories are named after the libraries they use, so they cannot be
+    imported as packages. Each recipe is loaded once under a unique module name.
+    """
+    name = "recipe_" + relative_path.removesuffix(".py").replace("/", "_")
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, PYTHON_DIR / relative_path)
+    module = importlib.util.module_from_spec(spec)  # type: ignore
+    sys.modules[name] = module
+    try:
+        spec.loader.exec_module(module)  # type: ignore
+    except BaseException:
+        del sys.modules[name]
+        raise
+    return module
@@ -0,0 +1,133 @@
+from typing import Any, Callable, Hashable, Optional, Sequence
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.output_parsers import BaseOutputParser
+from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
+from langchain_core.runnables import Runnable
+
+
+class RunnableRegistry:
+    """Builds each prompt / structured-output runnable once and reuses it on later calls.
+
+    Runnables are keyed by the identity of the model and parser they wrap, so swapping
+    a recipe's module-level `model` (e.g. for a fake one) builds fresh runnables for it.
+    """
+
+    def __init__(self):
+        self._runnables: dict[Hashable, tuple[Runnable, tuple]] = {}
+
+    def get(
+        self, key: Hashable, factory: Callable[[], Runnable], *keep_alive: Any
+    ) -> Runnable:
+        """Return the runnable stored under `key`, building it with `factory` on first use.
+
+        `keep_alive` holds references to the objects whose `id()` is part of `key`,
+        so their ids cannot be reused while the entry exists.
+        """
+        entry = self._runnables.get(key)
+        if entry is None:
+            entry = (factory(), keep_alive)
+            self._runnables[key] = entry
+        return entry[0]
+
+    def variant(self, model: BaseChatModel, **updates: Any) -> BaseChatModel:
+        """A copy of `model` with some fields changed, e.g. `temperature`."""
+        key = ("variant", id(model), tuple(sorted(updates.items())))
+        return self.get(key, lambda: model.model_copy(update=updates), model)  # type: ignore
+
+    def chain(
+        self, model: BaseChatModel, parser: Optional[BaseOutputParser] = None
+    ) -> Runnable:
+        """`model | parser`."""
+        key = ("chain", id(model), id(parser))
+        return self.get(key, lambda: model | parser if parser else model, model, parser)
+
+    def structured(self, model: BaseChatModel, schema: Any, **kwargs: Any) -> Runnable:
+        """`model.with_structured_output(schema, **kwargs)`."""
+        key = ("structured", id(model), id(schema), tuple(sorted(kwargs.items())))
+        return self.get(
+            key, lambda: model.with_structured_output(schema, **kwargs), model, schema
+        )
+
+    def prompt_chain(
+        self,
+        template: str,
+        model: BaseChatModel,
+        parser: Optional[BaseOutputParser] = None,
+    ) -> Runnable:
+        """`PromptTemplate.from_template(template) | model | parser`."""
+        key = ("prompt_chain", template, id(model), id(parser))
+        return self.get(
+            key,
+            lambda: PromptTemplate.from_template(template) | self.chain(model, parser),
+            model,
+            parser,
+        )
+
+    def chat_prompt_chain(
+        self,
+        messages: Sequence[tuple[str, str]],
+        model: BaseChatModel,
+        parser: Optional[BaseOutputParser] = None,
+    ) -> Runnable:
+        """`ChatPromptTemplate.from_messages(messages) | model | parser`."""
+        key = ("chat_prompt_chain", tuple(messages), id(model), id(parser))
+        return self.get(
+            key,
+            lambda: ChatPromptTemplate.from_messages(list(messages))
+            | self.chain(model, parser),
+            model,
+            parser,
+        )
+
+    def structured_prompt_chain(
+        self, template: str, model: BaseChatModel, schema: Any, **kwargs: Any
+    ) -> Runnable:
+        """`PromptTemplate.from_template(template) | model.with_structured_output(schema, **kwargs)`."""
+        key = (
+            "structured_prompt_chain",
+            template,
+            id(model),
+            id(schema),
+            tuple(sorted(kwargs.items())),
+        )
+        return self.get(
+            key,
+            lambda: PromptTemplate.from_template(template)
+            | self.structured(model, schema, **kwargs),
+            model,
+            schema,
+        )
+
+    def structured_chat_prompt_chain(
+        self,
+        messages: Sequence[tuple[str, str]],
+        model: BaseChatModel,
+        schema: Any,
+        **kwargs: Any,
+    ) -> Runnable:
+        """`ChatPromptTemplate.from_messages(messages) | model.with_structured_output(schema, **kwargs)`."""
+        key = (
+            "structured_chat_prompt_chain",
+            tuple(messages),
+            id(model),
+            id(schema),
+            tuple(sorted(kwargs.items())),
+        )
+        return self.get(
+            key,
+            lambda: ChatPromptTemplate.from_messages(list(messages))
+            | self.structured(model, schema, **kwargs),
+            model,
+            schema,
+        )
+
+    def clear(self):
+        self._runnables.clear()
+
+    def __len__(self) -> int:
+        return len(self._runnables)
+
+
+# The registry shared by every recipe in the process
+registry = RunnableRegistry()
@@ -0,0 +1,139 @@
+import asyncio
+import functools
+import random
+import time
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+from shared.metrics import metrics
+
+T = TypeVar("T")
+
+# HTTP statuses worth retrying: timeouts, conflicts, rate limits and server errors
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+# Error class names of the OpenAI client for failed or timed out connections
+RETRYABLE_ERROR_NAMES = {"APIConnectionError", "APITimeoutError"}
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether `error` is a timeout, connection error, rate limit or server error."""
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    if type(error).__name__ in RETRYABLE_ERROR_NAMES:
+        return True
+    return getattr(error, "status_code", None) in RETRYABLE_STATUS_CODES
+
+
+class RetryStats:
+    """Counters of a `ResilientNode`, shared by every node it wraps."""
+
+    def __init__(self):
+        self.calls = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def __repr__(self) -> str:
+        return (
+            f"RetryStats(calls={self.calls}, retries={self.retries}, "
+            f"timeouts={self.timeouts}, failures={self.failures}, "
+            f"peak_in_flight={self.peak_in_flight})"
+        )
+
+
+class ResilientNode:
+    """Wraps async graph nodes with a concurrency limit, timeouts and retries.
+
+    Meant for the nodes a fan-out of `Send`s runs in parallel: at most `max_in_flight`
+    calls of the wrapped nodes run at once, each attempt is cancelled after `timeout`
+    seconds, and attempts that fail with a retryable error are retried up to
+    `max_attempts` in total, with exponential backoff and full jitter in between.
+    The time each call waits for a slot, and its retries, are recorded in
+    `shared.metrics` against the node being run.
+
+        guard = ResilientNode(max_in_flight=4)
+        workflow.add_node("process", guard(process_task))
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 8,
+        max_attempts: int = 4,
+        timeout: Optional[float] = 60.0,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        retryable: Callable[[BaseException], bool] = is_retryable,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retryable = retryable
+        self.stats = RetryStats()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def __call__(
+        self, node: Callable[..., Awaitable[T]]
+    ) -> Callable[..., Awaitable[T]]:
+        @functools.wraps(node)
+        async def wrapped(*args: Any, **kwargs: Any) -> T:
+            return await self.run(lambda: node(*args, **kwargs))
+
+        return wrapped
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # A semaphore only works within one event loop, e.g. one `asyncio.run`
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+            self._loop = loop
+        return self._semaphore
+
+    def backoff(self, attempt: int) -> float:
+        """Seconds to wait before retrying after the `attempt`-th failed attempt (from 1)."""
+        return random.uniform(
+            0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        )
+
+    async def run(
+        self, call: Callable[[], Awaitable[T]], max_attempts: Optional[int] = None
+    ) -> T:
+        """Run `call()` under the concurrency limit, retrying it on retryable errors.
+
+        `max_attempts` overrides the node's own, e.g. 1 for a call whose caller has a
+        cheaper fallback than running it again.
+        """
+        max_attempts = max_attempts or self.max_attempts
+        attempt = 1
+        while True:
+            try:
+                return await self._attempt(call)
+            except Exception as e:
+                if attempt >= max_attempts or not self.retryable(e):
+                    self.stats.failures += 1
+                    raise
+                self.stats.retries += 1
+                metrics.record_retry()
+                # Sleep outside the semaphore, so other branches can use the slot
+                await asyncio.sleep(self.backoff(attempt))
+                attempt += 1
+
+    async def _attempt(self, call: Callable[[], Awaitable[T]]) -> T:
+        queued = time.perf_counter()
+        async with self._get_semaphore():
+            metrics.record_queue_wait(time.perf_counter() - queued)
+            self.stats.calls += 1
+            self.stats.in_flight += 1
+            self.stats.peak_in_flight = max(
+                self.stats.peak_in_flight, self.stats.in_flight
+            )
+            try:
+                return await asyncio.wait_for(call(), self.timeout)
+            except asyncio.TimeoutError:
+                self.stats.timeouts += 1
+                raise
+            finally:
+                self.stats.in_flight -= 1
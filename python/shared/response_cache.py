@@ -0,0 +1,446 @@
+"""A persistent cache of chat model responses, shared by the recipes.
+
+    from shared.response_cache import install_response_cache
+
+    install_response_cache()
+
+Responses are stored in SQLite, keyed by the model and its parameters (including
+bound tools and structured output schemas) and the messages sent to it, so rerunning
+a recipe, or another recipe sending the same prompt, does not call the model again.
+Only calls at temperature 0 are cached: at any other temperature a new sample is
+what the caller asked for. A response served from the cache reports zero tokens, as
+it cost none; the usage of the call that was cached is in its `cached_usage`
+response metadata.
+
+Set `RECIPES_RESPONSE_CACHE` to the path of the database, or to `off` to disable the
+cache. The hit rates and the dollars saved by each recipe are kept in the database:
+
+    cd python
+    python -m shared.response_cache stats
+    python -m shared.response_cache clear
+"""
+
+import argparse
+import ast
+import atexit
+import functools
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterator, Optional, Sequence
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.globals import get_llm_cache, set_llm_cache
+from langchain_core.messages import AIMessage, message_to_dict, messages_from_dict
+from langchain_core.messages.ai import UsageMetadata
+from langchain_core.outputs import ChatGeneration, Generation
+
+from shared.recipes import PYTHON_DIR
+
+DEFAULT_CACHE_PATH = Path.home() / ".cache" / "agent-recipes" / "responses.sqlite"
+# Entries older than this are not served, and are deleted when the cache is evicted
+CACHE_TTL = 30 * 24 * 3600.0
+# Past this many bytes of responses, the least recently used ones are deleted...
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+# ...down to this fraction of it, so that eviction does not run on every update
+EVICT_TARGET_RATIO = 0.9
+# Responses kept in memory, in front of the database
+MEMORY_CACHE_SIZE = 1024
+
+# Dollars per million input and output tokens
+PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+}
+
+# Message fields that differ between two calls returning the same response
+_VOLATILE_MESSAGE_FIELDS = ("id", "response_metadata", "usage_metadata")
+_TEMPERATURE = re.compile(r"\('temperature', ([0-9.]+)\)")
+
+
+@functools.cache
+def _scope_from_argv() -> str:
+    """The running recipe, e.g. `langchain/routing`, or the script's name."""
+    script = Path(sys.argv[0] or "python").resolve()
+    try:
+        return str(script.relative_to(PYTHON_DIR).with_suffix(""))
+    except ValueError:
+        return script.stem
+
+
+_scope: ContextVar[Optional[str]] = ContextVar("response_cache_scope", default=None)
+
+
+@contextmanager
+def cache_scope(name: str) -> Iterator[None]:
+    """Count the cache lookups made inside the `with` block under `name`.
+
+    Lookups outside any scope are counted under the script being run.
+    """
+    token = _scope.set(name)
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def cacheable_model(llm_string: str) -> Optional[str]:
+    """The model name of a call that may be served from the cache, else `None`.
+
+    `llm_string` is how LangChain describes the model and call parameters to a cache.
+    Calls whose model cannot be told apart from others (e.g. `ChatOllama`'s, which
+    leaves out the model name) or whose temperature is not 0 are not cached.
+    """
+    serialized, _, params = llm_string.partition("---")
+    try:
+        if params:
+            fields = json.loads(serialized).get("kwargs", {})
+        else:
+            fields = dict(ast.literal_eval(serialized))  # [(key, value), ...]
+    except Exception:
+        return None
+    model = fields.get("model_name") or fields.get("model")
+    temperature = fields.get("temperature")
+    bound = _TEMPERATURE.search(params)
+    if bound:
+        temperature = float(bound.group(1))
+    if not isinstance(model, str) or temperature != 0:
+        return None
+    return model
+
+
+def normalize_prompt(prompt: str) -> str:
+    """The serialized messages without the fields that vary from run to run."""
+    messages = json.loads(prompt)
+    for message in messages:
+        fields = message.get("kwargs", {})
+        for name in _VOLATILE_MESSAGE_FIELDS:
+            fields.pop(name, None)
+    return json.dumps(messages, sort_keys=True, separators=(",", ":"))
+
+
+def cache_key(prompt: str, llm_string: str) -> str:
+    return hashlib.sha256(
+        f"{llm_string}\n{normalize_prompt(prompt)}".encode("utf-8")
+    ).hexdigest()
+
+
+def dump_generations(generations: Sequence[Generation]) -> str:
+    records = []
+    for generation in generations:
+        if isinstance(generation, ChatGeneration):
+            message = message_to_dict(generation.message)
+            # A cached message is returned for many calls, so it gets no id of its own
+            message["data"]["id"] = None
+            records.append({"message": message})
+        else:
+            records.append({"text": generation.text})
+    return json.dumps(records, ensure_ascii=False)
+
+
+def load_generations(value: str) -> list[Generation]:
+    generations: list[Generation] = []
+    for record in json.loads(value):
+        if "message" in record:
+            message = messages_from_dict([record["message"]])[0]
+            generations.append(ChatGeneration(message=message))
+        else:
+            generations.append(Generation(text=record["text"]))
+    return generations
+
+
+def served_from_cache(generations: Sequence[Generation]) -> list[Generation]:
+    """`generations` as returned for a cache hit: their messages keep the usage of
+    the call that was cached in their `response_metadata`, under `cached_usage`, and
+    report zero tokens, so that token counts and costs only add up calls made."""
+    for generation in generations:
+        message = getattr(generation, "message", None)
+        if isinstance(message, AIMessage) and message.usage_metadata:
+            message.response_metadata["cached_usage"] = dict(message.usage_metadata)
+            message.usage_metadata = UsageMetadata(
+                input_tokens=0, output_tokens=0, total_tokens=0
+            )
+    return list(generations)
+
+
+def token_cost(model: str, input_tokens: int, output_tokens: int) -> float:
+    """Dollars `model` charges for the tokens, 0 for unknown models."""
+    # Dated snapshots are priced like their model, e.g. gpt-4o-2024-08-06
+    prices = next(
+        (
+            PRICES[name]
+            for name in sorted(PRICES, key=len, reverse=True)
+            if model.startswith(name)
+        ),
+        None,
+    )
+    if prices is None:
+        return 0.0
+    return (input_tokens * prices[0] + output_tokens * prices[1]) / 1e6
+
+
+def response_cost(model: str, generations: Sequence[Generation]) -> float:
+    """Dollars the call that returned `generations` cost, 0 for unknown models."""
+    cost = 0.0
+    for generation in generations:
+        usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+        if usage:
+            cost += token_cost(
+                model, usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+            )
+    return cost
+
+
+@dataclass
+class ScopeStats:
+    """Cache lookups of one recipe."""
+
+    lookups: int = 0
+    hits: int = 0
+    memory_hits: int = 0
+    saved_usd: float = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+
+class ResponseCache(BaseCache):
+    """SQLite cache of chat model responses, with an LRU of recent ones in memory.
+
+    Entries expire after `ttl` seconds, and once the responses take more than
+    `max_bytes`, the least recently used ones are deleted. Lookups are counted per
+    `cache_scope`; `flush_stats` adds the counts to the totals in the database.
+    """
+
+    def __init__(
+        self,
+        path: Path | str = DEFAULT_CACHE_PATH,
+        ttl: Optional[float] = CACHE_TTL,
+        max_bytes: int = CACHE_MAX_BYTES,
+        memory_size: int = MEMORY_CACHE_SIZE,
+    ):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.memory_size = memory_size
+        self.stats: dict[str, ScopeStats] = {}
+        # key -> (model, serialized generations, time stored)
+        self._memory: OrderedDict[str, tuple[str, str, float]] = OrderedDict()
+        # Lookups come from the event loop's executor threads as well
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        with self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, "
+                "model TEXT, value TEXT, size INTEGER, created REAL, accessed REAL)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS stats (scope TEXT PRIMARY KEY, "
+                "lookups INTEGER, hits INTEGER, saved_usd REAL)"
+            )
+        self._size = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl is not None and created < time.time() - self.ttl
+
+    def _scope_stats(self) -> ScopeStats:
+        scope = _scope.get() or _scope_from_argv()
+        return self.stats.setdefault(scope, ScopeStats())
+
+    def _find(self, key: str) -> Optional[tuple[str, str, float, bool]]:
+        """The model, value and time stored of `key`, and whether it was in memory."""
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+            return (*entry, True)
+        row = self._db.execute(
+            "SELECT model, value, created FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        with self._db:
+            self._db.execute(
+                "UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key)
+            )
+        self._remember(key, row)
+        return (*row, False)
+
+    def _remember(self, key: str, entry: tuple[str, str, float]):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        if cacheable_model(llm_string) is None:
+            return None
+        key = cache_key(prompt, llm_string)
+        with self._lock:
+            stats = self._scope_stats()
+            stats.lookups += 1
+            found = self._find(key)
+            if found is None:
+                return None
+            if self._expired(found[2]):
+                self._memory.pop(key, None)
+                return None
+            model, value, _, in_memory = found
+            generations = load_generations(value)
+            stats.hits += 1
+            stats.memory_hits += in_memory
+            stats.saved_usd += response_cost(model, generations)
+        return served_from_cache(generations)
+
+    async def alookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        # Most hits are served from memory; only go to a thread for the database
+        if cache_key(prompt, llm_string) in self._memory:
+            return self.lookup(prompt, llm_string)
+        return await super().alookup(prompt, llm_string)
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        model = cacheable_model(llm_string)
+        if model is None:
+            return
+        key = cache_key(prompt, llm_string)
+        value = dump_generations(return_val)
+        size = len(value.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            with self._db:
+                previous = self._db.execute(
+                    "SELECT size FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, model, value, size, now, now),
+                )
+            self._size += size - (previous[0] if previous else 0)
+            self._remember(key, (model, value, now))
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Delete expired entries, then the least recently used ones over budget."""
+        with self._db:
+            if self.ttl is not None:
+                self._db.execute(
+                    "DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,)
+                )
+            self._size = self._db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()[0]
+            target = self.max_bytes * EVICT_TARGET_RATIO
+            rows = self._db.execute(
+                "SELECT key, size FROM responses ORDER BY accessed"
+            ).fetchall()
+            evicted = []
+            for key, size in rows:
+                if self._size <= target:
+                    break
+                evicted.append((key,))
+                self._size -= size
+                self._memory.pop(key, None)
+            self._db.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM responses")
+            self._memory.clear()
+            self._size = 0
+
+    def flush_stats(self):
+        """Add the lookups counted so far to the totals stored in the database."""
+        with self._lock, self._db:
+            for scope, stats in self.stats.items():
+                self._db.execute(
+                    "INSERT INTO stats VALUES (?, ?, ?, ?) ON CONFLICT(scope) DO UPDATE "
+                    "SET lookups = lookups + excluded.lookups, "
+                    "hits = hits + excluded.hits, "
+                    "saved_usd = saved_usd + excluded.saved_usd",
+                    (scope, stats.lookups, stats.hits, stats.saved_usd),
+                )
+            self.stats.clear()
+
+    def stored_stats(self) -> dict[str, ScopeStats]:
+        """The totals of every recipe that has used the database."""
+        rows = self._db.execute(
+            "SELECT scope, lookups, hits, saved_usd FROM stats ORDER BY scope"
+        )
+        return {
+            scope: ScopeStats(lookups=lookups, hits=hits, saved_usd=saved_usd)
+            for scope, lookups, hits, saved_usd in rows
+        }
+
+    def entries(self) -> int:
+        # Not `__len__`: LangChain only uses a cache that is truthy
+        return self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def __repr__(self) -> str:
+        return f"ResponseCache(path={str(self.path)!r}, entries={self.entries()})"
+
+
+def format_stats(stats: dict[str, ScopeStats]) -> str:
+    lines = [f"{'recipe':<36}{'lookups':>9}{'hits':>8}{'hit rate':>10}{'saved $':>10}"]
+    for scope, s in stats.items():
+        lines.append(
+            f"{scope:<36}{s.lookups:>9}{s.hits:>8}{s.hit_rate:>10.0%}"
+            f"{s.saved_usd:>10.4f}"
+        )
+    return "\n".join(lines)
+
+
+def install_response_cache(
+    path: Optional[Path | str] = None, **kwargs: Any
+) -> Optional[ResponseCache]:
+    """Use a `ResponseCache` for every chat model call in the process.
+
+    Safe to call from every recipe: the cache is only created once. Returns `None`
+    when `RECIPES_RESPONSE_CACHE` is `off`.
+    """
+    cache = get_llm_cache()
+    if isinstance(cache, ResponseCache):
+        return cache
+    setting = os.environ.get("RECIPES_RESPONSE_CACHE", "")
+    if setting.lower() in ("off", "0", "false"):
+        return None
+    cache = ResponseCache(path or setting or DEFAULT_CACHE_PATH, **kwargs)
+    set_llm_cache(cache)
+    atexit.register(cache.flush_stats)
+    return cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect the response cache.")
+    parser.add_argument("command", choices=["stats", "clear"])
+    parser.add_argument(
+        "--path",
+        type=Path,
+        default=os.environ.get("RECIPES_RESPONSE_CACHE") or DEFAULT_CACHE_PATH,
+    )
+    args = parser.parse_args()
+    cache = ResponseCache(args.path)
+    if args.command == "clear":
+        cache.clear()
+    print(cache)
+    print(format_stats(cache.stored_stats()))
+
+
+if __name__ == "__main__":
+    main()
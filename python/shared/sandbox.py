@@ -0,0 +1,270 @@
+import asyncio
+import json
+import os
+import signal
+import sys
+import tempfile
+import weakref
+from typing import Literal, NotRequired, Optional, TypedDict
+
+try:
+    import resource
+except ImportError:  # Windows: the tests still run, just without rlimits
+    resource = None  # type: ignore
+
+
+# Test processes run at once, by all evaluators together
+MAX_WORKERS = int(os.environ.get("RECIPES_SANDBOX_WORKERS", 4))
+
+# A semaphore can only be awaited from its own loop, so each loop has its own
+# MAX_WORKERS slots; the recipes run their loops one after the other
+_worker_slots: weakref.WeakKeyDictionary[
+    asyncio.AbstractEventLoop, asyncio.Semaphore
+] = weakref.WeakKeyDictionary()
+
+
+def worker_slots() -> asyncio.Semaphore:
+    """The slots for test processes shared by every evaluator on the running loop."""
+    loop = asyncio.get_running_loop()
+    slots = _worker_slots.get(loop)
+    if slots is None:
+        slots = _worker_slots[loop] = asyncio.Semaphore(MAX_WORKERS)
+    return slots
+
+
+class TestCase(TypedDict):
+    """A test run against generated code.
+
+    `code` is executed after the generated code, in the same namespace, and fails the
+    test by raising (typically with `assert`). When `max_seconds` is set the test is
+    also a timing check and fails if `code` takes longer than that.
+    """
+
+    name: str
+    code: str
+    max_seconds: NotRequired[float]
+
+
+class TestResult(TypedDict):
+    name: str
+    status: Literal["passed", "failed", "error", "timeout"]
+    seconds: float
+    message: str
+
+
+# Runs in the child process: executes the generated code and one test, then reports
+# the outcome as a single JSON line on the file descriptor given as its argument, and
+# exits before any `atexit` handler of the code runs. Output the code prints, even to
+# `sys.__stdout__` or at exit, therefore cannot pass for a verdict. The code runs in
+# this process, though, so code written to fake a verdict can still find the
+# descriptor and write to it: like the rest of the sandbox this guards against
+# mistakes, not against adversarial code.
+_HARNESS = r"""
+import contextlib, io, json, os, sys, time, traceback
+
+def main():
+    payload = json.loads(sys.stdin.read())
+    report = int(sys.argv[1])
+    result = {"status": "passed", "seconds": 0.0, "message": ""}
+    namespace = {"__name__": "__candidate__"}
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        try:
+            exec(compile(payload["code"], "<candidate>", "exec"), namespace)
+        except BaseException:
+            result.update(status="error", message=traceback.format_exc(limit=3))
+        else:
+            start = time.perf_counter()
+            try:
+                exec(compile(payload["test"], "<test>", "exec"), namespace)
+            except AssertionError as e:
+                result.update(status="failed", message="AssertionError: " + str(e))
+            except BaseException:
+                result.update(status="failed", message=traceback.format_exc(limit=3))
+            result["seconds"] = time.perf_counter() - start
+            max_seconds = payload.get("max_seconds")
+            if result["status"] == "passed" and max_seconds is not None and result["seconds"] > max_seconds:
+                result.update(status="failed", message="took %.3fs, limit is %.3fs" % (result["seconds"], max_seconds))
+    line = (json.dumps(result) + "\n").encode()
+    while line:
+        line = line[os.write(report, line):]
+    os._exit(0)
+
+main()
+"""
+
+
+class ExecutionEvaluator:
+    """Evaluates generated code by running it against test cases in subprocesses.
+
+    Every test runs in a fresh `python -I` process in an empty temporary directory,
+    with CPU-time, address-space and file-size limits, and is killed when it exceeds
+    the wall-clock `timeout`. At most `MAX_WORKERS` processes run at once, counted
+    over every evaluator, so that recipes that create one per candidate do not run a
+    pool of them each. This keeps buggy or runaway code away from the recipe process;
+    it is not a security boundary for hostile code (there is no network or filesystem
+    isolation).
+    """
+
+    def __init__(
+        self,
+        test_cases: list[TestCase],
+        timeout: float = 10.0,
+        cpu_seconds: int = 5,
+        memory_mb: int = 512,
+    ):
+        self.test_cases = test_cases
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+
+    def _limit_resources(self):
+        if resource is None:
+            return
+        # The soft limit sends SIGXCPU, the hard limit a second later SIGKILL
+        resource.setrlimit(
+            resource.RLIMIT_CPU, (self.cpu_seconds, self.cpu_seconds + 1)
+        )
+        memory = self.memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+        resource.setrlimit(resource.RLIMIT_FSIZE, (1024 * 1024, 1024 * 1024))
+
+    async def run_test(self, code: str, test_case: TestCase) -> TestResult:
+        payload = json.dumps(
+            {
+                "code": code,
+                "test": test_case["code"],
+                "max_seconds": test_case.get("max_seconds"),
+            }
+        ).encode()
+        async with worker_slots():
+            with tempfile.TemporaryDirectory() as workdir:
+                read_end, write_end = os.pipe()
+                try:
+                    process = await asyncio.create_subprocess_exec(
+                        sys.executable,
+                        "-I",
+                        "-c",
+                        _HARNESS,
+                        str(write_end),
+                        stdin=asyncio.subprocess.PIPE,
+                        stdout=asyncio.subprocess.DEVNULL,
+                        stderr=asyncio.subprocess.PIPE,
+                        cwd=workdir,
+                        env={"PATH": os.environ.get("PATH", "")},
+                        preexec_fn=self._limit_resources if resource else None,
+                        start_new_session=True,
+                        pass_fds=(write_end,),
+                    )
+                except BaseException:
+                    os.close(read_end)
+                    raise
+                finally:
+                    os.close(write_end)
+                try:
+                    (_, stderr), report = await asyncio.wait_for(
+                        asyncio.gather(
+                            process.communicate(payload), _read_report(read_end)
+                        ),
+                        self.timeout,
+                    )
+                except asyncio.TimeoutError:
+                    _kill(process)
+                    await process.wait()
+                    return TestResult(
+                        name=test_case["name"],
+                        status="timeout",
+                        seconds=self.timeout,
+                        message=f"killed after {self.timeout}s",
+                    )
+                except asyncio.CancelledError:
+                    _kill(process)
+                    raise
+
+        try:
+            result = json.loads(report.split(b"\n", 1)[0])
+        except ValueError:
+            # The child died before reporting, e.g. on the CPU or memory limit
+            reason = _describe_exit(process.returncode)
+            detail = stderr.decode(errors="replace").strip()[-500:]
+            return TestResult(
+                name=test_case["name"],
+                status="error",
+                seconds=0.0,
+                message=f"{reason}\n{detail}".strip(),
+            )
+        return TestResult(name=test_case["name"], **result)
+
+    async def run(self, code: str) -> list[TestResult]:
+        """Run every test case against `code`."""
+        return list(
+            await asyncio.gather(
+                *[self.run_test(code, test_case) for test_case in self.test_cases]
+            )
+        )
+
+    async def evaluate(self, code: str) -> dict:
+        """Evaluate `code`, in the shape of the langchain recipe's `EvaluatorResponse`.
+
+        PASS when every test passes, FAIL when none do, NEEDS_IMPROVEMENT otherwise.
+        """
+        results = await self.run(code)
+        passed = sum(result["status"] == "passed" for result in results)
+        if passed == len(results):
+            evaluation = "PASS"
+        elif passed == 0:
+            evaluation = "FAIL"
+        else:
+            evaluation = "NEEDS_IMPROVEMENT"
+        return {"feedback": format_feedback(results), "evaluation": evaluation}
+
+    async def score(self, code: str) -> dict:
+        """Evaluate `code`, in the shape of the langgraph recipe's `EvaluateCodeOutput`.
+
+        The score is the percentage of passing tests.
+        """
+        results = await self.run(code)
+        passed = sum(result["status"] == "passed" for result in results)
+        score = round(100 * passed / len(results)) if results else 100
+        return {"feedback": format_feedback(results), "score": score}
+
+
+def format_feedback(results: list[TestResult]) -> str:
+    """Describe the failing tests so the generator can fix them."""
+    failures = [result for result in results if result["status"] != "passed"]
+    if not failures:
+        return f"All {len(results)} tests passed."
+    lines = [f"{len(failures)} of {len(results)} tests did not pass:"]
+    for result in failures:
+        lines.append(
+            f"- {result['name']} ({result['status']}): {result['message'].strip()}"
+        )
+    return "\n".join(lines)
+
+
+async def _read_report(fd: int) -> bytes:
+    """Everything written to the pipe `fd` until its write end is closed."""
+    reader = asyncio.StreamReader()
+    transport, _ = await asyncio.get_running_loop().connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(fd, "rb", 0)
+    )
+    try:
+        return await reader.read()
+    finally:
+        transport.close()
+
+
+def _kill(process: asyncio.subprocess.Process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError, AttributeError):
+        if process.returncode is None:
+            process.kill()
+
+
+def _describe_exit(returncode: Optional[int]) -> str:
+    if returncode is not None and returncode < 0:
+        name = signal.Signals(-returncode).name
+        if name == "SIGXCPU":
+            return "killed: CPU time limit exceeded"
+        return f"killed by {name}"
+    return f"exited with code {returncode} without reporting a result"
@@ -0,0 +1,207 @@
+"""Coalescing of identical API requests that are in flight at the same time.
+
+When several callers send the same deterministic request at once, e.g. concurrent
+`RouterWorkflow.run` calls for the same query, only the first is sent; the others
+wait for its response and get a copy of it. Unlike the response cache, which answers
+repeats of finished calls, this covers the calls that start before the first one
+has finished.
+
+The transports wrap those of `shared.clients`, so every model and embeddings
+instance built there is covered. Requests are identical when their URL, body and
+credentials are; only embeddings, and chat completions at temperature 0 that are
+neither streamed nor ask for several choices, are coalesced.
+"""
+
+import asyncio
+import json
+import threading
+import weakref
+from typing import Hashable, NamedTuple, Optional
+
+import httpx
+
+COALESCED_PATHS = ("/chat/completions", "/embeddings")
+# Headers that tell callers apart; others, such as the retry count, may differ
+KEY_HEADERS = ("authorization", "openai-organization", "openai-project")
+
+
+class _Response(NamedTuple):
+    """A response read in full, to be copied for every caller."""
+
+    status_code: int
+    headers: httpx.Headers
+    content: bytes
+    extensions: dict
+
+    def copy_for(self, request: httpx.Request) -> httpx.Response:
+        # The raw content, still encoded as the headers say, is decoded by the client
+        return httpx.Response(
+            self.status_code,
+            headers=self.headers,
+            stream=httpx.ByteStream(self.content),
+            extensions=self.extensions,
+            request=request,
+        )
+
+
+def _extensions(response: httpx.Response) -> dict:
+    return {
+        name: response.extensions[name]
+        for name in ("http_version", "reason_phrase")
+        if name in response.extensions
+    }
+
+
+class Singleflight:
+    """Which requests are coalesced, and how many were."""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        # Requests that could have been coalesced, and those that were
+        self.eligible = 0
+        self.coalesced = 0
+
+    def key(self, request: httpx.Request) -> Optional[Hashable]:
+        """The key identical requests share, or None if `request` is not coalesced."""
+        if not self.enabled or request.method != "POST":
+            return None
+        path = request.url.path
+        if not path.endswith(COALESCED_PATHS):
+            return None
+        try:
+            body = request.content
+        except httpx.RequestNotRead:
+            return None
+        if path.endswith("/chat/completions"):
+            try:
+                payload = json.loads(body)
+            except ValueError:
+                return None
+            if (
+                payload.get("stream")
+                or payload.get("n", 1) != 1
+                # The API's default temperature is 1
+                or payload.get("temperature", 1) != 0
+            ):
+                return None
+        self.eligible += 1
+        return (str(request.url), body, *(request.headers.get(h) for h in KEY_HEADERS))
+
+    @property
+    def coalesced_rate(self) -> float:
+        return self.coalesced / self.eligible if self.eligible else 0.0
+
+    def reset(self):
+        self.eligible = self.coalesced = 0
+
+    def __repr__(self) -> str:
+        return (
+            f"Singleflight(enabled={self.enabled}, eligible={self.eligible}, "
+            f"coalesced={self.coalesced}, coalesced_rate={self.coalesced_rate:.0%})"
+        )
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.response: Optional[_Response] = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleflightTransport(httpx.BaseTransport):
+    """Sends one of the identical requests made from several threads at once."""
+
+    def __init__(self, transport: httpx.BaseTransport, singleflight: Singleflight):
+        self.transport = transport
+        self.singleflight = singleflight
+        self._flights: dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        key = self.singleflight.key(request)
+        if key is None:
+            return self.transport.handle_request(request)
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.singleflight.coalesced += 1
+        assert flight is not None
+        if leader:
+            try:
+                response = self.transport.handle_request(request)
+                try:
+                    content = b"".join(response.stream)
+                finally:
+                    response.close()
+                flight.response = _Response(
+                    response.status_code,
+                    response.headers,
+                    content,
+                    _extensions(response),
+                )
+            except BaseException as e:
+                flight.error = e
+            finally:
+                with self._lock:
+                    del self._flights[key]
+                flight.done.set()
+        else:
+            flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        assert flight.response is not None
+        return flight.response.copy_for(request)
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncSingleflightTransport(httpx.AsyncBaseTransport):
+    """Sends one of the identical requests made from a loop's tasks at once."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, singleflight: Singleflight):
+        self.transport = transport
+        self.singleflight = singleflight
+        # A request's future can only be awaited from its own loop
+        self._flights: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, dict[Hashable, asyncio.Future]
+        ] = weakref.WeakKeyDictionary()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        key = self.singleflight.key(request)
+        if key is None:
+            return await self.transport.handle_async_request(request)
+        flights = self._flights.setdefault(asyncio.get_running_loop(), {})
+        flight = flights.get(key)
+        if flight is None:
+            # Sent from its own task, so that it completes for the others even if
+            # the caller that started it is cancelled
+            flight = asyncio.ensure_future(self._send(request))
+            flights[key] = flight
+
+            def landed(future: asyncio.Future):
+                del flights[key]
+                if not future.cancelled():
+                    future.exception()  # retrieved, in case nobody was waiting
+
+            flight.add_done_callback(landed)
+        else:
+            self.singleflight.coalesced += 1
+        response: _Response = await asyncio.shield(flight)
+        return response.copy_for(request)
+
+    async def _send(self, request: httpx.Request) -> _Response:
+        response = await self.transport.handle_async_request(request)
+        try:
+            content = b"".join([chunk async for chunk in response.stream])  # type: ignore
+        finally:
+            await response.aclose()
+        return _Response(
+            response.status_code, response.headers, content, _extensions(response)
+        )
+
+    async def aclose(self):
+        await self.transport.aclose()
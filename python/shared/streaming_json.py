@@ -0,0 +1,200 @@
+import json
+from typing import Any, AsyncIterator, Iterable, Iterator, Literal, Optional, TypedDict
+
+from langchain_core.messages import BaseMessageChunk
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+
+class JSONEvent(TypedDict):
+    """A value that became complete while streaming a JSON object.
+
+    `member` events carry a complete top-level member (`key`: value), `item` events a
+    complete item of a top-level array member, with its position in `index`.
+    """
+
+    kind: Literal["member", "item"]
+    key: str
+    index: int
+    value: Any
+
+
+class StreamingJSONParser:
+    """Incrementally scans a JSON object as it streams in, chunk by chunk.
+
+    `feed` returns the top-level members and top-level array items that were completed
+    by the new chunk, so e.g. the first task of `{"tasks": [{...}, {...}]}` can be used
+    before the rest of the object has been generated. Text before the opening brace
+    (such as a Markdown code fence) is ignored.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._position = 0
+        self._stack: list[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._key: Optional[str] = None
+        self._expect_value = False
+        # Start offsets of the top-level member value and array item being read
+        self._member_start: Optional[int] = None
+        self._item_start: Optional[int] = None
+        self._item_index = 0
+        self._done = False
+
+    def feed(self, chunk: str) -> list[JSONEvent]:
+        self._buffer += chunk
+        events: list[JSONEvent] = []
+        buffer = self._buffer
+        for i in range(self._position, len(buffer)):
+            if self._done:
+                break
+            c = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    self._end_string(i, events)
+                continue
+            if not self._stack and c != "{":
+                continue
+            if c.isspace():
+                continue
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+                self._start_value(i)
+            elif c in "{[":
+                self._start_value(i)
+                self._stack.append(c)
+            elif c in "}]":
+                self._end_literal(i, events)
+                self._stack.pop()
+                self._end_container(i, events)
+            elif c == ",":
+                self._end_literal(i, events)
+            elif c == ":":
+                if len(self._stack) == 1:
+                    self._expect_value = True
+            else:
+                self._start_value(i)
+        self._position = len(buffer)
+        return events
+
+    def _is_top_level_array(self) -> bool:
+        return len(self._stack) == 2 and self._stack[1] == "["
+
+    def _start_value(self, i: int):
+        if len(self._stack) == 1 and self._expect_value:
+            self._expect_value = False
+            self._member_start = i
+        elif self._is_top_level_array() and self._item_start is None:
+            self._item_start = i
+
+    def _emit(self, events: list[JSONEvent], kind, start: int, end: int):
+        value = json.loads(self._buffer[start:end])
+        index = self._item_index if kind == "item" else 0
+        events.append(
+            JSONEvent(kind=kind, key=self._key or "", index=index, value=value)
+        )
+        if kind == "item":
+            self._item_index += 1
+            self._item_start = None
+        else:
+            self._member_start = None
+            self._item_index = 0
+
+    def _end_string(self, i: int, events: list[JSONEvent]):
+        depth = len(self._stack)
+        if depth == 1 and self._member_start == self._string_start:
+            self._emit(events, "member", self._string_start, i + 1)
+        elif depth == 1:
+            # A string at the top level that is not a value is the next member's key
+            self._key = json.loads(self._buffer[self._string_start : i + 1])
+        elif self._is_top_level_array() and self._item_start == self._string_start:
+            self._emit(events, "item", self._string_start, i + 1)
+
+    def _end_literal(self, i: int, events: list[JSONEvent]):
+        # Numbers, true, false and null end at the next comma or closing bracket
+        depth = len(self._stack)
+        if depth == 1 and self._member_start is not None:
+            self._emit(events, "member", self._member_start, i)
+        elif self._is_top_level_array() and self._item_start is not None:
+            self._emit(events, "item", self._item_start, i)
+
+    def _end_container(self, i: int, events: list[JSONEvent]):
+        depth = len(self._stack)
+        if depth == 0:
+            self._done = True
+        elif depth == 1 and self._member_start is not None:
+            self._emit(events, "member", self._member_start, i + 1)
+        elif self._is_top_level_array() and self._item_start is not None:
+            self._emit(events, "item", self._item_start, i + 1)
+
+
+class PartialObject:
+    """Builds up a JSON object from the events of a `StreamingJSONParser`.
+
+    Array members grow item by item, so a partial object can be shown as soon as, e.g.,
+    its first ingredient is complete.
+    """
+
+    def __init__(self):
+        self._parser = StreamingJSONParser()
+        self.value: dict[str, Any] = {}
+
+    def feed(self, chunk: str) -> bool:
+        """Add a chunk of JSON text; returns whether any field was added or grew."""
+        events = self._parser.feed(chunk)
+        for event in events:
+            if event["kind"] == "item":
+                self.value.setdefault(event["key"], []).append(event["value"])
+            else:
+                self.value[event["key"]] = event["value"]
+        return bool(events)
+
+    def snapshot(self) -> dict[str, Any]:
+        # Copies the lists too, so earlier snapshots do not change as they grow
+        return {
+            key: list(value) if isinstance(value, list) else value
+            for key, value in self.value.items()
+        }
+
+
+def stream_partial_objects(chunks: Iterable[BaseMessageChunk]) -> Iterator[dict]:
+    """Yield the object streamed as JSON in `chunks` each time a field is completed."""
+    partial = PartialObject()
+    for chunk in chunks:
+        if partial.feed(str(chunk.content)):
+            yield partial.snapshot()
+
+
+async def astream_partial_objects(
+    chunks: AsyncIterator[BaseMessageChunk],
+) -> AsyncIterator[dict]:
+    """Async version of `stream_partial_objects`."""
+    partial = PartialObject()
+    async for chunk in chunks:
+        if partial.feed(str(chunk.content)):
+            yield partial.snapshot()
+
+
+def json_schema_response_format(schema: Any) -> dict:
+    """OpenAI `response_format` asking for strict JSON output matching `schema`.
+
+    Binding this on a chat model streams the raw JSON text, which is what
+    `StreamingJSONParser` consumes; `with_structured_output` would parse it for us.
+    """
+    function = convert_to_openai_tool(schema, strict=True)["function"]
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": function["name"],
+            "description": function.get("description", ""),
+            "schema": function["parameters"],
+            "strict": True,
+        },
+    }
@@ -0,0 +1,113 @@
+import asyncio
+import json
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Generic, Hashable, TypeVar
+
+from langchain_core.tools import BaseTool
+
+T = TypeVar("T")
+
+# Results of this many distinct pure tool calls are kept
+TOOL_CACHE_SIZE = 1024
+
+
+def pure(tool: BaseTool) -> BaseTool:
+    """Mark a tool as pure: same arguments, same result, no side effects.
+
+        @pure
+        @tool
+        def add(a: int, b: int) -> int: ...
+
+    Only pure tools are memoized and deduplicated.
+    """
+    tool.metadata = {**(tool.metadata or {}), "pure": True}
+    return tool
+
+
+def is_pure(tool: BaseTool) -> bool:
+    return bool((tool.metadata or {}).get("pure"))
+
+
+def canonical_args(args: dict) -> str:
+    """The arguments as JSON with sorted keys, so equal arguments give equal keys."""
+    return json.dumps(args, sort_keys=True, separators=(",", ":"), default=str)
+
+
+class ToolResultCache(Generic[T]):
+    """LRU cache of pure tool results, keyed by tool name and canonical arguments.
+
+    Meant to be shared by concurrent agent sessions: a call that is already running
+    for another session is awaited rather than run again.
+    """
+
+    def __init__(self, max_size: int = TOOL_CACHE_SIZE):
+        self.max_size = max_size
+        self._results: OrderedDict[Hashable, T] = OrderedDict()
+        self._running: dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        # Identical calls in one turn, dispatched once
+        self.deduplicated = 0
+
+    @staticmethod
+    def key(name: str, args: dict) -> tuple[str, str]:
+        return name, canonical_args(args)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    async def get_or_run(
+        self,
+        name: str,
+        args: dict,
+        run: Callable[[], Awaitable[T]],
+        cacheable: Callable[[T], bool] = lambda result: True,
+    ) -> T:
+        """The cached result of the call, or the result of `run()`, which is cached
+        unless `cacheable` says otherwise (e.g. for errors)."""
+        key = self.key(name, args)
+        if key in self._results:
+            self.hits += 1
+            self._results.move_to_end(key)
+            return self._results[key]
+        if key in self._running:
+            self.hits += 1
+            return await asyncio.shield(self._running[key])
+
+        self.misses += 1
+        # Run from its own task, so that it completes for the other sessions even if
+        # the caller that started it is cancelled
+        running = asyncio.ensure_future(run())
+        self._running[key] = running
+
+        def landed(future: asyncio.Future):
+            del self._running[key]
+            if future.cancelled() or future.exception() is not None:
+                return
+            result = future.result()
+            if cacheable(result):
+                self._results[key] = result
+                if len(self._results) > self.max_size:
+                    self._results.popitem(last=False)
+
+        running.add_done_callback(landed)
+        return await asyncio.shield(running)
+
+    def clear(self):
+        self._results.clear()
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    def __repr__(self) -> str:
+        return (
+            f"ToolResultCache(size={len(self)}, hits={self.hits}, "
+            f"misses={self.misses}, hit_rate={self.hit_rate:.0%}, "
+            f"deduplicated={self.deduplicated})"
+        )
+
+
+# The cache shared by every agent session in the process
+tool_cache: ToolResultCache[Any] = ToolResultCache()
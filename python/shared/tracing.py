@@ -0,0 +1,480 @@
+"""Sampled tracing of the recipes' functions and model calls, exported in the background.
+
+    from shared.tracing import traced
+
+    @traced(name="summarize_chunk")
+    async def summarize_chunk(document): ...
+
+Unlike `langsmith.traceable`, which records every call with its full inputs, the
+sampling decision is taken once per trace, at its root: the calls below an unsampled
+root cost a context variable lookup. Inputs and outputs of sampled spans are cut to
+`max_chars` characters, and finished spans are put on a bounded queue that a
+background thread exports in batches, so the traced code never waits for the
+exporter; when the queue is full, spans are dropped and counted instead.
+
+Tracing is configured from the environment on first use:
+
+    RECIPES_TRACING            langsmith, off, sampled or full
+    RECIPES_TRACE_SAMPLE_RATE  fraction of traces kept when sampled (default 0.1)
+    RECIPES_TRACE_MAX_CHARS    characters kept per input or output (default 2000)
+    RECIPES_TRACE_FILE         write spans to this JSONL file instead of LangSmith
+
+By default the mode is `langsmith` when LangSmith tracing is enabled (for instance
+with `LANGSMITH_TRACING=true`), and `off` otherwise. In `langsmith` mode every call
+is traced by `langsmith.traceable`, as the recipes did before sampling existed.
+Sampling is opt-in, with `sampled`. In `sampled` and `full` mode, leave
+`LANGSMITH_TRACING` unset: LangChain would otherwise trace every model call to
+LangSmith on its own, unsampled.
+"""
+
+import asyncio
+import atexit
+import contextvars
+import functools
+import inspect
+import json
+import os
+import queue
+import random
+import threading
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Optional, Protocol, Sequence, TypeVar, Union
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import LLMResult
+from langchain_core.tracers.context import register_configure_hook
+from langsmith import traceable
+from langsmith.utils import tracing_is_enabled
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+SAMPLE_RATE = 0.1
+MAX_CHARS = 2000
+# Items kept of each list or dict in a payload
+MAX_ITEMS = 20
+QUEUE_SIZE = 10_000
+BATCH_SIZE = 100
+# Seconds the exporter waits for a batch to fill before exporting it anyway
+FLUSH_INTERVAL = 1.0
+
+
+def truncate(value: Any, max_chars: int = MAX_CHARS) -> Any:
+    """A JSON-serializable copy of `value` with long strings and collections cut."""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, str):
+        if len(value) <= max_chars:
+            return value
+        return f"{value[:max_chars]}…[+{len(value) - max_chars} chars]"
+    if isinstance(value, BaseMessage):
+        return truncate(f"{value.type}: {value.content}", max_chars)
+    if isinstance(value, dict):
+        items = list(value.items())
+        result = {str(k): truncate(v, max_chars) for k, v in items[:MAX_ITEMS]}
+        if len(items) > MAX_ITEMS:
+            result["…"] = f"+{len(items) - MAX_ITEMS} items"
+        return result
+    if isinstance(value, (list, tuple, set, frozenset)):
+        items = list(value)
+        result = [truncate(v, max_chars) for v in items[:MAX_ITEMS]]
+        if len(items) > MAX_ITEMS:
+            result.append(f"…+{len(items) - MAX_ITEMS} items")
+        return result
+    if hasattr(value, "page_content"):  # a Document
+        return truncate(value.page_content, max_chars)
+    return truncate(repr(value), max_chars)
+
+
+@dataclass
+class Span:
+    """One traced call, in the shape LangSmith expects of a run."""
+
+    name: str
+    run_type: str
+    inputs: Any
+    parent: Optional["Span"] = None
+    id: UUID = field(default_factory=uuid.uuid4)
+    start_time: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    end_time: Optional[datetime] = None
+    outputs: Any = None
+    error: Optional[str] = None
+
+    @property
+    def trace_id(self) -> UUID:
+        return self.parent.trace_id if self.parent else self.id
+
+    @functools.cached_property
+    def dotted_order(self) -> str:
+        own = f"{self.start_time:%Y%m%dT%H%M%S%fZ}{self.id}"
+        return f"{self.parent.dotted_order}.{own}" if self.parent else own
+
+    def to_run(self) -> dict[str, Any]:
+        return {
+            "id": str(self.id),
+            "trace_id": str(self.trace_id),
+            "parent_run_id": str(self.parent.id) if self.parent else None,
+            "dotted_order": self.dotted_order,
+            "name": self.name,
+            "run_type": self.run_type,
+            "inputs": self.inputs if isinstance(self.inputs, dict) else {},
+            "outputs": {"output": self.outputs},
+            "error": self.error,
+            "start_time": self.start_time.isoformat(),
+            "end_time": self.end_time.isoformat() if self.end_time else None,
+        }
+
+
+class Exporter(Protocol):
+    def export(self, spans: Sequence[Span]) -> None: ...
+
+
+class FileExporter:
+    """Appends each span to a JSONL file, e.g. for tests and offline runs."""
+
+    def __init__(self, path: Union[Path, str]):
+        self.path = Path(path)
+
+    def export(self, spans: Sequence[Span]) -> None:
+        with self.path.open("a", encoding="utf-8") as f:
+            for span in spans:
+                f.write(json.dumps(span.to_run(), ensure_ascii=False) + "\n")
+
+
+class LangSmithExporter:
+    """Sends spans to LangSmith as finished runs, one request per batch."""
+
+    def __init__(self, client: Any = None):
+        from langsmith import Client
+
+        self.client = client or Client()
+
+    def export(self, spans: Sequence[Span]) -> None:
+        self.client.batch_ingest_runs(
+            create=[span.to_run() for span in spans], pre_sampled=True
+        )
+
+
+class TraceStats:
+    """Counters of a `Tracer`."""
+
+    def __init__(self):
+        self.traces = 0
+        self.sampled_out = 0
+        self.spans = 0
+        self.dropped = 0
+        self.exported = 0
+        self.export_errors = 0
+
+    def __repr__(self) -> str:
+        return (
+            f"TraceStats(traces={self.traces}, sampled_out={self.sampled_out}, "
+            f"spans={self.spans}, dropped={self.dropped}, exported={self.exported}, "
+            f"export_errors={self.export_errors})"
+        )
+
+
+class Tracer:
+    """Samples traces at their root and exports their spans from a background thread."""
+
+    def __init__(
+        self,
+        exporter: Exporter,
+        sample_rate: float = 1.0,
+        max_chars: int = MAX_CHARS,
+        queue_size: int = QUEUE_SIZE,
+        batch_size: int = BATCH_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+        seed: Optional[int] = None,
+    ):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.max_chars = max_chars
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.stats = TraceStats()
+        self._random = random.Random(seed)
+        self._queue: queue.Queue[Span] = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(
+            target=self._export_loop, name="trace-exporter", daemon=True
+        )
+        self._thread.start()
+
+    def sample(self) -> bool:
+        """Whether to record a new trace."""
+        self.stats.traces += 1
+        if self.sample_rate >= 1.0 or self._random.random() < self.sample_rate:
+            return True
+        self.stats.sampled_out += 1
+        return False
+
+    def start(self, name: str, run_type: str, inputs: Any, parent: Optional[Span]):
+        return Span(name, run_type, truncate(inputs, self.max_chars), parent)
+
+    def finish(self, span: Span, outputs: Any = None, error: Optional[str] = None):
+        span.end_time = datetime.now(timezone.utc)
+        span.outputs = truncate(outputs, self.max_chars)
+        span.error = error
+        self.stats.spans += 1
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.stats.dropped += 1
+
+    def _export_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=deadline))
+                except queue.Empty:
+                    break
+                deadline = 0.01  # a batch is being filled, do not wait long
+            try:
+                self.exporter.export(batch)
+                self.stats.exported += len(batch)
+            except Exception:
+                self.stats.export_errors += 1
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self):
+        """Wait until every finished span has been exported."""
+        self._queue.join()
+
+
+# The span of the traced call being run, or False under a trace that was not sampled
+_current: contextvars.ContextVar[Union[Span, bool, None]] = contextvars.ContextVar(
+    "trace_span", default=None
+)
+_tracer: Optional[Tracer] = None
+_configured = False
+# Whether untraced calls go through `langsmith.traceable` instead
+_langsmith = False
+
+
+class TracingCallback(BaseCallbackHandler):
+    """Records model calls made inside a sampled trace as spans of it."""
+
+    # Called in the caller's context, where the current span is visible
+    run_inline = True
+
+    def __init__(self):
+        self._spans: dict[UUID, tuple[Tracer, Span]] = {}
+
+    def on_chat_model_start(
+        self,
+        serialized: dict[str, Any],
+        messages: list[list[BaseMessage]],
+        *,
+        run_id: UUID,
+        name: Optional[str] = None,
+        **kwargs: Any,
+    ) -> None:
+        parent = _current.get()
+        if isinstance(parent, Span) and _tracer is not None:
+            name = name or (serialized or {}).get("name") or "chat_model"
+            inputs = {"messages": messages[0] if messages else []}
+            span = _tracer.start(name, "llm", inputs, parent)
+            self._spans[run_id] = (_tracer, span)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        if run_id in self._spans:
+            tracer, span = self._spans.pop(run_id)
+            generation = response.generations[0][0] if response.generations else None
+            message = getattr(generation, "message", None)
+            outputs = {
+                "text": generation.text if generation else None,
+                "usage": getattr(message, "usage_metadata", None),
+            }
+            tracer.finish(span, outputs)
+
+    def on_llm_error(
+        self, error: BaseException, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        if run_id in self._spans:
+            tracer, span = self._spans.pop(run_id)
+            tracer.finish(span, error=f"{type(error).__name__}: {error}")
+
+
+def configure_tracing(
+    mode: Optional[str] = None,
+    sample_rate: Optional[float] = None,
+    exporter: Optional[Exporter] = None,
+    max_chars: Optional[int] = None,
+    queue_size: int = QUEUE_SIZE,
+) -> Optional[Tracer]:
+    """Set up tracing, from the environment for anything not given.
+
+    `mode` is `langsmith`, `off`, `sampled` or `full`. Returns the tracer, or `None`
+    when off or when tracing is left to LangSmith.
+    """
+    global _tracer, _configured, _langsmith
+    if _tracer is not None:
+        _tracer.flush()
+    _configured = True
+    if not mode:
+        mode = os.environ.get("RECIPES_TRACING") or (
+            "langsmith" if tracing_is_enabled() else "off"
+        )
+    mode = mode.lower()
+    _langsmith = mode == "langsmith"
+    if mode in ("off", "langsmith"):
+        _tracer = None
+        return None
+    if mode == "full":
+        sample_rate = 1.0
+    elif sample_rate is None:
+        sample_rate = float(os.environ.get("RECIPES_TRACE_SAMPLE_RATE", SAMPLE_RATE))
+    if max_chars is None:
+        max_chars = int(os.environ.get("RECIPES_TRACE_MAX_CHARS", MAX_CHARS))
+    if exporter is None:
+        path = os.environ.get("RECIPES_TRACE_FILE")
+        exporter = FileExporter(path) if path else LangSmithExporter()
+    _tracer = Tracer(exporter, sample_rate, max_chars, queue_size)
+    atexit.register(_tracer.flush)
+    return _tracer
+
+
+# Set only inside sampled traces: LangChain spends more dispatching callback events
+# than the callback spends recording them, so other runs are left without it
+_callback: contextvars.ContextVar[Optional[TracingCallback]] = contextvars.ContextVar(
+    "trace_callback", default=None
+)
+register_configure_hook(_callback, inheritable=True)
+_model_calls = TracingCallback()
+
+
+def get_tracer() -> Optional[Tracer]:
+    """The tracer in use, configured from the environment on first use."""
+    return _tracer if _configured else configure_tracing()
+
+
+def _enter(tracer: Optional[Tracer], name: str, run_type: str, inputs: Callable):
+    """The span to record a call in, or None; and the context tokens to reset."""
+    parent = _current.get()
+    if tracer is None or parent is False:
+        return None, ()
+    if parent is None:
+        if not tracer.sample():
+            return None, ((_current, _current.set(False)),)
+        span = tracer.start(name, run_type, inputs(), None)
+        return span, (
+            (_current, _current.set(span)),
+            (_callback, _callback.set(_model_calls)),
+        )
+    span = tracer.start(name, run_type, inputs(), parent)
+    return span, ((_current, _current.set(span)),)
+
+
+def _exit(tokens: tuple):
+    for var, token in reversed(tokens):
+        var.reset(token)
+
+
+def traced(name: Optional[str] = None, run_type: str = "chain") -> Callable[[F], F]:
+    """Trace calls of the decorated function, coroutine function or generator."""
+
+    def decorator(function: F) -> F:
+        span_name = name or function.__name__
+        signature = inspect.signature(function)
+        langsmith_function = traceable(name=span_name, run_type=run_type)(function)
+
+        def inputs(args: tuple, kwargs: dict) -> Callable[[], dict]:
+            # Only bound when the call is sampled
+            def bind() -> dict:
+                arguments = signature.bind_partial(*args, **kwargs).arguments
+                arguments.pop("self", None)
+                return arguments
+
+            return bind
+
+        def error(e: BaseException) -> str:
+            return f"{type(e).__name__}: {e}"
+
+        if inspect.isgeneratorfunction(function):
+
+            @functools.wraps(function)
+            def generator_wrapper(*args: Any, **kwargs: Any):
+                tracer = get_tracer()
+                if tracer is None:
+                    yield from (langsmith_function if _langsmith else function)(
+                        *args, **kwargs
+                    )
+                    return
+                # Each step runs in the span's context, which is not left set in
+                # the consumer's while the generator is suspended
+                span, tokens = _enter(tracer, span_name, run_type, inputs(args, kwargs))
+                context = contextvars.copy_context()
+                _exit(tokens)
+                iterator = function(*args, **kwargs)
+                last = None
+                try:
+                    while True:
+                        try:
+                            last = context.run(next, iterator)
+                        except StopIteration:
+                            break
+                        yield last
+                except GeneratorExit:
+                    iterator.close()
+                except BaseException as e:
+                    if span is not None:
+                        tracer.finish(span, last, error(e))
+                    raise
+                if span is not None:
+                    tracer.finish(span, last)
+
+            return generator_wrapper  # type: ignore
+
+        if asyncio.iscoroutinefunction(function):
+
+            @functools.wraps(function)
+            async def async_wrapper(*args: Any, **kwargs: Any):
+                tracer = get_tracer()
+                if tracer is None:
+                    return await (langsmith_function if _langsmith else function)(
+                        *args, **kwargs
+                    )
+                span, tokens = _enter(tracer, span_name, run_type, inputs(args, kwargs))
+                try:
+                    result = await function(*args, **kwargs)
+                except BaseException as e:
+                    if span is not None:
+                        tracer.finish(span, error=error(e))
+                    raise
+                finally:
+                    _exit(tokens)
+                if span is not None:
+                    tracer.finish(span, result)
+                return result
+
+            return async_wrapper  # type: ignore
+
+        @functools.wraps(function)
+        def wrapper(*args: Any, **kwargs: Any):
+            tracer = get_tracer()
+            if tracer is None:
+                return (langsmith_function if _langsmith else function)(*args, **kwargs)
+            span, tokens = _enter(tracer, span_name, run_type, inputs(args, kwargs))
+            try:
+                result = function(*args, **kwargs)
+            except BaseException as e:
+                if span is not None:
+                    tracer.finish(span, error=error(e))
+                raise
+            finally:
+                _exit(tokens)
+            if span is not None:
+                tracer.finish(span, result)
+            return result
+
+        return wrapper  # type: ignore
+
+    return decorator
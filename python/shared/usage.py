@@ -0,0 +1,48 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.tracers.context import register_configure_hook
+
+
+class TokenUsageCallback(BaseCallbackHandler):
+    """Adds up the prompt and completion tokens reported by chat model calls."""
+
+    def __init__(self):
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        self.calls += 1
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None)
+                if usage:
+                    self.input_tokens += usage.get("input_tokens", 0)
+                    self.output_tokens += usage.get("output_tokens", 0)
+
+
+_token_usage: ContextVar[Optional[TokenUsageCallback]] = ContextVar(
+    "token_usage", default=None
+)
+# Attach the active callback to every runnable invoked in the current context
+register_configure_hook(_token_usage, inheritable=True)
+
+
+@contextmanager
+def collect_token_usage() -> Iterator[TokenUsageCallback]:
+    """Count the tokens of every model call made inside the `with` block.
+
+    Works without passing callbacks through `config`, so it can be used inside graph
+    nodes without replacing the callbacks LangGraph passes down.
+    """
+    callback = TokenUsageCallback()
+    token = _token_usage.set(callback)
+    try:
+        yield callback
+    finally:
+        _token_usage.reset(token)
@@ -0,0 +1,84 @@
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.adaptive_limit import AdaptiveLimiter, AdaptiveLimitTransport  # noqa: E402
+
+
+def test_congestion_event_cuts_the_limit_once():
+    limiter = AdaptiveLimiter(initial=16)
+    sent = time.perf_counter()
+    # Every request sent before the first cut fails with it
+    for _ in range(8):
+        limiter.record(sent, "rate_limited")
+    assert limiter.limit == 8
+    assert limiter.rate_limited == 8
+    limiter.record(time.perf_counter(), "timeout")
+    assert limiter.limit == 4
+    assert [change.reason for change in limiter.trajectory] == [
+        "start",
+        "rate_limited",
+        "timeout",
+    ]
+
+
+def test_limit_stays_within_its_bounds():
+    limiter = AdaptiveLimiter(initial=2, min_limit=1, max_limit=3)
+    for _ in range(5):
+        limiter.record(time.perf_counter(), "rate_limited")
+    assert limiter.limit == 1
+
+    async def scenario():
+        # Grown only while every slot is taken
+        for _ in range(10):
+            while limiter.in_flight < limiter.slots:
+                await limiter.acquire()
+            limiter.record(time.perf_counter(), "ok")
+        assert limiter.limit == 3
+        for _ in range(limiter.in_flight):
+            limiter.release()
+
+    asyncio.run(scenario())
+
+
+def test_limit_does_not_grow_while_slots_are_free():
+    limiter = AdaptiveLimiter(initial=4)
+    for _ in range(20):
+        limiter.record(time.perf_counter(), "ok")
+    assert limiter.limit == 4
+    assert limiter.successes == 20
+
+
+def test_transport_holds_requests_beyond_the_limit():
+    in_flight = peak = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        status = 429 if request.url.path == "/overloaded" else 200
+        # Unread, as responses off the network are, so that the client closes it
+        return httpx.Response(status, stream=httpx.ByteStream(b"{}"))
+
+    async def scenario():
+        limiter = AdaptiveLimiter(initial=2, max_limit=2)
+        transport = AdaptiveLimitTransport(httpx.MockTransport(handler), limiter)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="https://api.test"
+        ) as client:
+            responses = await asyncio.gather(*[client.get("/") for _ in range(6)])
+            assert all(r.status_code == 200 for r in responses)
+            # Slots are given back once the responses have been read
+            assert limiter.in_flight == 0 and limiter.peak_in_flight == 2
+            assert (await client.get("/overloaded")).status_code == 429
+        assert limiter.rate_limited == 1 and limiter.limit == 1
+
+    asyncio.run(scenario())
+    assert peak == 2
@@ -0,0 +1,73 @@
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.cascade import Cascade  # noqa: E402
+from shared.fake_models import FakeAPIError, ScriptedChatModel  # noqa: E402
+
+
+def models(*names: str) -> list[ScriptedChatModel]:
+    return [
+        ScriptedChatModel(responder=lambda messages, schema: "", model_name=name)
+        for name in names
+    ]
+
+
+def run(cascade: Cascade, model, answers: dict, **kwargs):
+    async def call(tier):
+        answer = answers[tier.model_name]
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    return asyncio.run(cascade.run(model, call, **kwargs))
+
+
+def test_cheap_answer_that_passes_is_taken():
+    cheap, strong = models("cheap", "strong")
+    cascade = Cascade("test", models=[cheap])
+    answer = run(cascade, strong, {"cheap": "x = 1", "strong": "x = 2"})
+    assert answer == "x = 1"
+    assert cascade.stats.tiers["cheap"].answered == 1
+    assert "strong" not in cascade.stats.tiers
+    assert cascade.stats.escalated == 0
+
+
+def test_invalid_and_rejected_answers_escalate():
+    cheap, middle, strong = models("cheap", "middle", "strong")
+    cascade = Cascade("test", models=[cheap, middle])
+    answers = {"cheap": ValueError("not JSON"), "middle": "x = (", "strong": "x = 1"}
+    answer = run(cascade, strong, answers, accept=lambda code: code.endswith("1"))
+    assert answer == "x = 1"
+    assert cascade.stats.escalations == {"invalid": 1, "rejected": 1}
+    assert [t.answered for t in cascade.stats.tiers.values()] == [0, 0, 1]
+    # The last model's answer is taken without checking it
+    assert run(cascade, strong, answers, accept=lambda code: False) == "x = 1"
+    assert cascade.stats.escalations == {"invalid": 2, "rejected": 2}
+
+
+def test_disagreeing_samples_escalate():
+    cheap, strong = models("cheap", "strong")
+    cascade = Cascade("test", models=[cheap])
+    drawn = iter(["a", "b", "a"])
+
+    async def call(tier):
+        return next(drawn) if tier.model_name == "cheap" else "c"
+
+    answer = asyncio.run(cascade.run(strong, call, samples=3, key=str))
+    assert answer == "c"
+    assert cascade.stats.escalations == {"disagreement": 1}
+
+
+def test_api_errors_are_not_escalated():
+    cheap, strong = models("cheap", "strong")
+    cascade = Cascade("test", models=[cheap])
+    try:
+        run(cascade, strong, {"cheap": FakeAPIError(429), "strong": "x = 1"})
+    except FakeAPIError as e:
+        assert e.status_code == 429
+    else:
+        raise AssertionError("the rate limit was escalated")
+    assert cascade.stats.escalated == 0
@@ -0,0 +1,24 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.compaction import fold_feedback  # noqa: E402
+
+
+def test_repeated_feedback_is_folded_once():
+    summary = fold_feedback(None, ["Use a dict. Add type hints.", "Add type hints."])
+    summary = fold_feedback(summary, ["Use a dict.\nHandle the empty cache!"])
+    assert summary.splitlines() == [
+        "- Add type hints.",
+        "- Use a dict.",
+        "- Handle the empty cache!",
+    ]
+
+
+def test_summary_keeps_the_newest_feedback_within_its_limit():
+    summary = None
+    for i in range(50):
+        summary = fold_feedback(summary, [f"Fix problem {i}."], max_chars=100)
+    assert len(summary) <= 100
+    assert summary.endswith("- Fix problem 49.")
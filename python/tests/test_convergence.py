@@ -0,0 +1,110 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.convergence import (  # noqa: E402
+    EvaluationMemo,
+    code_converged,
+    score_plateaued,
+)
+from shared.recipes import load_recipe  # noqa: E402
+
+
+def test_formatting_changes_count_as_converged():
+    previous = "def add(a, b):\n    return a + b\n"
+    assert code_converged(previous, "def add(a,b):  # sum\n  return a+b")
+    assert not code_converged(previous, "def add(a, b):\n    return b + a\n")
+    assert not code_converged(None, previous)
+
+
+def test_score_plateaued():
+    assert not score_plateaued([50, 60], min_gain=2, patience=2)
+    assert score_plateaued([50, 60, 61, 60], min_gain=2, patience=2)
+    assert not score_plateaued([50, 60, 61, 65], min_gain=2, patience=2)
+    assert score_plateaued([1, 1], min_gain=1, patience=1)
+
+
+def test_optimize_code_stops_before_max_iterations(monkeypatch):
+    os.environ.setdefault("OPENAI_API_KEY", "test")
+    recipe = load_recipe("langchain/evaluator_optimizer.py")
+    generated = 0
+
+    async def generate_code(task, feedback=None, code=None, temperature=None):
+        nonlocal generated
+        generated += 1
+        return {
+            "thoughts": "",
+            "code": f"def add(a, b):\n    return a - b + {generated}",
+        }
+
+    async def evaluate(task, code, test_cases=None):
+        return {"feedback": "still wrong", "evaluation": "NEEDS_IMPROVEMENT"}
+
+    monkeypatch.setattr(recipe, "generate_code", generate_code)
+    monkeypatch.setattr(recipe, "evaluate", evaluate)
+    code = asyncio.run(recipe.optimize_code("add two numbers"))
+    assert generated == 2 < recipe.MAX_ITERATIONS
+    assert code.endswith("+ 2")
+
+    generated = 0
+    asyncio.run(recipe.optimize_code("add two numbers", detect_convergence=False))
+    assert generated == recipe.MAX_ITERATIONS
+
+
+def test_concurrent_evaluations_of_the_same_code_are_coalesced():
+    async def scenario():
+        memo: EvaluationMemo[str] = EvaluationMemo()
+        evaluations = 0
+
+        async def evaluate() -> str:
+            nonlocal evaluations
+            evaluations += 1
+            await asyncio.sleep(0.01)
+            return "PASS"
+
+        results = await asyncio.gather(
+            memo.get_or_evaluate("x = 1", evaluate),
+            memo.get_or_evaluate("x=1  # same", evaluate),
+            memo.get_or_evaluate("x = 2", evaluate),
+        )
+        assert results == ["PASS"] * 3
+        assert evaluations == 2
+        assert (memo.hits, memo.misses) == (1, 2)
+        assert await memo.get_or_evaluate("x = 1", evaluate) == "PASS"
+        assert evaluations == 2
+
+    asyncio.run(scenario())
+
+
+def test_evaluation_is_cancelled_with_its_last_waiter():
+    async def scenario():
+        memo: EvaluationMemo[str] = EvaluationMemo()
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+
+        async def evaluate() -> str:
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+            return "PASS"
+
+        first = asyncio.create_task(memo.get_or_evaluate("x = 1", evaluate))
+        second = asyncio.create_task(memo.get_or_evaluate("x = 1", evaluate))
+        await started.wait()
+
+        first.cancel()
+        await asyncio.sleep(0)
+        assert not cancelled.is_set()
+
+        second.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        await asyncio.sleep(0)
+        assert not memo._running and not memo._evaluations
+
+    asyncio.run(scenario())
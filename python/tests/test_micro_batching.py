@@ -0,0 +1,74 @@
+import asyncio
+import contextlib
+import io
+import os
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.fake_models import FakeAPIError, ScriptedChatModel  # noqa: E402
+from shared.recipes import load_recipe  # noqa: E402
+from shared.resilience import ResilientNode  # noqa: E402
+
+TASKS = [
+    {"reasoning": "", "type": "Formal", "description": f"Tagline {i}."}
+    for i in range(4)
+]
+
+
+def test_failed_batch_falls_back_to_guarded_calls_per_task(monkeypatch):
+    os.environ.setdefault("OPENAI_API_KEY", "test")
+    recipe = load_recipe("langgraph/orchestrator_workers.py")
+    calls = {"batch": 0, "task": 0}
+
+    def responder(messages, schema):
+        return "tagline"
+
+    def failure(messages, schema):
+        if schema == "BatchWorkerOutput":
+            calls["batch"] += 1
+            return FakeAPIError(503, "Service unavailable")
+        calls["task"] += 1
+        # The first call per task is rate limited, and retried by the guard
+        if calls["task"] <= len(TASKS):
+            return FakeAPIError(429)
+        return None
+
+    guard = ResilientNode(max_in_flight=2, max_attempts=4, base_delay=0)
+    monkeypatch.setattr(recipe, "worker_guard", guard)
+    monkeypatch.setattr(
+        recipe, "model", ScriptedChatModel(responder=responder, failure=failure)
+    )
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        update = asyncio.run(
+            recipe.process_batch({"tasks": TASKS, "original_task": "Write taglines"})
+        )
+    assert update["responses"] == ["tagline"] * len(TASKS)
+    assert calls["batch"] == 1
+    assert calls["task"] == 2 * len(TASKS)
+    # The batch attempt and every attempt per task went through the guard
+    assert guard.stats.calls == 1 + 2 * len(TASKS)
+    assert guard.stats.peak_in_flight <= 2
+    assert update["batch_stats"][0]["calls"] == 1 + len(TASKS)
+
+
+def test_rejected_batch_is_not_retried_per_task(monkeypatch):
+    os.environ.setdefault("OPENAI_API_KEY", "test")
+    recipe = load_recipe("langgraph/orchestrator_workers.py")
+    model = ScriptedChatModel(
+        responder=lambda messages, schema: "tagline",
+        failure=lambda messages, schema: FakeAPIError(401, "Invalid API key"),
+    )
+    monkeypatch.setattr(recipe, "model", model)
+
+    try:
+        asyncio.run(
+            recipe.process_batch({"tasks": TASKS, "original_task": "Write taglines"})
+        )
+    except FakeAPIError as e:
+        assert e.status_code == 401
+    else:
+        raise AssertionError("the batch error was not raised")
+    assert model.failures == 1
@@ -0,0 +1,61 @@
+import asyncio
+import sys
+from pathlib import Path
+from typing import Annotated, TypedDict
+
+from langchain_core.messages import HumanMessage
+from langchain_ollama import ChatOllama
+from langchain_openai import ChatOpenAI
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.fake_server import FakeOpenAIServer  # noqa: E402
+from shared.model_pool import ModelPool  # noqa: E402
+
+# Nothing listens there, so calls to this backend fail to connect
+OLLAMA_URL = "http://127.0.0.1:9"
+
+
+class Answer(TypedDict):
+    answer: Annotated[str, ..., "The answer"]
+
+
+def responder(messages, schema):
+    return {"answer": "42"} if schema else "42"
+
+
+def test_structured_output_of_a_mixed_pool_fails_over_to_openai():
+    async def scenario():
+        async with FakeOpenAIServer(responder) as server:
+            ollama = ChatOllama(model="qwen2.5-coder:1.5b", base_url=OLLAMA_URL)
+            openai = ChatOpenAI(
+                model="gpt-4o-mini",
+                base_url=server.base_url,
+                api_key="test",  # type: ignore
+                max_retries=0,
+            )
+            pool = ModelPool(models=[ollama, openai], cooldown=60)
+            # ChatOllama would raise ValueError on `strict`
+            structured = pool.with_structured_output(
+                Answer, method="json_schema", strict=True
+            )
+            assert await structured.ainvoke("What is six times seven?") == {
+                "answer": "42"
+            }
+            assert pool.balancer.failovers == 1
+            assert [backend.calls for backend in pool.backends] == [1, 1]
+
+    asyncio.run(scenario())
+
+
+def test_pool_counts_tokens_without_its_backends():
+    ollama = ChatOllama(model="qwen2.5-coder:1.5b", base_url=OLLAMA_URL)
+    openai = ChatOpenAI(model="gpt-4o-mini", api_key="test")  # type: ignore
+    text = "Count the tokens of this sentence, whichever backend comes first."
+    # ChatOllama counts tokens with `transformers`, which is not a dependency
+    counts = {
+        ModelPool(models=models).get_num_tokens(text)
+        for models in ([ollama, openai], [openai, ollama], [ollama])
+    }
+    assert len(counts) == 1 and counts.pop() > 0
+    assert ModelPool(models=[ollama]).get_num_tokens_from_messages([HumanMessage(text)])
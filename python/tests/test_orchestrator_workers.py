@@ -0,0 +1,54 @@
+import asyncio
+import json
+import os
+import sys
+from pathlib import Path
+
+from langchain_core.messages import AIMessageChunk
+from langchain_core.runnables import RunnableLambda
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.recipes import load_recipe  # noqa: E402
+
+
+def test_failed_worker_stops_its_siblings(monkeypatch):
+    os.environ.setdefault("OPENAI_API_KEY", "test")
+    recipe = load_recipe("langchain/orchestrator_workers.py")
+    tasks = [
+        {"type": "slow", "description": "never finishes"},
+        {"type": "broken", "description": "fails"},
+    ]
+    output = json.dumps({"analysis": "two tasks", "tasks": tasks})
+    cancelled = asyncio.Event()
+
+    async def stream(_):
+        for i in range(0, len(output), 16):
+            yield AIMessageChunk(content=output[i : i + 16])
+
+    async def run_task(task):
+        if task["type"] == "broken":
+            raise RuntimeError("worker failed")
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        return "done"
+
+    monkeypatch.setattr(
+        recipe, "orchestrator_stream_chain", lambda: RunnableLambda(stream)
+    )
+    monkeypatch.setattr(recipe, "run_task", run_task)
+
+    async def scenario():
+        try:
+            await recipe.orchestrator_workers_pipelined("write something")
+        except RuntimeError as e:
+            assert str(e) == "worker failed"
+        else:
+            raise AssertionError("the worker's error was not raised")
+        # Stopped before the call returned, not merely asked to stop
+        assert cancelled.is_set()
+
+    asyncio.run(scenario())
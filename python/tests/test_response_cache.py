@@ -0,0 +1,68 @@
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.fake_models import ScriptedChatModel  # noqa: E402
+from shared.response_cache import ResponseCache, cache_scope  # noqa: E402
+
+
+def scripted(cache: ResponseCache, **fields) -> ScriptedChatModel:
+    return ScriptedChatModel(
+        responder=lambda messages, schema: f"Echo: {messages[-1].content}",
+        model_name="gpt-4o-mini",
+        cache=cache,
+        **fields,
+    )
+
+
+def test_repeated_call_is_served_from_the_cache(tmp_path):
+    cache = ResponseCache(tmp_path / "responses.sqlite")
+    model = scripted(cache)
+    with cache_scope("test"):
+        first = model.invoke("Hi")
+        second = asyncio.run(model.ainvoke("Hi"))
+    assert model.calls == 1
+    assert second.content == first.content == "Echo: Hi"
+    # A hit costs no tokens, and remembers what the call that was cached did
+    assert second.usage_metadata["total_tokens"] == 0
+    assert second.response_metadata["cached_usage"] == first.usage_metadata
+    stats = cache.stats["test"]
+    assert (stats.lookups, stats.hits, stats.memory_hits) == (2, 1, 1)
+    assert stats.saved_usd > 0
+
+
+def test_cache_outlives_the_process_that_filled_it(tmp_path):
+    path = tmp_path / "responses.sqlite"
+    scripted(ResponseCache(path)).invoke("Hi")
+    cache = ResponseCache(path)
+    model = scripted(cache)
+    assert model.invoke("Hi").content == "Echo: Hi"
+    assert model.calls == 0 and cache.entries() == 1
+
+
+def test_sampled_and_expired_calls_are_not_served(tmp_path):
+    cache = ResponseCache(tmp_path / "responses.sqlite", ttl=0)
+    sampled = scripted(cache, temperature=0.7)
+    sampled.invoke("Hi")
+    sampled.invoke("Hi")
+    assert sampled.calls == 2 and cache.entries() == 0
+    # Stored, but expired as soon as it is looked up
+    model = scripted(cache)
+    model.invoke("Hi")
+    model.invoke("Hi")
+    assert model.calls == 2
+
+
+def test_least_recently_used_responses_are_evicted(tmp_path):
+    cache = ResponseCache(tmp_path / "responses.sqlite", max_bytes=2_000)
+    model = scripted(cache)
+    for i in range(20):
+        model.invoke(f"Prompt {i}")
+    assert 0 < cache.entries() < 20
+    assert cache._size <= cache.max_bytes
+    model.calls = 0
+    model.invoke("Prompt 19")
+    model.invoke("Prompt 0")
+    assert model.calls == 1
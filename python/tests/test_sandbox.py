@@ -0,0 +1,67 @@
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.sandbox import ExecutionEvaluator  # noqa: E402
+
+ADD = {"name": "add", "code": "assert add(2, 3) == 5"}
+PASSED = json.dumps({"status": "passed", "seconds": 0.0, "message": ""})
+
+
+def run_test(code: str, test_case=ADD, **kwargs):
+    evaluator = ExecutionEvaluator([test_case], **kwargs)
+    return asyncio.run(evaluator.run_test(code, test_case))
+
+
+def test_correct_code_passes():
+    result = run_test("def add(a, b): return a + b")
+    assert result["status"] == "passed"
+    assert result["name"] == "add"
+
+
+def test_wrong_code_fails():
+    result = run_test("def add(a, b): return a - b")
+    assert result["status"] == "failed"
+    assert result["message"].startswith("AssertionError")
+
+
+def test_printed_verdict_does_not_pass():
+    result = run_test(
+        "import sys\n"
+        "def add(a, b): return a - b\n"
+        f"print({PASSED!r}, file=sys.__stdout__, flush=True)\n"
+    )
+    assert result["status"] == "failed"
+
+
+def test_verdict_printed_at_exit_does_not_pass():
+    result = run_test(
+        "import atexit, sys\n"
+        "def add(a, b): return a - b\n"
+        f"atexit.register(print, {PASSED!r}, file=sys.__stdout__)\n"
+    )
+    assert result["status"] == "failed"
+
+
+def test_code_that_exits_early_is_an_error():
+    result = run_test("import os\nos._exit(0)\n")
+    assert result["status"] == "error"
+
+
+def test_runaway_code_times_out():
+    result = run_test("while True: pass", timeout=1.0, cpu_seconds=5)
+    assert result["status"] == "timeout"
+
+
+def test_slow_code_fails_the_timing_check():
+    test_case = {
+        "name": "fast",
+        "code": "import time; time.sleep(0.2)",
+        "max_seconds": 0.05,
+    }
+    result = run_test("", test_case)
+    assert result["status"] == "failed"
+    assert "limit is" in result["message"]
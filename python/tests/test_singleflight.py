@@ -0,0 +1,92 @@
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+import httpx
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.singleflight import AsyncSingleflightTransport, Singleflight  # noqa: E402
+
+URL = "https://api.openai.com/v1/chat/completions"
+
+
+def completion(temperature: float, **fields) -> dict:
+    return {
+        "model": "gpt-4o-mini",
+        "messages": [{"role": "user", "content": "Hi"}],
+        "temperature": temperature,
+        **fields,
+    }
+
+
+def send_at_once(payloads: list[dict]) -> tuple[list[httpx.Response], int]:
+    """Send `payloads` concurrently; returns the responses and the requests sent."""
+    sent = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal sent
+        sent += 1
+        call = sent
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={"id": f"call-{call}"})
+
+    async def scenario():
+        transport = AsyncSingleflightTransport(
+            httpx.MockTransport(handler), Singleflight()
+        )
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await asyncio.gather(
+                *[client.post(URL, json=payload) for payload in payloads]
+            )
+
+    return asyncio.run(scenario()), sent
+
+
+def test_identical_deterministic_requests_are_sent_once():
+    responses, sent = send_at_once([completion(0)] * 3)
+    assert sent == 1
+    assert [r.json() for r in responses] == [{"id": "call-1"}] * 3
+
+
+def test_sampled_streamed_and_different_requests_are_all_sent():
+    payloads = [
+        completion(0.7),
+        completion(0.7),
+        completion(0, stream=True),
+        completion(0, stream=True),
+        completion(0, n=2),
+        completion(0, n=2),
+        completion(0, messages=[{"role": "user", "content": "Hello"}]),
+        completion(0),
+    ]
+    responses, sent = send_at_once(payloads)
+    assert sent == len(payloads)
+    assert len({json.dumps(r.json()) for r in responses}) == len(payloads)
+
+
+def test_followers_get_the_leaders_error():
+    sent = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal sent
+        sent += 1
+        await asyncio.sleep(0.05)
+        raise httpx.ConnectError("connection refused", request=request)
+
+    async def scenario():
+        singleflight = Singleflight()
+        transport = AsyncSingleflightTransport(
+            httpx.MockTransport(handler), singleflight
+        )
+        async with httpx.AsyncClient(transport=transport) as client:
+            results = await asyncio.gather(
+                *[client.post(URL, json=completion(0)) for _ in range(3)],
+                return_exceptions=True,
+            )
+        assert all(isinstance(r, httpx.ConnectError) for r in results)
+        assert singleflight.coalesced == 2
+
+    asyncio.run(scenario())
+    assert sent == 1
@@ -0,0 +1,76 @@
+import json
+import sys
+from pathlib import Path
+
+from langchain_core.messages import AIMessageChunk
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.streaming_json import (  # noqa: E402
+    StreamingJSONParser,
+    stream_partial_objects,
+)
+
+OBJECT = {
+    "analysis": 'Two "quoted" tasks, {braces} and [brackets]',
+    "tasks": [{"type": "formal", "tags": ["a", "b"]}, "plain", 3, None],
+    "count": 2,
+    "done": True,
+}
+
+
+def events_of(text: str, size: int) -> list:
+    parser = StreamingJSONParser()
+    events = []
+    for i in range(0, len(text), size):
+        events.extend(parser.feed(text[i : i + size]))
+    return events
+
+
+def test_members_and_items_are_emitted_as_they_complete():
+    text = "```json\n" + json.dumps(OBJECT) + "\n```"
+    expected = events_of(text, len(text))
+    assert [(e["kind"], e["key"], e["index"]) for e in expected] == [
+        ("member", "analysis", 0),
+        ("item", "tasks", 0),
+        ("item", "tasks", 1),
+        ("item", "tasks", 2),
+        ("item", "tasks", 3),
+        ("member", "tasks", 0),
+        ("member", "count", 0),
+        ("member", "done", 0),
+    ]
+    assert [e["value"] for e in expected if e["kind"] == "member"] == list(
+        OBJECT.values()
+    )
+    # However the text is split, the same events come out
+    for size in (1, 2, 7):
+        assert events_of(text, size) == expected
+
+
+def test_first_item_is_emitted_before_the_object_is_complete():
+    parser = StreamingJSONParser()
+    events = parser.feed('{"tasks": [{"type": "formal"}, {"ty')
+    assert events == [
+        {"kind": "item", "key": "tasks", "index": 0, "value": {"type": "formal"}}
+    ]
+    assert parser.feed('pe": "casual"}]}') == [
+        {"kind": "item", "key": "tasks", "index": 1, "value": {"type": "casual"}},
+        {
+            "kind": "member",
+            "key": "tasks",
+            "index": 0,
+            "value": [{"type": "formal"}, {"type": "casual"}],
+        },
+    ]
+
+
+def test_partial_objects_grow_field_by_field():
+    text = json.dumps({"name": "Soup", "ingredients": ["water", "salt"]})
+    chunks = [AIMessageChunk(content=text[i : i + 5]) for i in range(0, len(text), 5)]
+    snapshots = list(stream_partial_objects(chunks))
+    assert snapshots == [
+        {"name": "Soup"},
+        {"name": "Soup", "ingredients": ["water"]},
+        {"name": "Soup", "ingredients": ["water", "salt"]},
+    ]
@@ -0,0 +1,62 @@
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared.tool_cache import ToolResultCache  # noqa: E402
+
+
+def test_cancelled_caller_does_not_cancel_other_sessions():
+    async def scenario():
+        cache: ToolResultCache[int] = ToolResultCache()
+        started = asyncio.Event()
+        release = asyncio.Event()
+        runs = 0
+
+        async def run() -> int:
+            nonlocal runs
+            runs += 1
+            started.set()
+            await release.wait()
+            return 42
+
+        first = asyncio.create_task(cache.get_or_run("add", {"a": 1}, run))
+        await started.wait()
+        second = asyncio.create_task(cache.get_or_run("add", {"a": 1}, run))
+        await asyncio.sleep(0)
+
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+
+        assert await second == 42
+        assert first.cancelled()
+        assert runs == 1
+        # The result of the call is cached although its caller was cancelled
+        assert await cache.get_or_run("add", {"a": 1}, run) == 42
+        assert runs == 1
+        assert not cache._running
+
+    asyncio.run(scenario())
+
+
+def test_failed_call_is_not_cached():
+    async def scenario():
+        cache: ToolResultCache[int] = ToolResultCache()
+        runs = 0
+
+        async def run() -> int:
+            nonlocal runs
+            runs += 1
+            raise RuntimeError("tool failed")
+
+        for _ in range(2):
+            try:
+                await cache.get_or_run("add", {"a": 1}, run)
+            except RuntimeError:
+                pass
+        assert runs == 2
+        assert len(cache) == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,67 @@
+import asyncio
+import json
+import sys
+from pathlib import Path
+from unittest import mock
+
+from langsmith import utils as langsmith_utils
+from langsmith.run_helpers import get_current_run_tree, tracing_context
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from shared import tracing  # noqa: E402
+from shared.tracing import configure_tracing, traced  # noqa: E402
+
+
+@traced(name="double")
+async def double(x: int) -> tuple[int, str]:
+    run = get_current_run_tree()
+    return 2 * x, run.name if run else ""
+
+
+def test_langsmith_tracing_traces_every_call_by_default(monkeypatch):
+    monkeypatch.delenv("RECIPES_TRACING", raising=False)
+    monkeypatch.setenv("LANGSMITH_TRACING", "true")
+    # LangSmith caches the environment variables it reads
+    langsmith_utils.get_env_var.cache_clear()
+    assert configure_tracing() is None
+    assert tracing._langsmith
+    client = mock.MagicMock()
+    try:
+        with tracing_context(client=client):
+            results = asyncio.run(double(2))
+    finally:
+        configure_tracing("off")
+        langsmith_utils.get_env_var.cache_clear()
+    assert results == (4, "double")
+    assert client.create_run.called
+
+
+def test_tracing_is_off_without_langsmith(monkeypatch):
+    monkeypatch.delenv("RECIPES_TRACING", raising=False)
+    monkeypatch.delenv("LANGSMITH_TRACING", raising=False)
+    monkeypatch.delenv("LANGCHAIN_TRACING_V2", raising=False)
+    langsmith_utils.get_env_var.cache_clear()
+    assert configure_tracing() is None
+    assert not tracing._langsmith
+    assert asyncio.run(double(2)) == (4, "")
+
+
+def test_sampling_is_opt_in(monkeypatch, tmp_path):
+    path = tmp_path / "spans.jsonl"
+    monkeypatch.setenv("RECIPES_TRACING", "sampled")
+    monkeypatch.setenv("RECIPES_TRACE_SAMPLE_RATE", "0.5")
+    monkeypatch.setenv("RECIPES_TRACE_FILE", str(path))
+    tracer = configure_tracing()
+    try:
+        assert tracer is not None and tracer.sample_rate == 0.5
+        tracer._random.seed(0)
+        for i in range(20):
+            asyncio.run(double(i))
+        tracer.flush()
+    finally:
+        configure_tracing("off")
+    spans = [json.loads(line) for line in path.read_text().splitlines()]
+    assert 0 < len(spans) < 20
+    assert tracer.stats.sampled_out == 20 - len(spans)
+    assert not tracing._langsmith